@@ -1,30 +1,67 @@
 # Simplified Modifications for app.py - Only for reverse_move and build_reverse_command functions
 
-# 1. Update build_reverse_command function to accept selected_surface parameter
+# 0. Imports and helpers used below, in addition to the ones app.py already has
+import multiprocessing
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from gcode_index import copy_range, load_index, rewrite_indexed
+
+GCODE_IO_BUFFER = 1024 * 1024
+
+# G92 zero set after a tool change, per build surface: X, Y, and the Z offset added to the layer Z
+SURFACE_RESETS = {
+    "Petri dish": (-4.9, -8.5, 18.4),
+    "Well plate": (-4.9, -8.5, 18.4),
+}
+# The Extruder 2→3 leg of a chain move zeroes at a different point
+CHAIN_SURFACE_RESETS = {
+    "Petri dish": (-8, -12.3, 18.4),
+    "Well plate": (-8, -12.3, 18.4),
+}
+
+def surface_reset(selected_surface, resets=SURFACE_RESETS):
+    """Reset coordinates for selected_surface; other surfaces use the Petri dish ones"""
+    return resets.get(selected_surface, resets["Petri dish"])
+
+class CommandTemplate:
     """
-    Build the standard extruder change command block for a forward (adjacent) move.
-    Moves from `from_extruder` to `to_extruder` using the confirmed calibration data.
+    A G-code command block whose only parameter is the layer Z.
+    Each line is a string, or a function of z_position for the lines that
+    depend on it. Runs of fixed lines are joined up front, so render() is a
+    single join.
     """
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.parts = []
+        for line in self.lines:
+            if isinstance(line, str) and self.parts and isinstance(self.parts[-1], str):
+                self.parts[-1] += line
+            else:
+                self.parts.append(line)
+
+    def __add__(self, other):
+        return CommandTemplate(self.lines + other.lines)
+
+    def render_lines(self, z_position):
+        return [line if isinstance(line, str) else line(z_position) for line in self.lines]
+
+    def render(self, z_position):
+        return ''.join([part if isinstance(part, str) else part(z_position) for part in self.parts])
+
+# 1. Update build_reverse_command function to accept selected_surface parameter
+def forward_command_template(to_extruder, extruder_positions, extruder_positions_y, extruder_positions_z):
     # Get target calibration values for the 'to_extruder'
     position = extruder_positions.get(to_extruder, 0)
     positiony = extruder_positions_y.get(to_extruder, 0)
     positionz = extruder_positions_z.get(to_extruder, 0)
-    
-    # Determine the printhead name from extruder number for preset lookup.
-    extruder_to_printhead = {0: "Printhead 1", 1: "Printhead 2", 2: "Printhead 3"}
-    target_printhead = extruder_to_printhead.get(to_extruder, "Printhead 1")
-    preset = printhead_presets.get(target_printhead, {})
-    temp = preset.get("temperature", 28)
-    extrate = preset.get("extrusionRate", 100)
-    nozzle = preset.get("nozzleDiameter", 0.4)
-    
-    # Set coordinates based on selected surface
-    if selected_surface == "Well plate":
-        reset_x, reset_y, reset_z_offset = -4.9, -8.5, 18.4
-    else:  # Default for Petri dish and other surfaces
-        reset_x, reset_y, reset_z_offset = -4.9, -8.5, 18.4
-    
-    commands = [
+
+    return CommandTemplate([
         'G91 ; Set to relative positioning\n',
         'G1 E-70 F6000 ; Retract 2mm of filament\n',
         'G1 Z20 F300 ; Lift Z by 20mm\n',
@@ -38,102 +75,98 @@
         f'G1 X{position} Y{positiony} F6000 ; Move to confirmed position for extruder {to_extruder}\n',
         'G91 ; Set to relative positioning\n',
         f'G1 Z{positionz} F6000 ; Move to confirmed Z position for extruder {to_extruder}\n',
-        f'G92 X0 Y0 Z{20 + z_position} ; Reset position\n',
+        lambda z_position: f'G92 X0 Y0 Z{20 + z_position} ; Reset position\n',
         'G90\n',
         'G1 X38 Y25 F6000\n',
         'G92 E0 ; Reset extruder position\n',
         'M82\n',
         'G1 F6000\n',
         'G90\n'
-    ]
-    return commands
+    ])
 
-# 2. Update build_chain_move function
-def build_chain_move(from_extruder, to_extruder, extruder_positions, extruder_positions_y, extruder_positions_z, z_position, selected_surface="Petri dish"):
+def build_forward_command(from_extruder, to_extruder, extruder_positions, extruder_positions_y, extruder_positions_z, z_position, printhead_presets, selected_surface="Petri dish"):
     """
-    Build a chain-move block for a forward move between adjacent extruders.
-    
-    For moves from Extruder 1→2 (internal 0→1):
-        - Uses:
-            G91
-            G1 Z+30 F1500
-            G1 X[calib2] F6000   ; where [calib2] is the saved X-coordinate for Extruder 2
-            G1 Z-25 F1500
-            G90
-
-    For moves from Extruder 2→3 (internal 1→2):
-        - Uses:
-            G91
-            G1 Z30 F1500
-            G1 X[calib3] F6000   ; where [calib3] is the saved X-coordinate for Extruder 3
-            G1 Z-25 F1500
-            G90
+    Build the standard extruder change command block for a forward (adjacent) move.
+    Moves from `from_extruder` to `to_extruder` using the confirmed calibration data.
     """
+    return forward_command_template(
+        to_extruder, extruder_positions, extruder_positions_y, extruder_positions_z
+    ).render_lines(z_position)
 
+# 2. Update build_chain_move function
+def chain_move_template(from_extruder, to_extruder, extruder_positions, extruder_positions_y, extruder_positions_z, selected_surface="Petri dish"):
     position = extruder_positions.get(0, 0)
     positiony = extruder_positions_y.get(0, 0)
     positionz = extruder_positions_z.get(0, 0)
-    
-    # Set coordinates based on selected surface
-    if selected_surface == "Well plate":
-        reset_x, reset_y, reset_z_offset = -8, -12.3, 18.4
-    else:  # Default for Petri dish and other surfaces
-        reset_x, reset_y, reset_z_offset = -8, -12.3, 18.4
-    
+    reset_x, reset_y, reset_z_offset = surface_reset(selected_surface, CHAIN_SURFACE_RESETS)
+
     if from_extruder == 0 and to_extruder == 1:
-        return [
+        return CommandTemplate([
             "G28 Z; Home all axes to reset to absolute zero\n",
             "G28 X Y; Home all axes to reset to absolute zero\n",
             "G90 ; Set to absolute positioning\n",
             f"G1 X{position} Y{positiony} F6000 ; Move to Calibrated  position for Extruder 0\n",
-            f"G1 Z{positionz+z_position} F6000 ; Move to Calibrated Z position for Extruder 0\n",        
+            lambda z_position: f"G1 Z{positionz+z_position} F6000 ; Move to Calibrated Z position for Extruder 0\n",
             "G91 ; Set to relative positioning\n",
             "G1 Z+20 F1500 ; Move Z up by 30mm\n",
             f"G1 X{extruder_positions.get(1, -119.1)} Y{extruder_positions_y.get(1, 0)} F6000 ; Move to confirmed position for Extruder 1\n",
             f"G1 Z{extruder_positions_z.get(1, 0)} F6000 ; Move to confirmed Z position for Extruder 1\n"
-        ]
-            
+        ])
+
     elif from_extruder == 1 and to_extruder == 2:
-        return [
+        return CommandTemplate([
             "G91 ; Set to relative positioning\n",
             "T2\n",
             'M83 ; Set to relative positioning\n',
             'G1 E-70 F6000 ; Retract 2mm of filament\n',
-            'M82 ; Set to absolute positioning\n',            
+            'M82 ; Set to absolute positioning\n',
             f"G1 X{extruder_positions.get(2, -119.1)} Y{extruder_positions_y.get(2, 0)} F6000 ; Move to confirmed position for Extruder 2\n",
             f"G1 Z{extruder_positions_z.get(2, 0)} F6000 ; Move to confirmed Z position for Extruder 2\n",
-            f"G92 X{reset_x} Y{reset_y} Z{reset_z_offset + z_position} ; Resetting Zero\n",        
+            lambda z_position: f"G92 X{reset_x} Y{reset_y} Z{reset_z_offset + z_position} ; Resetting Zero\n",
             "G90 ; Return to absolute positioning\n",
             'G1 X38 Y25 F600\n'
-        ]
+        ])
     else:
-        return build_forward_command(from_extruder, to_extruder, extruder_positions, {}, {}, 0, {}, selected_surface)
+        # Other pairs fall back to a forward move at Z 0, without Y/Z calibration
+        return CommandTemplate(forward_command_template(to_extruder, extruder_positions, {}, {}).render_lines(0))
 
-# 3. Update build_reverse_command function
-def build_reverse_command(target_extruder, extruder_positions, extruder_positions_y, extruder_positions_z, z_position, selected_surface="Petri dish"):
+def build_chain_move(from_extruder, to_extruder, extruder_positions, extruder_positions_y, extruder_positions_z, z_position, selected_surface="Petri dish"):
     """
-    Build a reverse command block to return to Extruder 1's confirmed position.
-    This block:
-      - Homes all axes (G28),
-      - Resets the coordinate system (G92),
-      - Moves to the confirmed calibration coordinates for Extruder 1.
+    Build a chain-move block for a forward move between adjacent extruders.
+    
+    For moves from Extruder 1→2 (internal 0→1):
+        - Uses:
+            G91
+            G1 Z+30 F1500
+            G1 X[calib2] F6000   ; where [calib2] is the saved X-coordinate for Extruder 2
+            G1 Z-25 F1500
+            G90
+
+    For moves from Extruder 2→3 (internal 1→2):
+        - Uses:
+            G91
+            G1 Z30 F1500
+            G1 X[calib3] F6000   ; where [calib3] is the saved X-coordinate for Extruder 3
+            G1 Z-25 F1500
+            G90
     """
+    return chain_move_template(
+        from_extruder, to_extruder, extruder_positions, extruder_positions_y, extruder_positions_z, selected_surface
+    ).render_lines(z_position)
+
+# 3. Update build_reverse_command function
+def reverse_command_template(extruder_positions, extruder_positions_y, extruder_positions_z, selected_surface="Petri dish"):
     position = extruder_positions.get(0, 0)
     positiony = extruder_positions_y.get(0, 0)
     positionz = extruder_positions_z.get(0, 0)
-    
-    # Set coordinates based on selected surface
-    if selected_surface == "Well plate":
-        reset_x, reset_y, reset_z_offset = -4.9, -8.5, 18.4
-    else:  # Default for Petri dish and other surfaces
-        reset_x, reset_y, reset_z_offset = -4.9, -8.5, 18.4
-    
-    commands = [
+    reset_x, reset_y, reset_z_offset = surface_reset(selected_surface)
+
+    return CommandTemplate([
         "G28 Z; Home all axes to reset to absolute zero\n",
         "G28 X Y; Home all axes to reset to absolute zero\n",
         "G90 ; Set to absolute positioning\n",
         f"G1 X{position} Y{positiony} F6000 ; Move to Calibrated  position for Extruder 0\n",
-        f"G1 Z{positionz+z_position} F6000 ; Move to Calibrated Z position for Extruder 0\n",
+        lambda z_position: f"G1 Z{positionz+z_position} F6000 ; Move to Calibrated Z position for Extruder 0\n",
         "G91 ; Set to relative positioning\n",
         "G1 Z20 F300 ; Lift Z by 20mm\n",
         "G92 E0 ; Reset extruder position\n",
@@ -142,41 +175,33 @@ def build_reverse_command(target_extruder, extruder_positions, extruder_position
         'G1 E-70 F6000 ; Retract 2mm of filament\n',
         'M82 ; Set to absolute positioning\n',
         "G91 ; Set to absolute positioning\n",
-        f"G92 X{reset_x} Y{reset_y} Z{reset_z_offset + z_position} ; Resetting Zero\n",        
+        lambda z_position: f"G92 X{reset_x} Y{reset_y} Z{reset_z_offset + z_position} ; Resetting Zero\n",
         "G90 ; Set to absolute positioning\n",
-        "G1 X38 Y25 F600\n"       
-    ]
-    return commands
+        "G1 X38 Y25 F600\n"
+    ])
 
-# 4. Update reverse_move_from_3_to_2_modified function
-def reverse_move_from_3_to_2_modified(extruder1_coords, extruder2_offset, extruder_positions, extruder_positions_y, extruder_positions_z, z_position, selected_surface="Petri dish"):
+def build_reverse_command(target_extruder, extruder_positions, extruder_positions_y, extruder_positions_z, z_position, selected_surface="Petri dish"):
     """
-    Build a command block for the reverse edge move from Extruder 3 to 2.
-    This block performs the following:
-      1. Homes all axes and moves to the confirmed position for Extruder 1.
-      2. Then moves (using a relative command) from Extruder 1 using the Extruder 2 offset.
-    
-    Parameters:
-      extruder1_coords: a list containing Extruder 1's confirmed coordinates,
-                        e.g. [<EXTRUDER1_X>, <EXTRUDER1_Y>, <EXTRUDER1_Z>, ...].
-      extruder2_offset: the X offset for Extruder 2 (e.g., -119.1).
-      reset_z: the Z value to use in the reset command (e.g., 20.9).
-    
-    Returns:
-      A list of G-code command strings.
+    Build a reverse command block to return to Extruder 1's confirmed position.
+    This block:
+      - Homes all axes (G28),
+      - Resets the coordinate system (G92),
+      - Moves to the confirmed calibration coordinates for Extruder 1.
     """
-    # Set coordinates based on selected surface
-    if selected_surface == "Well plate":
-        reset_x, reset_y, reset_z_offset = -4.9, -8.5, 18.4
-    else:  # Default for Petri dish and other surfaces
-        reset_x, reset_y, reset_z_offset = -4.9, -8.5, 18.4
-    
-    commands = [
+    return reverse_command_template(
+        extruder_positions, extruder_positions_y, extruder_positions_z, selected_surface
+    ).render_lines(z_position)
+
+# 4. Update reverse_move_from_3_to_2_modified function
+def reverse_move_from_3_to_2_template(extruder1_coords, extruder_positions, extruder_positions_y, extruder_positions_z, selected_surface="Petri dish"):
+    reset_x, reset_y, reset_z_offset = surface_reset(selected_surface)
+
+    return CommandTemplate([
         "G28 Z; Home all axes to reset to absolute zero\n",
         "G28 X Y; Home all axes to reset to absolute zero\n",
         "G90 ; Set to absolute positioning\n",
         f"G1 X{extruder1_coords[0]} Y{extruder1_coords[1]} F6000 ; Move to Calibrated position for Extruder 0\n",
-        f"G1 Z{extruder1_coords[2]+ z_position} F6000 ; Move to Calibrated Z position for Extruder 0\n",
+        lambda z_position: f"G1 Z{extruder1_coords[2]+ z_position} F6000 ; Move to Calibrated Z position for Extruder 0\n",
         "G91 ; Set to relative positioning\n",
         "G1 Z20 F300 ; Lift Z by 20mm\n",
         "G92 E0 ; Reset extruder position\n",
@@ -187,35 +212,171 @@ def reverse_move_from_3_to_2_modified(extruder1_coords, extruder2_offset, extrud
         "G91 ; Set to absolute positioning\n",
         f"G1 X{extruder_positions.get(1, -119.1)} Y{extruder_positions_y.get(1, 0)} F6000 ; Move to confirmed position for Extruder 1\n",
         f"G1 Z{extruder_positions_z.get(1, 0)} F6000 ; Move to confirmed Z position for Extruder 1\n",
-        f"G92 X{reset_x} Y{reset_y} Z{reset_z_offset + z_position} ; Resetting Zero\n",        
+        lambda z_position: f"G92 X{reset_x} Y{reset_y} Z{reset_z_offset + z_position} ; Resetting Zero\n",
         "G90 ; Set to absolute positioning\n",
         "G1 X38 Y25 F600\n"
-    ]
-    return commands
+    ])
+
+def reverse_move_from_3_to_2_modified(extruder1_coords, extruder2_offset, extruder_positions, extruder_positions_y, extruder_positions_z, z_position, selected_surface="Petri dish"):
+    """
+    Build a command block for the reverse edge move from Extruder 3 to 2.
+    This block performs the following:
+      1. Homes all axes and moves to the confirmed position for Extruder 1.
+      2. Then moves (using a relative command) from Extruder 1 using the Extruder 2 offset.
+    
+    Parameters:
+      extruder1_coords: a list containing Extruder 1's confirmed coordinates,
+                        e.g. [<EXTRUDER1_X>, <EXTRUDER1_Y>, <EXTRUDER1_Z>, ...].
+      extruder2_offset: the X offset for Extruder 2 (e.g., -119.1).
+      reset_z: the Z value to use in the reset command (e.g., 20.9).
+    
+    Returns:
+      A list of G-code command strings.
+    """
+    return reverse_move_from_3_to_2_template(
+        extruder1_coords, extruder_positions, extruder_positions_y, extruder_positions_z, selected_surface
+    ).render_lines(z_position)
 
 # 5. Update insert_extruder_changes function - key changes in the function calls
-def insert_extruder_changes(gcode_file_path, layer_groups, printhead_presets, layer_height, build_plate, infill_percentage):
-    try:
-        with open(gcode_file_path, 'r') as file:
-            gcode_lines = file.readlines()
+class InvalidProtocol(Exception):
+    """The protocol's presets or layer groups cannot be turned into G-code"""
 
-        new_gcode_lines = []
-        current_layer = -1      # Start with -1 so that the first layer change sets it to 0
-        group_index = 0
-        in_group = False
-        previous_printhead = None
-        current_extruder = 0    # Start with Extruder 1
+class ProtocolModel:
+    """
+    A protocol's printhead presets and layer groups, validated once per save.
+    ink_index maps each loaded ink name to (printhead, extruder, preset), and
+    layer_groups holds the groups sorted by layer. Duplicate inks, inks no
+    printhead is loaded with, and overlapping groups are rejected here, before
+    any file is touched.
+    """
 
-        # Delay mechanism for inserting pending commands
-        lines_to_wait = 0
+    PRINTHEAD_EXTRUDERS = {
+        'Printhead 1': 0,
+        'Printhead 2': 1,
+        'Printhead 3': 2,
+    }
+
+    def __init__(self, layer_groups, printhead_presets):
+        self.printhead_presets = printhead_presets
+        self.ink_index = {}
+        for printhead, preset in printhead_presets.items():
+            # Empty slots are filled in with an inkName of None
+            if not preset or not preset.get("inkName"):
+                continue
+            ink_name = preset["inkName"]
+            if printhead not in self.PRINTHEAD_EXTRUDERS:
+                raise InvalidProtocol(f"Unknown printhead '{printhead}' for ink '{ink_name}'")
+            if ink_name in self.ink_index:
+                raise InvalidProtocol(
+                    f"Ink '{ink_name}' is loaded in both {self.ink_index[ink_name][0]} and {printhead}"
+                )
+            self.ink_index[ink_name] = (printhead, self.PRINTHEAD_EXTRUDERS[printhead], preset)
+
+        groups = []
+        for group in layer_groups:
+            start, end, ink_name = group.get("start"), group.get("end"), group.get("inkName")
+            if not all(isinstance(layer, int) and not isinstance(layer, bool) for layer in (start, end)) or \
+                    not 0 <= start <= end:
+                raise InvalidProtocol(f"Layer group {group} needs whole layer numbers with 0 <= start <= end")
+            if ink_name not in self.ink_index:
+                raise InvalidProtocol(f"Layer group {start}-{end} uses ink '{ink_name}', which no printhead is loaded with")
+            groups.append({"start": start, "end": end, "inkName": ink_name})
+        groups.sort(key=lambda group: group["start"])
+        for previous, group in zip(groups, groups[1:]):
+            if group["start"] <= previous["end"]:
+                raise InvalidProtocol(
+                    f"Layer groups {previous['start']}-{previous['end']} and {group['start']}-{group['end']} overlap"
+                )
+        self.layer_groups = groups
+
+class ToolChangePlanner:
+    """
+    Every extruder change block a protocol can need, built once per protocol.
+    Calibration and surface do not change within a protocol, so the block for
+    each (from, to) extruder pair is compiled up front with the layer Z as its
+    only parameter.
+    """
 
-        # Mapping of printheads to extruder indices
-        printhead_to_extruder = {
-            'Printhead 1': 0,
-            'Printhead 2': 1,
-            'Printhead 3': 2,
+    EXTRUDER_COUNT = 3
+
+    def __init__(self, extruder_positions, extruder_positions_y, extruder_positions_z, selected_surface, petri_dish):
+        self.positions = (extruder_positions, extruder_positions_y, extruder_positions_z)
+        self.selected_surface = selected_surface
+        # On a Petri dish the nozzle is lowered back to the layer after the change
+        self.petri_dish = petri_dish
+        self.transitions = {
+            (from_extruder, to_extruder): self._compile(from_extruder, to_extruder)
+            for from_extruder in range(self.EXTRUDER_COUNT)
+            for to_extruder in range(self.EXTRUDER_COUNT)
         }
 
+    def _compile(self, current_extruder, extruder_number):
+        positions = self.positions
+        selected_surface = self.selected_surface
+        # Case 1: Default forward move (adjacent move: e.g., 1→2 or 2→3)
+        if current_extruder < extruder_number:
+            if extruder_number - current_extruder == 1:
+                template = forward_command_template(extruder_number, *positions)
+            else:
+                template = CommandTemplate([])
+                for step in range(current_extruder, extruder_number):
+                    template += chain_move_template(step, step + 1, *positions, selected_surface)
+        # Reverse moves (Cases 2 & 3: e.g., 2→1 or 3→2)
+        elif extruder_number == 0:
+            # Case 2: Moving directly to Extruder 1.
+            template = reverse_command_template(*positions, selected_surface)
+        elif extruder_number == 1:
+            # Case 3: Reverse edge move from Extruder 3 to 2, via Extruder 1's calibrated position
+            extruder1_coords = [axis_positions[0] for axis_positions in positions]
+            template = reverse_move_from_3_to_2_template(extruder1_coords, *positions, selected_surface)
+        else:
+            # Fallback for other reverse moves.
+            template = reverse_command_template(*positions, selected_surface)
+            for step in range(0, extruder_number):
+                template += forward_command_template(step + 1, *positions)
+
+        if self.petri_dish:
+            template += CommandTemplate([lambda z_position: f'G1 Z{z_position:.2f} F600\n'])
+        return template
+
+    def render(self, from_extruder, to_extruder, z_position):
+        """The extruder change block from from_extruder to to_extruder at layer Z z_position, as one string"""
+        return self.transitions[from_extruder, to_extruder].render(z_position)
+
+class ExtruderChangeRewriter:
+    """
+    The line-by-line state machine behind insert_extruder_changes.
+    feed() takes one G-code line and returns the lines to write in its place.
+    A line that is neither a ;LAYER_CHANGE nor a `G1 Z... F6000` move comes back
+    unchanged unless needs_line() is True, so an indexed rewrite only has to feed
+    those lines and can copy the rest of the file in bulk.
+    """
+
+    # What snapshot()/restore() carry; z_position follows from current_layer
+    STATE_FIELDS = (
+        'current_layer', 'group_index', 'in_group', 'previous_printhead', 'current_extruder',
+        'lines_to_wait', 'pending_extruder_commands', 'insert_after_z_move',
+    )
+
+    def __init__(self, protocol, layer_height, build_plate, infill_percentage):
+        self.protocol = protocol
+        self.layer_groups = protocol.layer_groups
+        self.layer_height = layer_height
+        self.build_plate = build_plate
+        self.infill_percentage = infill_percentage
+
+        self.current_layer = -1      # Start with -1 so that the first layer change sets it to 0
+        self.z_position = None
+        self.group_index = 0
+        self.in_group = False
+        self.previous_printhead = None
+        self.current_extruder = 0    # Start with Extruder 1
+
+        # Delay mechanism for inserting pending commands
+        self.lines_to_wait = 0
+        self.pending_extruder_commands = None
+        self.insert_after_z_move = False
+
         # Fetch calibration positions from the calibration page.
         extruder_1_coords = reference_coordinates.get("extruder_1")
         extruder_2_coords = reference_coordinates.get("extruder_2")
@@ -237,140 +398,317 @@ def insert_extruder_changes(gcode_file_path, layer_groups, printhead_presets, la
             2: extruder_3_coords[2] if extruder_3_coords else 0,
         }
 
-        pending_extruder_commands = None
-        insert_after_z_move = False
-        
         # Get selected surface from build_plate
-        selected_surface = build_plate.get('selectedSurface', 'Petri dish')
-
-        for line_number, line in enumerate(gcode_lines):
-            stripped_line = line.strip()
-            logging.debug(f"Processing line {line_number}: {stripped_line}")
-
-            # (1) Delay insertion if scheduled.
-            if lines_to_wait > 0:
-                lines_to_wait -= 1
-                new_gcode_lines.append(line)
-                if lines_to_wait == 0 and pending_extruder_commands:
-                    logging.debug("Inserting pending extruder commands after delay.")
-                    new_gcode_lines.extend(pending_extruder_commands)
-                    pending_extruder_commands = None
-                continue
-
-            # (2) Check for trigger line (G1 Z... F6000) to insert pending commands.
-            if insert_after_z_move and stripped_line.startswith('G1 Z') and 'F6000' in stripped_line:
-                if infill_percentage == 0 and pending_extruder_commands:
-                    logging.debug("Inserting pending extruder commands immediately because infill_percentage is 0.")
-                    new_gcode_lines.extend(pending_extruder_commands)
-                    pending_extruder_commands = None
-                new_gcode_lines.append(line)
-                if infill_percentage != 0:
-                    lines_to_wait = 1
-                insert_after_z_move = False
-                logging.debug(f"Scheduled extruder change insertion after line {line_number}")
-                continue
+        self.planner = ToolChangePlanner(
+            extruder_positions, extruder_positions_y, extruder_positions_z,
+            build_plate.get('selectedSurface', 'Petri dish'),
+            bool(build_plate) and build_plate.get('selectedSurface') == 'Petri dish',
+        )
+
+    def needs_line(self):
+        """True if the next line must go through feed() whatever it contains"""
+        if self.lines_to_wait > 0:
+            return True
+        if self.group_index < len(self.layer_groups):
+            group = self.layer_groups[self.group_index]
+            return (self.current_layer == group['start'] and not self.in_group) or \
+                self.current_layer == group['end'] + 1
+        return False
+
+    def feed(self, line):
+        stripped_line = line.strip()
+
+        # (1) Delay insertion if scheduled.
+        if self.lines_to_wait > 0:
+            self.lines_to_wait -= 1
+            out = [line]
+            if self.lines_to_wait == 0 and self.pending_extruder_commands:
+                logging.debug("Inserting pending extruder commands after delay.")
+                out.extend(self.pending_extruder_commands)
+                self.pending_extruder_commands = None
+            return out
+
+        # (2) Check for trigger line (G1 Z... F6000) to insert pending commands.
+        if self.insert_after_z_move and stripped_line.startswith('G1 Z') and 'F6000' in stripped_line:
+            out = []
+            if self.infill_percentage == 0 and self.pending_extruder_commands:
+                logging.debug("Inserting pending extruder commands immediately because infill_percentage is 0.")
+                out.extend(self.pending_extruder_commands)
+                self.pending_extruder_commands = None
+            out.append(line)
+            if self.infill_percentage != 0:
+                self.lines_to_wait = 1
+            self.insert_after_z_move = False
+            logging.debug(f"Scheduled extruder change insertion after '{stripped_line}'")
+            return out
+
+        # (3) Detect layer changes.
+        if ';LAYER_CHANGE' in stripped_line:
+            self.current_layer += 1
+            # For simplicity, use the same Z calculation for all surfaces.
+            self.z_position = (self.current_layer + 1) * self.layer_height
+            logging.debug(f"Layer {self.current_layer} Z position: {self.z_position:.2f} mm")
+
+        # (4) Group logic (old, working method: assume inkName is a plain string).
+        out = []
+        if self.group_index < len(self.layer_groups):
+            group = self.layer_groups[self.group_index]
+            if self.current_layer == group['start'] and not self.in_group:
+                self.in_group = True
+                out.extend(self._start_group(group["inkName"]))
+
+            if self.current_layer == group['end'] + 1:
+                out.append(f';GROUP_END INK={group["inkName"]}\n')
+                self.group_index += 1
+                self.in_group = False
+
+        out.append(line)
+        return out
+
+    def _start_group(self, ink_name):
+        logging.debug(f"Starting new group '{ink_name}' at layer {self.current_layer}")
+        printhead, extruder_number, preset = self.protocol.ink_index[ink_name]
+        out = [
+            f';GROUP_START INK={ink_name} TEMP={preset.get("temperature",28)} '
+            f'EXTRATE={preset.get("extrusionRate",100)} '
+            f'NOZZLE={preset.get("nozzleDiameter",0.412)}\n'
+        ]
 
-            # (3) Detect layer changes.
-            if ';LAYER_CHANGE' in stripped_line:
-                current_layer += 1
-                logging.debug(f"Layer change detected. Current layer: {current_layer}")
-                # For simplicity, use the same Z calculation for all surfaces.
-                z_position = (current_layer + 1) * layer_height
-                logging.debug(f"Layer {current_layer} Z position: {z_position:.2f} mm")
-
-            # (4) Group logic (old, working method: assume inkName is a plain string).
-            if group_index < len(layer_groups):
-                group = layer_groups[group_index]
-                if current_layer == group['start'] and not in_group:
-                    # Here we assume group["inkName"] is a plain string.
-                    ink_name = group["inkName"]
-                    logging.debug(f"Starting new group '{ink_name}' at layer {current_layer}")
-                    in_group = True
-                    # Instead of looking up directly using ink_name as key,
-                    # iterate over presets to find the one whose inkName matches.
-                    preset_for_ink = next((p for p in printhead_presets.values() if p.get("inkName") == ink_name), {})
-                    new_gcode_lines.append(
-                        f';GROUP_START INK={ink_name} TEMP={preset_for_ink.get("temperature",28)} '
-                        f'EXTRATE={preset_for_ink.get("extrusionRate",100)} '
-                        f'NOZZLE={preset_for_ink.get("nozzleDiameter",0.412)}\n'
-                    )
+        # If the printhead changed between groups, schedule extruder change commands.
+        if self.previous_printhead and self.previous_printhead != printhead:
+            logging.debug(f"Extruder change: previous {self.current_extruder}, new {extruder_number}")
+            # The whole block as one string, rendered from the planner's precompiled table
+            self.pending_extruder_commands = [
+                self.planner.render(self.current_extruder, extruder_number, self.z_position)
+            ]
+            self.insert_after_z_move = True
+            self.current_extruder = extruder_number
+
+        self.previous_printhead = printhead
+        return out
+
+    def finish(self):
+        """Lines still owed at end of file"""
+        if self.pending_extruder_commands and self.insert_after_z_move:
+            return list(self.pending_extruder_commands)
+        return []
+
+    def snapshot(self):
+        """The mutable state, as JSON-able data, for checkpoints"""
+        return {field: getattr(self, field) for field in self.STATE_FIELDS}
+
+    def restore(self, state):
+        for field in self.STATE_FIELDS:
+            setattr(self, field, state[field])
+        if self.current_layer >= 0:
+            self.z_position = (self.current_layer + 1) * self.layer_height
+
+class GcodeAlreadyProcessed(Exception):
+    """The G-code already contains extruder changes and there is no pristine copy to redo them from"""
+
+def pristine_path_for(gcode_file_path):
+    return f"{gcode_file_path}.pristine"
+
+def derived_state_path_for(gcode_file_path):
+    return f"{gcode_file_path}.derived.json"
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def load_derived_state(gcode_file_path):
+    try:
+        with open(derived_state_path_for(gcode_file_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-                    # Determine the printhead from presets using the plain ink_name.
-                    printhead = next(
-                        (ph for ph, preset in printhead_presets.items() if preset and preset.get("inkName") == ink_name),
-                        None
+def pristine_source(gcode_file_path, state):
+    """
+    Path of the unmodified sliced G-code behind gcode_file_path.
+    If the file is still the output we last wrote, its pristine copy is the
+    source. A file without group markers is a fresh slice and is copied to
+    become the new pristine copy. It is not hard-linked, so a slicer writing
+    over gcode_file_path in place can never alter the pristine copy.
+    """
+    pristine = pristine_path_for(gcode_file_path)
+    ours = state is not None and state.get("output") == file_stamp(gcode_file_path)
+    if ours and os.path.exists(pristine):
+        return pristine
+
+    if load_index(gcode_file_path)["group_markers"]:
+        if os.path.exists(pristine):
+            return pristine
+        raise GcodeAlreadyProcessed(
+            f"{gcode_file_path} already contains extruder changes and has no pristine copy; re-slice it"
+        )
+
+    tmp_path = f"{pristine}.{uuid.uuid4().hex}.tmp"
+    try:
+        shutil.copy2(gcode_file_path, tmp_path)
+        os.replace(tmp_path, pristine)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return pristine
+
+def rewrite_settings(printhead_presets, layer_height, build_plate, infill_percentage):
+    """Everything besides layer_groups that the output depends on, as JSON-able data"""
+    return json.loads(json.dumps({
+        "printhead_presets": printhead_presets,
+        "layer_height": float(layer_height),
+        "build_plate": build_plate,
+        "infill_percentage": infill_percentage,
+        "reference_coordinates": reference_coordinates,
+    }))
+
+def prefix_unchanged(state, old_groups, new_groups):
+    """
+    True if output written before a checkpoint with `state` is the same for
+    new_groups as it was for old_groups: the groups already handled are equal
+    and neither the start nor the end of the next one would have fired earlier.
+    """
+    group_index = state["group_index"]
+    if old_groups[:group_index] != new_groups[:group_index]:
+        return False
+    layer = state["current_layer"]
+    if state["in_group"]:
+        if group_index >= len(new_groups):
+            return False
+        old_group, new_group = old_groups[group_index], new_groups[group_index]
+        return (old_group["start"], old_group["inkName"]) == (new_group["start"], new_group["inkName"]) and \
+            new_group["end"] + 1 > layer
+    if group_index >= len(new_groups):
+        return True
+    # The end check fires even for a group that never started
+    return new_groups[group_index]["start"] > layer and new_groups[group_index]["end"] + 1 > layer
+
+def rewrite_incrementally(source, index, gcode_file_path, dst, rewriter, layer_groups, previous):
+    """
+    Write the output for `source` to dst, reusing `previous` output where possible.
+    Returns the new checkpoints: [input offset, output offset, rewriter state]
+    at every layer change.
+
+    Output is copied from the previous file up to the last checkpoint the
+    edited groups cannot have affected. From there the rewriter runs until its
+    state matches the previous run's at the same layer with the same groups
+    still to come, after which the previous output is spliced in again.
+    """
+    old_checkpoints = {}
+    checkpoints = []
+    start = 0
+    if previous:
+        old_groups = previous["layer_groups"]
+        old_checkpoints = {checkpoint[0]: checkpoint for checkpoint in previous["checkpoints"]}
+        resume = next(
+            (checkpoint for checkpoint in reversed(previous["checkpoints"])
+             if prefix_unchanged(checkpoint[2], old_groups, layer_groups)),
+            None
+        )
+        if resume:
+            start, output_offset, state = resume
+            with open(gcode_file_path, 'rb') as old_output:
+                copy_range(old_output, dst, 0, output_offset)
+            rewriter.restore(state)
+            checkpoints = [checkpoint for checkpoint in previous["checkpoints"] if checkpoint[0] < start]
+
+    def on_layer(input_offset, output_offset):
+        state = rewriter.snapshot()
+        old = old_checkpoints.get(input_offset)
+        group_index = state["group_index"]
+        if old and old[2] == state and previous["layer_groups"][group_index:] == layer_groups[group_index:]:
+            return True
+        checkpoints.append([input_offset, output_offset, state])
+        return False
+
+    stopped_at = rewrite_indexed(source, dst, index, rewriter, start=start, on_layer=on_layer)
+    if stopped_at is not None:
+        old_offset = old_checkpoints[stopped_at][1]
+        shift = dst.tell() - old_offset
+        with open(gcode_file_path, 'rb') as old_output:
+            copy_range(old_output, dst, old_offset, os.path.getsize(gcode_file_path))
+        checkpoints.extend(
+            [input_offset, output_offset + shift, state]
+            for input_offset, output_offset, state in previous["checkpoints"] if input_offset >= stopped_at
+        )
+        logging.debug(f"Reused previous output from input offset {start} and after {stopped_at}")
+    return checkpoints
+
+def extruder_change_lines(gcode_lines, layer_groups, printhead_presets, layer_height, build_plate, infill_percentage):
+    """
+    Yield the G-code with group markers and extruder change blocks inserted.
+    `gcode_lines` is consumed lazily (e.g. an open file), so memory use does not
+    grow with the file: only the pending extruder change block is held back.
+    """
+    rewriter = ExtruderChangeRewriter(
+        ProtocolModel(layer_groups, printhead_presets), layer_height, build_plate, infill_percentage
+    )
+    for line in gcode_lines:
+        yield from rewriter.feed(line)
+    yield from rewriter.finish()
+
+def insert_extruder_changes(gcode_file_path, layer_groups, printhead_presets, layer_height, build_plate, infill_percentage, protocol=None):
+    """
+    Regenerate gcode_file_path from its pristine sliced copy with the groups'
+    markers and extruder changes. Saving the same protocol again is a no-op,
+    and an edit only regenerates the layers it can affect.
+    `protocol` is the ProtocolModel for layer_groups and printhead_presets,
+    if the caller has already built it.
+    """
+    try:
+        if protocol is None:
+            protocol = ProtocolModel(layer_groups, printhead_presets)
+        state = load_derived_state(gcode_file_path)
+        source = pristine_source(gcode_file_path, state)
+        settings = rewrite_settings(printhead_presets, layer_height, build_plate, infill_percentage)
+        layer_groups = protocol.layer_groups
+        index = load_index(source)
+
+        previous = None
+        if state and state.get("output") == file_stamp(gcode_file_path) and \
+                state.get("pristine") == file_stamp(source) and state.get("settings") == settings:
+            previous = state
+            if state["layer_groups"] == layer_groups:
+                logging.debug(f"{gcode_file_path} is already up to date")
+                return
+
+        rewriter = ExtruderChangeRewriter(protocol, layer_height, build_plate, infill_percentage)
+
+        # Stream into a temp file next to the original and swap it in only once
+        # complete, so a failure midway leaves the original G-code untouched.
+        tmp_path = f"{gcode_file_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if index["has_cr"]:
+                # Text mode turns \r\n into \n; keep doing that line by line
+                with open(source, 'r', buffering=GCODE_IO_BUFFER) as src, \
+                        open(tmp_path, 'w', buffering=GCODE_IO_BUFFER) as dst:
+                    for line in src:
+                        dst.writelines(rewriter.feed(line))
+                    dst.writelines(rewriter.finish())
+                checkpoints = []
+            else:
+                # Only layer changes and G1 Z... F6000 lines are looked at;
+                # everything between them is copied as raw byte ranges.
+                with open(tmp_path, 'wb', buffering=GCODE_IO_BUFFER) as dst:
+                    checkpoints = rewrite_incrementally(
+                        source, index, gcode_file_path, dst, rewriter, layer_groups, previous
                     )
-                    if printhead:
-                        extruder_number = printhead_to_extruder[printhead]
-                    else:
-                        extruder_number = 0   # Default to Extruder 1 if not found
-
-                    # If the printhead changed between groups, schedule extruder change commands.
-                    if previous_printhead and previous_printhead != printhead:
-                        logging.debug(f"Extruder change: previous {current_extruder}, new {extruder_number}")
-                        commands = []
-                        # Case 1: Default forward move (adjacent move: e.g., 1→2 or 2→3)
-                        if current_extruder < extruder_number:
-                            if extruder_number - current_extruder == 1:
-                                commands = build_forward_command(
-                                    current_extruder, extruder_number,
-                                    extruder_positions, extruder_positions_y, extruder_positions_z,
-                                    z_position, printhead_presets, selected_surface
-                                )
-                            else:
-                                for step in range(current_extruder, extruder_number):
-                                    commands.extend(
-                                        build_chain_move(step, step + 1, extruder_positions,
-                                     extruder_positions_y, extruder_positions_z, z_position, selected_surface)
-                                    )
-                        else:  # Reverse moves (Cases 2 & 3: e.g., 2→1 or 3→2)
-                            if extruder_number == 0:
-                                # Case 2: Moving directly to Extruder 1.
-                                commands = build_reverse_command(0, extruder_positions, extruder_positions_y, extruder_positions_z,
-                                    z_position, selected_surface)
-                            elif extruder_number == 1:
-                            # Case 3: Reverse edge move from Extruder 3 to 2.
-                            # Here we use extruder1_coords (confirmed calibration for Extruder 1),
-                            # extruder2_offset (the X offset for Extruder 2),
-                            # and reset_z (the desired Z reset value).
-                                commands = reverse_move_from_3_to_2_modified(extruder_1_coords, extruder_positions.get(1, -119.1), extruder_positions, extruder_positions_y, extruder_positions_z, z_position, selected_surface)
-                            else:
-                            # Fallback for other reverse moves.
-                                commands = []
-                                commands.extend(
-                                    build_reverse_command(0, extruder_positions, extruder_positions_y, extruder_positions_z, z_position, selected_surface)
-                            )
-                                for step in range(0, extruder_number):
-                                    commands.extend(
-                                        build_forward_command(
-                                            step, step + 1,
-                                            extruder_positions, extruder_positions_y, extruder_positions_z,
-                                            z_position, printhead_presets, selected_surface
-                                    )
-                                )
-                        if build_plate and build_plate.get('selectedSurface') == 'Petri dish':
-                            commands.append(f'G1 Z{z_position:.2f} F600\n')
-                            logging.debug(f"Appending 'G1 Z{z_position:.2f} F600' for Petri dish")
-                        else:
-                            logging.debug("Not appending 'G1 Z... F600' because surface is not Petri dish")      
-                        pending_extruder_commands = commands
-                        insert_after_z_move = True
-                        current_extruder = extruder_number
-
-                    previous_printhead = printhead
-
-                if current_layer == group['end'] + 1:
-                    new_gcode_lines.append(f';GROUP_END INK={group["inkName"]}\n')
-                    group_index += 1
-                    in_group = False
-
-            new_gcode_lines.append(line)
-
-        if pending_extruder_commands and insert_after_z_move:
-            new_gcode_lines.extend(pending_extruder_commands)
-
-        with open(gcode_file_path, 'w') as file:
-            file.writelines(new_gcode_lines)
+            shutil.copymode(source, tmp_path)
+            os.replace(tmp_path, gcode_file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        state_path = derived_state_path_for(gcode_file_path)
+        with open(f"{state_path}.tmp", 'w') as f:
+            json.dump({
+                "pristine": file_stamp(source),
+                "output": file_stamp(gcode_file_path),
+                "settings": settings,
+                "layer_groups": layer_groups,
+                "checkpoints": checkpoints,
+            }, f)
+        os.replace(f"{state_path}.tmp", state_path)
 
         logging.debug(f"Extruder changes inserted successfully into {gcode_file_path}")
 
@@ -379,28 +717,31 @@ def insert_extruder_changes(gcode_file_path, layer_groups, printhead_presets, la
         raise
 
 # 6. Update save-protocol1 route to pass selected_surface
-@app.route('/save-protocol1', methods=['POST'])
-def save_protocol1():
-    try:
-        data = request.get_json()
-        protocol_name = data.get('protocol_name')
-        layer_groups = data.get('layerGroups')
-        gcode_file_path = data.get('gcode_file_path')
-        printhead_presets = data.get('printhead_presets')
-        slicing_settings = data.get('slicing_settings',{})  # Ensure slicing settings are fetched
-        surface_name = data.get('surface_name')
-        layer_height = slicing_settings.get('layerHeight', 0.7)
-        build_plate = slicing_settings.get('buildPlate', {})
-        infill_percentage = slicing_settings.get('infillPercentage', {})
-        
-        # Get selected surface - ADD THIS LINE
-        selected_surface = data.get('selected_surface', surface_name)  # Use surface_name as fallback
-
-        # If build_plate is empty, construct it using surface_name
-        if not build_plate:
-            build_plate = {'selectedSurface': surface_name}
-
-        # Set default values for missing printhead presets
+def save_protocol_data(data):
+    """
+    Check a save-protocol1 payload and write it to saved_protocols/<name>.json.
+    Returns the insert_extruder_changes arguments for it. Raises InvalidProtocol,
+    before anything is written, if a field is missing or the inks do not add up.
+    """
+    protocol_name = data.get('protocol_name')
+    layer_groups = data.get('layerGroups')
+    gcode_file_path = data.get('gcode_file_path')
+    printhead_presets = data.get('printhead_presets')
+    slicing_settings = data.get('slicing_settings',{})  # Ensure slicing settings are fetched
+    surface_name = data.get('surface_name')
+    layer_height = slicing_settings.get('layerHeight', 0.7)
+    build_plate = slicing_settings.get('buildPlate', {})
+    infill_percentage = slicing_settings.get('infillPercentage', {})
+    
+    # Get selected surface - ADD THIS LINE
+    selected_surface = data.get('selected_surface', surface_name)  # Use surface_name as fallback
+
+    # If build_plate is empty, construct it using surface_name
+    if not build_plate:
+        build_plate = {'selectedSurface': surface_name}
+
+    # Set default values for missing printhead presets (no presets at all is rejected below)
+    if isinstance(printhead_presets, dict):
         for i in range(1, 4):  # Assuming 3 printheads
             preset_key = f'Printhead {i}'
             if preset_key not in printhead_presets or printhead_presets[preset_key] is None:
@@ -411,52 +752,213 @@ def save_protocol1():
                     "inkName": None
                 }
 
-        current_extruder = 0
-        logging.debug(f"Received data for saving protocol: {json.dumps(data, indent=2)}")
-        logging.debug(f"Printhead presets received: {printhead_presets}")
-
-        if not protocol_name:
-            logging.error("Protocol name is missing")
-            return jsonify({"error": "Protocol name is required"}), 400
-        if not layer_groups:
-            logging.error("Layer groups are missing")
-            return jsonify({"error": "Layer groups are required"}), 400
-        if not gcode_file_path:
-            logging.error("G-code file path is missing")
-            return jsonify({"error": "G-code file path is required"}), 400
-        if not printhead_presets:
-            logging.error("Printhead presets are missing")
-            return jsonify({"error": "Printhead presets are required"}), 400
-
-        protocol_data = {
-            "protocol_name": protocol_name,
-            "layer_groups": layer_groups,
-            "gcode_file_path": gcode_file_path,
-            "printhead_presets": printhead_presets,
-            "slicing_settings": slicing_settings,  # Add slicing settings to the JSON
-            "surface_name": surface_name,
-            "selected_surface": selected_surface  # ADD THIS LINE
-        }
-
-        protocol_file_path = os.path.join('saved_protocols', f'{protocol_name}.json')
-        os.makedirs('saved_protocols', exist_ok=True)
+    logging.debug(f"Received data for saving protocol: {json.dumps(data, indent=2)}")
+    logging.debug(f"Printhead presets received: {printhead_presets}")
+
+    if not protocol_name:
+        logging.error("Protocol name is missing")
+        raise InvalidProtocol("Protocol name is required")
+    if not layer_groups:
+        logging.error("Layer groups are missing")
+        raise InvalidProtocol("Layer groups are required")
+    if not gcode_file_path:
+        logging.error("G-code file path is missing")
+        raise InvalidProtocol("G-code file path is required")
+    if not printhead_presets:
+        logging.error("Printhead presets are missing")
+        raise InvalidProtocol("Printhead presets are required")
+
+    # Reject duplicate or unknown inks before anything is written
+    protocol = ProtocolModel(layer_groups, printhead_presets)
+
+    protocol_data = {
+        "protocol_name": protocol_name,
+        "layer_groups": layer_groups,
+        "gcode_file_path": gcode_file_path,
+        "printhead_presets": printhead_presets,
+        "slicing_settings": slicing_settings,  # Add slicing settings to the JSON
+        "surface_name": surface_name,
+        "selected_surface": selected_surface  # ADD THIS LINE
+    }
+
+    protocol_file_path = os.path.join('saved_protocols', f'{protocol_name}.json')
+    os.makedirs('saved_protocols', exist_ok=True)
+
+    with open(protocol_file_path, 'w') as f:
+        json.dump(protocol_data, f)
+
+    logging.debug(f"Protocol saved to {protocol_file_path}")
+
+    return {
+        "gcode_file_path": gcode_file_path,
+        "layer_groups": layer_groups,
+        "printhead_presets": printhead_presets,
+        "layer_height": np.float64(layer_height),
+        "build_plate": build_plate,
+        "infill_percentage": infill_percentage,
+        "protocol": protocol,
+    }
 
-        with open(protocol_file_path, 'w') as f:
-            json.dump(protocol_data, f)
+@app.route('/save-protocol1', methods=['POST'])
+def save_protocol1():
+    try:
+        data = request.get_json()
+        rewrite = save_protocol_data(data)
 
-        logging.debug(f"Protocol saved to {protocol_file_path}")
-        
-        layer_height=np.float64(layer_height)
-        
         # Insert group markers into the G-code file
         #insert_group_markers(gcode_file_path, layer_groups, printhead_presets)
 
-        insert_extruder_changes(gcode_file_path, layer_groups, printhead_presets, layer_height, build_plate, infill_percentage)
+        insert_extruder_changes(**rewrite)
 
-        logging.debug(f"G-code file updated with markers and extruder changes: {gcode_file_path}")
+        logging.debug(f"G-code file updated with markers and extruder changes: {rewrite['gcode_file_path']}")
 
         return jsonify({"message": "Protocol saved and G-code updated successfully"}), 200
 
+    except InvalidProtocol as e:
+        logging.error(f"Invalid protocol: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except GcodeAlreadyProcessed as e:
+        logging.error(f"Error saving protocol: {str(e)}")
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         logging.error(f"Error saving protocol: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 7. Add save-protocol1-batch route: many protocols per request, G-code rewritten in a process pool
+PROTOCOL_WORKERS = int(os.getenv('PROTOCOL_WORKERS', '0')) or os.cpu_count() or 1
+
+_protocol_pool = None
+_protocol_pool_lock = threading.Lock()
+
+def protocol_pool():
+    """The process pool for batch G-code rewrites, started on first use"""
+    global _protocol_pool
+    with _protocol_pool_lock:
+        if _protocol_pool is None:
+            # Spawned, not forked: this runs inside a threaded request handler, and a
+            # fork taken while another thread holds a lock (logging, I/O) can leave
+            # the worker deadlocked on it. Spawned workers import app.py afresh, so
+            # its app.run() must stay under `if __name__ == '__main__'`; the
+            # calibration is passed with each task rather than inherited.
+            _protocol_pool = ProcessPoolExecutor(
+                max_workers=PROTOCOL_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _protocol_pool
+
+def discard_protocol_pool(pool):
+    """Drop a pool that lost a worker, so the next submission starts a fresh one"""
+    global _protocol_pool
+    with _protocol_pool_lock:
+        if _protocol_pool is pool:
+            _protocol_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def rewrite_protocol_gcode(rewrites, calibration):
+    """
+    Pool worker: run insert_extruder_changes for each rewrite in turn (they all
+    target one G-code file) and return a status, error and time for each.
+    A rewrite that fails does not stop the ones after it.
+    """
+    global reference_coordinates
+    # The worker may have been started before the calibration last changed
+    reference_coordinates = calibration
+
+    results = []
+    for rewrite in rewrites:
+        start = time.perf_counter()
+        try:
+            insert_extruder_changes(**rewrite)
+            status, error = "saved", None
+        except GcodeAlreadyProcessed as e:
+            status, error = "conflict", str(e)
+        except Exception as e:
+            status, error = "failed", str(e)
+        results.append({"status": status, "error": error, "seconds": round(time.perf_counter() - start, 3)})
+    return results
+
+def submit_rewrites(rewrites):
+    """Queue rewrite_protocol_gcode(rewrites) on the pool; returns (pool, future)"""
+    pool = protocol_pool()
+    try:
+        return pool, pool.submit(rewrite_protocol_gcode, rewrites, reference_coordinates)
+    except BrokenProcessPool:
+        # A worker died since the last batch; start over with a new pool
+        discard_protocol_pool(pool)
+        pool = protocol_pool()
+        return pool, pool.submit(rewrite_protocol_gcode, rewrites, reference_coordinates)
+
+@app.route('/save-protocol1-batch', methods=['POST'])
+def save_protocol1_batch():
+    """
+    Save many protocols at once: {"protocols": [<save-protocol1 payload>, ...]}.
+    Every payload is checked and saved here, then the G-code rewrites run in
+    the process pool, one task per G-code file so saves of the same file keep
+    their order. Each protocol gets its own status ("saved", "invalid",
+    "conflict" or "failed"), error and time; one failure does not affect the
+    others.
+    """
+    try:
+        batch_start = time.perf_counter()
+        data = request.get_json()
+        payloads = data.get('protocols') if isinstance(data, dict) else None
+        if not isinstance(payloads, list) or not payloads:
+            logging.error("Protocol batch is missing")
+            return jsonify({"error": "A list of protocols is required"}), 400
+
+        results = []
+        rewrites_by_file = {}
+        for i, payload in enumerate(payloads):
+            result = {
+                "protocol_name": payload.get('protocol_name') if isinstance(payload, dict) else None,
+                "status": None,
+                "error": None,
+                "seconds": None,
+            }
+            results.append(result)
+            if not isinstance(payload, dict):
+                result.update(status="invalid", error="Each protocol must be a save-protocol1 payload object")
+                continue
+            try:
+                rewrite = save_protocol_data(payload)
+            except InvalidProtocol as e:
+                result.update(status="invalid", error=str(e))
+                continue
+            except Exception as e:
+                result.update(status="failed", error=str(e))
+                continue
+            key = os.path.realpath(rewrite["gcode_file_path"])
+            rewrites_by_file.setdefault(key, []).append((i, rewrite))
+
+        tasks = []
+        for file_rewrites in rewrites_by_file.values():
+            pool, future = submit_rewrites([rewrite for _, rewrite in file_rewrites])
+            tasks.append((pool, future, [i for i, _ in file_rewrites]))
+
+        for pool, future, indices in tasks:
+            try:
+                file_results = future.result()
+            except BrokenProcessPool as e:
+                # Rewrites only replace the G-code once complete, so the file is as it was
+                discard_protocol_pool(pool)
+                file_results = [{"status": "failed", "error": f"Worker process died: {e}"}] * len(indices)
+            except Exception as e:
+                file_results = [{"status": "failed", "error": str(e)}] * len(indices)
+            for i, file_result in zip(indices, file_results):
+                results[i].update(file_result)
+
+        for result in results:
+            if result["status"] != "saved":
+                logging.error(f"Protocol {result['protocol_name']} not saved: {result['error']}")
+        saved = sum(result["status"] == "saved" for result in results)
+        logging.debug(f"Saved {saved} of {len(results)} protocols in {time.perf_counter() - batch_start:.2f}s")
+
+        return jsonify({
+            "results": results,
+            "saved": saved,
+            "failed": len(results) - saved,
+            "seconds": round(time.perf_counter() - batch_start, 3),
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error saving protocol batch: {str(e)}")
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -1,86 +1,650 @@
+import json
 import os
+import queue
+import shutil
 import tempfile
-from flask import Flask, request, jsonify
+import threading
+import uuid
+import wave
+from flask import Flask, Response, request, jsonify, stream_with_context
 from TTS.api import TTS
-import subprocess
 import torch
+from audio_cache import AudioCache, cache_key, file_fingerprint, normalize_text
+from cpu_optim import configure_threads, inference_context, optimize
+from jobs import JobError, JobQueue, QueueFull
+from lipsync_engine import Wav2LipEngine
+from readiness import Readiness, Skip
+from pipeline import concat_segments, pipelined_segments, split_sentences, to_pcm16, wav_stream_header
+from speaker_registry import SpeakerRegistry
+from tts_batch import batch_synthesize
 
 app = Flask(__name__)
 
-# Initialize TTS with YourTTS model
+TTS_MODEL_NAME = "tts_models/multilingual/multi-dataset/your_tts"
+TTS_LANGUAGE = "en"
+DEFAULT_SPEAKER_ID = "rohan"
+DEFAULT_SPEAKER_WAV = "/app/input/rohan_voice_sample.wav"
+WAV2LIP_CHECKPOINT = "/app/Wav2Lip/checkpoints/Wav2Lip_GAN.pth"
+DEFAULT_FACE_VIDEO = "/app/input/rohan_base.mp4"
+OUTPUT_DIR = "/app/output"
+AUDIO_DIR = "/app/generated_audio"
+MAX_JOB_WAIT_SECONDS = 60
+MAX_BATCH_ITEMS = 64
+TTS_BATCH_SIZE = int(os.getenv('TTS_BATCH_SIZE', '8'))
+# Silence the synthesizer inserts between sentences
+SENTENCE_PAUSE_SAMPLES = 10000
+WARMUP_TEXT = "Hello there."
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '0')) or os.cpu_count() or 1
+
 device = "cuda" if torch.cuda.is_available() else "cpu"
-tts = TTS("tts_models/multilingual/multi-dataset/your_tts").to(device)
+cpu_optimize = device == "cpu" and os.getenv('CPU_OPTIMIZE') == '1'
+if cpu_optimize:
+    # Inter-op threads can only be set before torch runs any parallel work
+    configure_threads(JOB_WORKERS)
+
+# Models are loaded by load_models() on a background thread; /ready reports progress
+tts = None
+speakers = None
+lipsync = None
+cpu_report = None
+readiness = Readiness(['tts', 'speakers', 'wav2lip', 'face_cache', 'cpu_optimization', 'warmup'])
+
+# Synthesized speech keyed by text, speaker voice, language and model; clients get
+# links under AUDIO_DIR, so evicting an entry never removes a path they were given
+tts_cache = AudioCache(
+    os.getenv('TTS_CACHE_DIR', '/app/generated_audio/tts_cache'),
+    int(os.getenv('TTS_CACHE_MAX_MB', '1024')) * 1024 * 1024
+)
+
+# Generation runs on a bounded worker pool; a full queue is answered with 429
+jobs = JobQueue(
+    workers=JOB_WORKERS,
+    max_queued=int(os.getenv('JOB_QUEUE_SIZE', '0')) or None
+)
+
+def load_models():
+    """Load every model, then run one short synthesis and lip-sync so the first request is warm"""
+    global tts, speakers, lipsync, cpu_report
+
+    with readiness.component('tts'):
+        # Initialize TTS with YourTTS model
+        tts = TTS(TTS_MODEL_NAME).to(device)
+
+    with readiness.component('speakers'):
+        # Reference voices are encoded once and then referenced by speaker_id
+        speakers = SpeakerRegistry(tts.synthesizer.tts_model.speaker_manager)
+        if not os.path.exists(DEFAULT_SPEAKER_WAV):
+            raise Skip(f'{DEFAULT_SPEAKER_WAV} not found')
+        speakers.register(DEFAULT_SPEAKER_ID, DEFAULT_SPEAKER_WAV)
+
+    with readiness.component('wav2lip'):
+        # Wav2Lip checkpoint and face detector stay resident for the life of the process
+        # Face boxes and crops of base videos are detected once and reused from disk
+        lipsync = Wav2LipEngine(
+            WAV2LIP_CHECKPOINT,
+            device,
+            face_cache_dir=os.getenv('FACE_CACHE_DIR', '/app/cache/faces')
+        )
+
+    with readiness.component('face_cache'):
+        if not os.path.exists(DEFAULT_FACE_VIDEO):
+            raise Skip(f'{DEFAULT_FACE_VIDEO} not found')
+        lipsync.precompute(DEFAULT_FACE_VIDEO)
+
+    with readiness.component('cpu_optimization'):
+        # Quantized / ONNX Runtime models on CPU-only hosts, each gated by a parity check against fp32
+        if not cpu_optimize:
+            raise Skip('CPU_OPTIMIZE is not enabled')
+        default_speaker = DEFAULT_SPEAKER_ID if os.path.exists(DEFAULT_SPEAKER_WAV) else None
+        cpu_report = optimize(tts, lipsync, default_speaker, TTS_LANGUAGE, JOB_WORKERS)
+        print(f"CPU optimization: {json.dumps(cpu_report)}")
+
+    with readiness.component('warmup'):
+        if not os.path.exists(DEFAULT_SPEAKER_WAV) or not os.path.exists(DEFAULT_FACE_VIDEO):
+            raise Skip('default speaker or face video not found')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            audio_path = os.path.join(tmp_dir, 'warmup.wav')
+            with inference_context():
+                tts.tts_to_file(text=WARMUP_TEXT, speaker=DEFAULT_SPEAKER_ID, language=TTS_LANGUAGE, file_path=audio_path)
+            lipsync.render(audio_path, DEFAULT_FACE_VIDEO, os.path.join(tmp_dir, 'warmup.mp4'))
+
+def start_models():
+    """Run load_models() on a background thread so /health answers while it loads"""
+    def run():
+        try:
+            load_models()
+        except Exception as e:
+            print(f"Model startup failed: {str(e)}")
+        finally:
+            readiness.finish()
+
+    threading.Thread(target=run, name='model-startup', daemon=True).start()
+
+def speech_path(key):
+    """Where a cached TTS result is linked for the client"""
+    return os.path.join(AUDIO_DIR, f'speech_{key[:16]}.wav')
+
+def synthesize_cached(text, speaker_id=None, speaker_wav=None, language=TTS_LANGUAGE):
+    """Return (audio_path, cached) for text, running YourTTS only on a cache miss"""
+    text = normalize_text(text)
+    speaker_id, fingerprint = speakers.resolve(speaker_id, speaker_wav)
+    key = cache_key(text, fingerprint, language, TTS_MODEL_NAME)
+
+    audio_path = speech_path(key)
+    if tts_cache.export(key, audio_path):
+        return audio_path, True
+
+    tmp_path = tts_cache.temp_path()
+    try:
+        with inference_context():
+            tts.tts_to_file(
+                text=text,
+                speaker=speaker_id,
+                language=language,
+                file_path=tmp_path
+            )
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    tts_cache.commit(key, tmp_path, export_to=audio_path)
+    return audio_path, False
+
+def synthesize_pcm(sentence, speaker_id, fingerprint, language=TTS_LANGUAGE):
+    """16-bit PCM for one sentence, served from and written back to the TTS cache"""
+    sentence = normalize_text(sentence)
+    key = cache_key(sentence, fingerprint, language, TTS_MODEL_NAME)
+
+    with tts_cache.reading(key) as audio_path:
+        if audio_path:
+            with wave.open(audio_path, 'rb') as cached:
+                return cached.readframes(cached.getnframes())
+
+    with inference_context():
+        pcm = to_pcm16(tts.tts(text=sentence, speaker=speaker_id, language=language))
+
+    tmp_path = tts_cache.temp_path()
+    with wave.open(tmp_path, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(tts.synthesizer.output_sample_rate)
+        out.writeframes(pcm)
+    tts_cache.commit(key, tmp_path)
+
+    return pcm
+
+@app.before_request
+def require_ready():
+    """Turn work away with 503 until the models are loaded and warmed up"""
+    if request.path not in ('/health', '/ready') and not readiness.ready:
+        return jsonify({'error': 'Service is starting up', 'ready': readiness.report()}), 503
 
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'service': 'avatar-generator'})
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Per-component readiness and load timings; 503 until every component is usable"""
+    report = readiness.report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and size of the TTS result cache"""
+    return jsonify({'success': True, 'tts_cache': tts_cache.stats()})
+
+@app.route('/cpu-optimization', methods=['GET'])
+def cpu_optimization():
+    """Thread settings and fp32 parity/timing report of the CPU inference backend"""
+    return jsonify({'success': True, 'enabled': cpu_report is not None, 'report': cpu_report})
+
+@app.route('/speakers', methods=['GET'])
+def list_speakers():
+    """List registered voice-cloning speakers"""
+    return jsonify({'success': True, 'speakers': speakers.list()})
+
+@app.route('/speakers', methods=['POST'])
+def register_speaker():
+    """Register a reference WAV under a speaker_id, computing its embedding once"""
+    try:
+        data = request.get_json()
+        speaker_id = data.get('speaker_id')
+        speaker_wav = data.get('speaker_wav')
+
+        if not speaker_id or not speaker_wav:
+            return jsonify({'error': 'speaker_id and speaker_wav are required'}), 400
+
+        fingerprint = speakers.register(speaker_id, speaker_wav)
+
+        return jsonify({
+            'success': True,
+            'speaker_id': speaker_id,
+            'fingerprint': fingerprint,
+            'message': 'Speaker registered successfully'
+        })
+
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Speaker registration failed: {str(e)}'}), 500
+
+@app.route('/faces/precompute', methods=['POST'])
+def precompute_faces():
+    """Detect and cache the faces of a base video before it is used for lip-sync"""
+    try:
+        data = request.get_json() or {}
+        face_video = data.get('face_video', DEFAULT_FACE_VIDEO)
+
+        if not os.path.exists(face_video):
+            return jsonify({'error': f'Face video not found: {face_video}'}), 400
+
+        frames = lipsync.precompute(face_video)
+
+        return jsonify({
+            'success': True,
+            'face_video': face_video,
+            'frames': frames,
+            'message': 'Face detection cached successfully'
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'Face precompute failed: {str(e)}'}), 500
+
+def speech_job(text, speaker_id, speaker_wav):
+    """Synthesize text with YourTTS, reusing earlier output for repeated lines"""
+    try:
+        audio_path, cached = synthesize_cached(text, speaker_id, speaker_wav)
+    except KeyError as e:
+        raise JobError(str(e.args[0]), 400)
+    except Exception as e:
+        raise JobError(f'TTS generation failed: {str(e)}')
+
+    return {
+        'success': True,
+        'audio_path': audio_path,
+        'cached': cached,
+        'message': 'Speech generated successfully'
+    }
+
+def coalesce_key(kind, *parts, files=()):
+    """Fingerprint of a job's inputs; None (no coalescing) if an input file is missing"""
+    try:
+        fingerprints = [file_fingerprint(path) for path in files]
+    except OSError:
+        return None
+    return cache_key(kind, *parts, *fingerprints)
+
+def speech_key(text, speaker_id, speaker_wav):
+    return coalesce_key(
+        'speech', normalize_text(text), speaker_id, TTS_LANGUAGE, TTS_MODEL_NAME,
+        files=() if speaker_id else (speaker_wav,)
+    )
+
+def output_key(input_key, output_path):
+    """Identical inputs only coalesce when they also target the same file"""
+    return cache_key(input_key, output_path) if input_key else None
+
+def default_output(name, input_key):
+    """Output path derived from the inputs, so unrelated jobs never share a file"""
+    return os.path.join(OUTPUT_DIR, f'{name}_{(input_key or uuid.uuid4().hex)[:16]}.mp4')
+
+def private_path(output_path):
+    """Job-private file next to output_path, moved into place once it is complete"""
+    root, ext = os.path.splitext(output_path)
+    return f'{root}.tmp-{uuid.uuid4().hex}{ext}'
+
+def video_job(audio_path, face_video, output_path):
+    """Lip-sync face_video to audio_path with the resident Wav2Lip engine"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = private_path(output_path)
+
+    try:
+        lipsync.render(audio_path, face_video, tmp_path)
+        os.replace(tmp_path, output_path)
+    except Exception as e:
+        raise JobError(f'Wav2Lip failed: {str(e)}')
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    return {
+        'success': True,
+        'video_path': output_path,
+        'message': 'Video generated successfully'
+    }
+
+def complete_job(text, speaker_id, speaker_wav, face_video, output_path):
+    """Complete pipeline: text -> speech -> video"""
+    audio_path = speech_job(text, speaker_id, speaker_wav)['audio_path']
+    video_job(audio_path, face_video, output_path)
+
+    return {
+        'success': True,
+        'video_path': output_path,
+        'message': 'Avatar generated successfully'
+    }
+
+def pipelined_job(text, speaker_id, speaker_wav, face_video, output_path, events=None):
+    """Text -> speech -> video one sentence at a time, overlapping TTS with lip-sync.
+
+    Segments are rendered into a job-private directory and joined losslessly
+    at the end; the joined video and the segments are then moved next to
+    output_path. If events is a queue, each finished segment is reported on
+    it as it lands, followed by None once the job is over.
+    """
+    tmp_path = segment_dir = None
+    try:
+        sentences = split_sentences(text)
+        if not sentences:
+            raise JobError('Text is required', 400)
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = private_path(output_path)
+        segment_dir = os.path.splitext(tmp_path)[0] + '_segments'
+        os.makedirs(segment_dir)
+        next_frame = [0]
+
+        def synthesize(sentence):
+            return speech_job(sentence, speaker_id, speaker_wav)['audio_path']
+
+        def render(index, audio_path):
+            segment_path = os.path.join(segment_dir, f'segment_{index:03d}.mp4')
+            try:
+                next_frame[0] += lipsync.render(audio_path, face_video, segment_path, start_frame=next_frame[0])
+            except Exception as e:
+                raise JobError(f'Wav2Lip failed: {str(e)}')
+            return segment_path
+
+        segments = []
+        for index, segment_path in pipelined_segments(sentences, synthesize, render):
+            segments.append(segment_path)
+            if events is not None:
+                events.put({'segment': index, 'total': len(sentences), 'video_path': segment_path})
+
+        concat_segments(segments, tmp_path)
+        os.replace(tmp_path, output_path)
+
+        final_dir = os.path.splitext(output_path)[0] + '_segments'
+        try:
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.replace(segment_dir, final_dir)
+            segments = [os.path.join(final_dir, os.path.basename(path)) for path in segments]
+        except OSError:
+            # Another job for this output_path got there first; keep ours where it is
+            pass
+
+        return {
+            'success': True,
+            'video_path': output_path,
+            'segments': segments,
+            'message': 'Avatar generated successfully'
+        }
+    except Exception:
+        if segment_dir:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+        raise
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        if events is not None:
+            events.put(None)
+
+def speech_stream_job(sentences, speaker_id, fingerprint, events):
+    """Put PCM on events one sentence at a time, then None"""
+    try:
+        pause = b'\x00\x00' * SENTENCE_PAUSE_SAMPLES
+        for index, sentence in enumerate(sentences):
+            if index:
+                events.put(pause)
+            events.put(synthesize_pcm(sentence, speaker_id, fingerprint))
+        return {'success': True, 'sentences': len(sentences)}
+    finally:
+        events.put(None)
+
+def batch_speech_job(items, language=TTS_LANGUAGE):
+    """Synthesize many texts, batching cache misses into padded forward passes.
+
+    Returns one result per item in request order; a failing item gets its own
+    error without failing the rest.
+    """
+    results = [None] * len(items)
+    misses = []
+
+    for index, item in enumerate(items):
+        try:
+            text = normalize_text(item['text'])
+            if not text:
+                raise ValueError('Text is required')
+            speaker_id, fingerprint = speakers.resolve(item['speaker_id'], item['speaker_wav'])
+            key = cache_key(text, fingerprint, language, TTS_MODEL_NAME)
+        except KeyError as e:
+            results[index] = {'index': index, 'success': False, 'error': str(e.args[0])}
+            continue
+        except Exception as e:
+            results[index] = {'index': index, 'success': False, 'error': str(e)}
+            continue
+
+        if tts_cache.export(key, speech_path(key)):
+            results[index] = {'index': index, 'success': True, 'audio_path': speech_path(key), 'cached': True}
+        else:
+            misses.append((index, text, speaker_id, key))
+
+    # Similar lengths in one batch keep padding waste low
+    misses.sort(key=lambda miss: len(miss[1]))
+    for start in range(0, len(misses), TTS_BATCH_SIZE):
+        batch = misses[start:start + TTS_BATCH_SIZE]
+        try:
+            wavs = batch_synthesize(
+                tts.synthesizer,
+                [text for _, text, _, _ in batch],
+                [speakers.embedding(speaker_id) for _, _, speaker_id, _ in batch],
+                language
+            )
+        except Exception as e:
+            print(f"Batched TTS unavailable, synthesizing one at a time: {str(e)}")
+            wavs = [None] * len(batch)
+
+        for (index, text, speaker_id, key), wav in zip(batch, wavs):
+            try:
+                if wav is None:
+                    audio_path, cached = synthesize_cached(text, speaker_id)
+                else:
+                    tmp_path = tts_cache.temp_path()
+                    tts.synthesizer.save_wav(wav, tmp_path)
+                    audio_path, cached = speech_path(key), False
+                    tts_cache.commit(key, tmp_path, export_to=audio_path)
+                results[index] = {'index': index, 'success': True, 'audio_path': audio_path, 'cached': cached}
+            except Exception as e:
+                results[index] = {'index': index, 'success': False, 'error': f'TTS generation failed: {str(e)}'}
+
+    return {
+        'success': all(result['success'] for result in results),
+        'results': results,
+        'message': f"Generated speech for {sum(result['success'] for result in results)} of {len(results)} texts"
+    }
+
+def queue_full_response(error):
+    response = jsonify({'error': f'{str(error)}, retry later'})
+    response.headers['Retry-After'] = '5'
+    return response, 429
+
+def submit_streaming(kind, fn, *args):
+    """Queue a job that reports progress on a queue; return (job, iterator over its events)"""
+    events = queue.Queue()
+    job = jobs.submit(kind, fn, *args, events)
+
+    def iterate():
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+
+    return job, iterate()
+
+def stream_job(kind, fn, *args):
+    """Queue a job that reports progress and stream its events as NDJSON"""
+    try:
+        job, events = submit_streaming(kind, fn, *args)
+    except QueueFull as e:
+        return queue_full_response(e)
+
+    def generate():
+        for event in events:
+            yield json.dumps(event) + '\n'
+        job.wait()
+        if job.status == 'failed':
+            yield json.dumps({'error': job.error}) + '\n'
+        else:
+            yield json.dumps(job.result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def run_job(kind, fn, *args, key=None):
+    """Queue a job; wait for it unless the request asked for async handling.
+
+    Requests with the same key while a job is queued or running share that job.
+    """
+    data = request.get_json(silent=True) or {}
+
+    try:
+        job = jobs.submit(kind, fn, *args, key=key)
+    except QueueFull as e:
+        return queue_full_response(e)
+
+    if data.get('async'):
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/jobs/{job.id}'
+        }), 202
+
+    job.wait()
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), job.error_status
+    return jsonify(job.result)
+
+@app.route('/jobs', methods=['GET'])
+def job_stats():
+    """Worker pool and queue occupancy"""
+    return jsonify({'success': True, 'jobs': jobs.stats()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job status; pass ?wait=<seconds> to long-poll until the job finishes"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    wait = min(float(request.args.get('wait', 0)), MAX_JOB_WAIT_SECONDS)
+    if wait > 0:
+        job.wait(wait)
+
+    return jsonify({'success': True, 'job': job.to_dict()})
+
 @app.route('/generate-speech', methods=['POST'])
 def generate_speech():
     """Generate speech from text using YourTTS"""
     try:
         data = request.get_json()
         text = data.get('text', '')
-        speaker_wav = data.get('speaker_wav', '/app/input/rohan_voice_sample.wav')
+        speaker_id = data.get('speaker_id')
+        speaker_wav = data.get('speaker_wav', DEFAULT_SPEAKER_WAV)
         
         if not text:
             return jsonify({'error': 'Text is required'}), 400
 
-        # Generate audio using YourTTS
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-            audio_path = tmp_file.name
-            
-        # Use YourTTS for voice cloning
-        tts.tts_to_file(
-            text=text,
-            speaker_wav=speaker_wav,
-            language="en",
-            file_path=audio_path
-        )
-        
-        return jsonify({
-            'success': True,
-            'audio_path': audio_path,
-            'message': 'Speech generated successfully'
-        })
+        key = speech_key(text, speaker_id, speaker_wav)
+        return run_job('speech', speech_job, text, speaker_id, speaker_wav, key=key)
         
     except Exception as e:
         return jsonify({'error': f'TTS generation failed: {str(e)}'}), 500
 
+@app.route('/generate-speech/batch', methods=['POST'])
+def generate_speech_batch():
+    """Generate speech for a list of texts with a shared or per-item speaker"""
+    try:
+        data = request.get_json()
+        texts = data.get('items') or data.get('texts') or []
+        speaker_id = data.get('speaker_id')
+        speaker_wav = data.get('speaker_wav', DEFAULT_SPEAKER_WAV)
+
+        if not texts:
+            return jsonify({'error': 'items is required'}), 400
+        if len(texts) > MAX_BATCH_ITEMS:
+            return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items per batch'}), 400
+
+        items = []
+        for item in texts:
+            if isinstance(item, str):
+                item = {'text': item}
+            items.append({
+                'text': item.get('text', ''),
+                'speaker_id': item.get('speaker_id', speaker_id),
+                'speaker_wav': item.get('speaker_wav', speaker_wav)
+            })
+
+        return run_job('speech-batch', batch_speech_job, items)
+
+    except Exception as e:
+        return jsonify({'error': f'Batch TTS generation failed: {str(e)}'}), 500
+
+@app.route('/generate-speech/stream', methods=['POST'])
+def generate_speech_stream():
+    """Stream speech as a chunked WAV, synthesizing and sending one sentence at a time"""
+    try:
+        data = request.get_json()
+        text = data.get('text', '')
+        speaker_id = data.get('speaker_id')
+        speaker_wav = data.get('speaker_wav', DEFAULT_SPEAKER_WAV)
+
+        sentences = split_sentences(text)
+        if not sentences:
+            return jsonify({'error': 'Text is required'}), 400
+
+        try:
+            speaker_id, fingerprint = speakers.resolve(speaker_id, speaker_wav)
+        except KeyError as e:
+            return jsonify({'error': str(e.args[0])}), 400
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 400
+
+        try:
+            job, chunks = submit_streaming('speech', speech_stream_job, sentences, speaker_id, fingerprint)
+        except QueueFull as e:
+            return queue_full_response(e)
+
+        def generate():
+            yield wav_stream_header(tts.synthesizer.output_sample_rate)
+            yield from chunks
+            job.wait()
+            if job.status == 'failed':
+                print(f"Speech stream {job.id} ended early: {job.error}")
+
+        return Response(stream_with_context(generate()), mimetype='audio/wav')
+
+    except Exception as e:
+        return jsonify({'error': f'TTS generation failed: {str(e)}'}), 500
+
 @app.route('/generate-video', methods=['POST'])
 def generate_video():
     """Generate lip-sync video using Wav2Lip"""
     try:
         data = request.get_json()
         audio_path = data.get('audio_path')
-        face_video = data.get('face_video', '/app/input/rohan_base.mp4')
-        output_path = data.get('output_path', '/app/output/generated_video.mp4')
+        face_video = data.get('face_video', DEFAULT_FACE_VIDEO)
         
         if not audio_path:
             return jsonify({'error': 'Audio path is required'}), 400
 
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Run Wav2Lip
-        wav2lip_command = [
-            'python', '/app/Wav2Lip/inference.py',
-            '--checkpoint_path', '/app/Wav2Lip/checkpoints/Wav2Lip_GAN.pth',
-            '--face', face_video,
-            '--audio', audio_path,
-            '--outfile', output_path
-        ]
-        
-        result = subprocess.run(wav2lip_command, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            return jsonify({'error': f'Wav2Lip failed: {result.stderr}'}), 500
-            
-        return jsonify({
-            'success': True,
-            'video_path': output_path,
-            'message': 'Video generated successfully'
-        })
+        input_key = coalesce_key('video', WAV2LIP_CHECKPOINT, files=(audio_path, face_video))
+        output_path = data.get('output_path') or default_output('generated_video', input_key)
+        key = output_key(input_key, output_path)
+        return run_job('video', video_job, audio_path, face_video, output_path, key=key)
         
     except Exception as e:
         return jsonify({'error': f'Video generation failed: {str(e)}'}), 500
@@ -91,52 +655,37 @@ def generate_complete():
     try:
         data = request.get_json()
         text = data.get('text', '')
-        output_name = data.get('output_name', 'generated_video.mp4')
-        speaker_wav = data.get('speaker_wav', '/app/input/rohan_voice_sample.wav')
-        face_video = data.get('face_video', '/app/input/rohan_base.mp4')
+        output_name = data.get('output_name')
+        speaker_id = data.get('speaker_id')
+        speaker_wav = data.get('speaker_wav', DEFAULT_SPEAKER_WAV)
+        face_video = data.get('face_video', DEFAULT_FACE_VIDEO)
         
         if not text:
             return jsonify({'error': 'Text is required'}), 400
 
-        # Step 1: Generate speech
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_audio:
-            audio_path = tmp_audio.name
-            
-        tts.tts_to_file(
-            text=text,
-            speaker_wav=speaker_wav,
-            language="en",
-            file_path=audio_path
+        fn = pipelined_job if data.get('pipelined') or data.get('stream') else complete_job
+        input_key = coalesce_key(
+            'generate', fn.__name__, speech_key(text, speaker_id, speaker_wav), WAV2LIP_CHECKPOINT,
+            files=(face_video,)
         )
-        
-        # Step 2: Generate video
-        output_path = f'/app/output/{output_name}'
-        os.makedirs('/app/output', exist_ok=True)
-        
-        wav2lip_command = [
-            'python', '/app/Wav2Lip/inference.py',
-            '--checkpoint_path', '/app/Wav2Lip/checkpoints/Wav2Lip_GAN.pth',
-            '--face', face_video,
-            '--audio', audio_path,
-            '--outfile', output_path
-        ]
-        
-        result = subprocess.run(wav2lip_command, capture_output=True, text=True)
-        
-        # Clean up temporary audio file
-        os.unlink(audio_path)
-        
-        if result.returncode != 0:
-            return jsonify({'error': f'Wav2Lip failed: {result.stderr}'}), 500
-            
-        return jsonify({
-            'success': True,
-            'video_path': output_path,
-            'message': 'Avatar generated successfully'
-        })
+        if output_name:
+            output_path = os.path.join(OUTPUT_DIR, output_name)
+        else:
+            output_path = default_output('generated_video', input_key)
+
+        # Sentence-level pipelining; "stream" also reports each segment as it is rendered.
+        # Streams are not coalesced: every stream needs its own event queue.
+        if data.get('stream'):
+            return stream_job('generate', pipelined_job, text, speaker_id, speaker_wav, face_video, output_path)
+
+        key = output_key(input_key, output_path)
+        return run_job('generate', fn, text, speaker_id, speaker_wav, face_video, output_path, key=key)
         
     except Exception as e:
         return jsonify({'error': f'Complete generation failed: {str(e)}'}), 500
 
+start_models()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8001, debug=True)
+    # The debug reloader would start a second process and load the models twice
+    app.run(host='0.0.0.0', port=8001, debug=os.getenv('FLASK_DEBUG') == '1', threaded=True)
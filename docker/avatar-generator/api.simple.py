@@ -1,23 +1,92 @@
 import os
-import requests
-import subprocess
 import tempfile
-from flask import Flask, request, jsonify
+from contextlib import ExitStack
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+from audio_cache import AudioCache, cache_key, file_fingerprint, normalize_text
+from elevenlabs_client import ElevenLabsClient
+from mux import MuxBusy, Muxer
+from singleflight import SingleFlight
+from voice_catalog import CatalogUnavailable, VoiceCatalog
 
 app = Flask(__name__)
 
 # ElevenLabs configuration
 ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY', '')
-ELEVENLABS_BASE_URL = 'https://api.elevenlabs.io/v1'
+ELEVENLABS_BASE_URL = os.getenv('ELEVENLABS_BASE_URL', 'https://api.elevenlabs.io/v1')
+ELEVENLABS_MODEL_ID = 'eleven_monolingual_v1'
+ELEVENLABS_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.5
+}
+ELEVENLABS_AUDIO_TYPE = 'audio/mpeg'
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# One pooled keep-alive session for every ElevenLabs call, capped at the plan's concurrency
+elevenlabs = ElevenLabsClient(
+    ELEVENLABS_API_KEY,
+    ELEVENLABS_BASE_URL,
+    pool_size=int(os.getenv('ELEVENLABS_POOL_SIZE', '10')),
+    concurrency=int(os.getenv('ELEVENLABS_CONCURRENCY', '2')),
+    connect_timeout=float(os.getenv('ELEVENLABS_CONNECT_TIMEOUT', '3.05')),
+    read_timeout=float(os.getenv('ELEVENLABS_READ_TIMEOUT', '60')),
+    max_retries=int(os.getenv('ELEVENLABS_MAX_RETRIES', '3'))
+)
+
+# Generated speech keyed by text, voice, model and voice settings; stored as returned (MP3).
+# Clients get links under AUDIO_DIR, so evicting an entry never removes a path they were given
+AUDIO_DIR = '/app/generated_audio'
+speech_cache = AudioCache(
+    os.getenv('ELEVENLABS_CACHE_DIR', '/app/generated_audio/elevenlabs_cache'),
+    int(os.getenv('ELEVENLABS_CACHE_MAX_MB', '512')) * 1024 * 1024,
+    suffix='.mp3'
+)
+
+# Identical requests in flight at the same time share one ElevenLabs call or one mux
+speech_flight = SingleFlight()
+video_flight = SingleFlight()
+
+# The frontend polls /voices, so the list is cached and refreshed at most once per TTL
+voice_catalog = VoiceCatalog(
+    elevenlabs,
+    ttl=int(os.getenv('ELEVENLABS_VOICES_TTL', '300')),
+    max_stale=int(os.getenv('ELEVENLABS_VOICES_MAX_STALE', '3600')),
+    error_ttl=int(os.getenv('ELEVENLABS_VOICES_ERROR_TTL', '30'))
+)
 
 # EchoMimic configuration
 ECHOMIMIC_ENABLED = os.getenv('ECHOMIMIC_ENABLED', 'false').lower() == 'true'
 REFERENCE_VIDEO_PATH = '/app/input/reference_presenter.mp4'
+BASE_VIDEO_PATH = '/app/input/rohan_base.mp4'
+MOCK_AUDIO_PATH = '/app/generated_audio/mock_audio.wav'
+
+# Base video is prepared once (faststart, keyframe every MUX_GOP_SECONDS); muxes are bounded
+muxer = Muxer(
+    os.getenv('BASE_VIDEO_CACHE_DIR', '/app/cache/base_video'),
+    workers=int(os.getenv('MUX_WORKERS', '2')),
+    queue_timeout=float(os.getenv('MUX_QUEUE_TIMEOUT', '30')),
+    timeout=float(os.getenv('MUX_TIMEOUT', '300')),
+    gop_seconds=float(os.getenv('MUX_GOP_SECONDS', '1'))
+)
 
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'service': 'avatar-generator-elevenlabs'})
 
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and size of the ElevenLabs speech cache"""
+    return jsonify({
+        'success': True,
+        'speech_cache': speech_cache.stats(),
+        'voice_catalog': voice_catalog.stats(),
+        'coalesced': {'speech': speech_flight.stats(), 'video': video_flight.stats()}
+    })
+
+@app.route('/mux/stats', methods=['GET'])
+def mux_stats():
+    """Mux latency percentiles and the prepared base videos"""
+    return jsonify({'success': True, 'mux': muxer.stats()})
+
 @app.route('/voices', methods=['GET'])
 def list_voices():
     """List available ElevenLabs voices"""
@@ -25,31 +94,33 @@ def list_voices():
         if not ELEVENLABS_API_KEY:
             return jsonify({'error': 'ElevenLabs API key not configured'}), 400
             
-        url = f"{ELEVENLABS_BASE_URL}/voices"
-        headers = {"xi-api-key": ELEVENLABS_API_KEY}
-        
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            voices_data = response.json()
-            voices = []
-            for voice in voices_data.get('voices', []):
-                voices.append({
-                    'voice_id': voice['voice_id'],
-                    'name': voice['name'],
-                    'category': voice.get('category', 'unknown')
-                })
-            
-            return jsonify({
-                'success': True,
-                'voices': voices
-            })
-        else:
-            return jsonify({'error': f'Failed to fetch voices: {response.text}'}), 500
+        return jsonify({
+            'success': True,
+            'voices': voice_catalog.voices()
+        })
             
+    except CatalogUnavailable as e:
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         return jsonify({'error': f'Error fetching voices: {str(e)}'}), 500
 
+@app.route('/voices/refresh', methods=['POST'])
+def refresh_voices():
+    """Refetch the voice list now, e.g. right after cloning a voice"""
+    try:
+        if not ELEVENLABS_API_KEY:
+            return jsonify({'error': 'ElevenLabs API key not configured'}), 400
+
+        return jsonify({
+            'success': True,
+            'voices': voice_catalog.refresh()
+        })
+
+    except CatalogUnavailable as e:
+        return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        return jsonify({'error': f'Error refreshing voices: {str(e)}'}), 500
+
 @app.route('/clone-voice', methods=['POST'])
 def clone_voice():
     """Clone a voice using uploaded audio file"""
@@ -89,25 +160,34 @@ def generate_speech():
             # Fallback to mock for testing
             return jsonify({
                 'success': True,
-                'audio_path': '/app/generated_audio/mock_audio.wav',
+                'audio_path': MOCK_AUDIO_PATH,
                 'message': 'Mock speech generated (no ElevenLabs API key)'
             })
 
-        # Generate speech with ElevenLabs
-        audio_data = generate_elevenlabs_speech(text, voice_id)
+        # Repeated lines are served from the cache without another paid API call
+        text = normalize_text(text)
+        key = cache_key(text, voice_id, ELEVENLABS_MODEL_ID, ELEVENLABS_VOICE_SETTINGS)
+        audio_path = speech_cache.export(key, speech_path(key))
+        if audio_path:
+            return jsonify({
+                'success': True,
+                'audio_path': audio_path,
+                'cached': True,
+                'message': 'Speech served from cache'
+            })
+
+        # Unknown voices fail fast; if the catalog is unavailable, let ElevenLabs decide
+        if voice_catalog.has_voice(voice_id) is False:
+            return jsonify({'error': f'Unknown voice_id: {voice_id}'}), 400
+
+        # Generate speech with ElevenLabs; concurrent requests for the same line share the call
+        audio_path, _ = speech_flight.do(key, download_speech, text, voice_id, key)
         
-        if audio_data:
-            # Save audio file
-            audio_filename = f"speech_{hash(text) % 10000}.wav"
-            audio_path = f"/app/generated_audio/{audio_filename}"
-            
-            os.makedirs('/app/generated_audio', exist_ok=True)
-            with open(audio_path, 'wb') as f:
-                f.write(audio_data)
-            
+        if audio_path:
             return jsonify({
                 'success': True,
                 'audio_path': audio_path,
+                'cached': False,
                 'message': 'Speech generated successfully with ElevenLabs'
             })
         else:
@@ -116,54 +196,143 @@ def generate_speech():
     except Exception as e:
         return jsonify({'error': f'Speech generation failed: {str(e)}'}), 500
 
-def generate_elevenlabs_speech(text, voice_id):
-    """Generate speech using ElevenLabs API"""
+@app.route('/generate-speech/stream', methods=['POST'])
+def generate_speech_stream():
+    """Stream ElevenLabs audio to the client as it arrives, caching it on the way through"""
     try:
-        url = f"{ELEVENLABS_BASE_URL}/text-to-speech/{voice_id}"
+        data = request.get_json()
+        text = data.get('text', '')
+        voice_id = data.get('voice_id', 'default')
+        
+        if not text:
+            return jsonify({'error': 'Text is required'}), 400
+
+        if not ELEVENLABS_API_KEY:
+            return jsonify({'error': 'ElevenLabs API key not configured'}), 400
+
+        text = normalize_text(text)
+        key = cache_key(text, voice_id, ELEVENLABS_MODEL_ID, ELEVENLABS_VOICE_SETTINGS)
+        with speech_cache.reading(key) as audio_path:
+            if audio_path:
+                # Opened here, so later eviction cannot cut the response short
+                return send_file(audio_path, mimetype=ELEVENLABS_AUDIO_TYPE, conditional=True)
+
+        if voice_catalog.has_voice(voice_id) is False:
+            return jsonify({'error': f'Unknown voice_id: {voice_id}'}), 400
+
+        stream = open_elevenlabs_stream(text, voice_id)
+        if not stream:
+            return jsonify({'error': 'Failed to generate speech'}), 500
+        stack, response = stream
+
+        def generate():
+            with stack:
+                yield from tee_to_cache(response, key)
+
+        return Response(stream_with_context(generate()), mimetype=ELEVENLABS_AUDIO_TYPE)
         
+    except Exception as e:
+        return jsonify({'error': f'Speech generation failed: {str(e)}'}), 500
+
+def download_speech(text, voice_id, key):
+    """Write ElevenLabs speech straight into the cache; returns its path, or None if the API call failed"""
+    stream = open_elevenlabs_stream(text, voice_id)
+    if not stream:
+        return None
+
+    stack, response = stream
+    with stack:
+        for _ in tee_to_cache(response, key):
+            pass
+    audio_path = speech_cache.export(key, speech_path(key))
+    if not audio_path:
+        raise RuntimeError(f"Unexpected audio type from ElevenLabs: {response.headers.get('Content-Type')}")
+    return audio_path
+
+def speech_path(key):
+    """Where cached speech is linked for the client"""
+    return os.path.join(AUDIO_DIR, f'speech_{key[:16]}.mp3')
+
+def open_elevenlabs_stream(text, voice_id):
+    """Start a streaming ElevenLabs TTS request.
+
+    Returns (stack, response), where closing the ExitStack releases the
+    connection and the concurrency slot, or None if the request failed.
+    """
+    stack = ExitStack()
+    try:
         headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": ELEVENLABS_API_KEY
+            "Accept": ELEVENLABS_AUDIO_TYPE,
+            "Content-Type": "application/json"
         }
         
         data = {
             "text": text,
-            "model_id": "eleven_monolingual_v1",
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.5
-            }
+            "model_id": ELEVENLABS_MODEL_ID,
+            "voice_settings": ELEVENLABS_VOICE_SETTINGS
         }
         
-        response = requests.post(url, json=data, headers=headers)
+        response = stack.enter_context(
+            elevenlabs.stream('POST', f"/text-to-speech/{voice_id}/stream", json=data, headers=headers)
+        )
         
         if response.status_code == 200:
-            return response.content
+            return stack, response
         else:
             print(f"ElevenLabs API error: {response.status_code} - {response.text}")
+            stack.close()
             return None
             
     except Exception as e:
         print(f"Error calling ElevenLabs API: {str(e)}")
+        stack.close()
         return None
 
+def tee_to_cache(response, key):
+    """Yield the response body in chunks while writing it to the speech cache.
+
+    The entry is committed only once the whole body has arrived, and only
+    if it is the MP3 the cache stores; an interrupted stream leaves nothing.
+    """
+    content_type = response.headers.get('Content-Type', ELEVENLABS_AUDIO_TYPE).split(';')[0].strip()
+    cacheable = content_type == ELEVENLABS_AUDIO_TYPE
+    tmp_path = speech_cache.temp_path()
+    complete = False
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                f.write(chunk)
+                yield chunk
+        complete = True
+    finally:
+        if complete and cacheable:
+            speech_cache.commit(key, tmp_path)
+        elif os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
 @app.route('/generate-video', methods=['POST'])
 def generate_video():
     """Generate video using EchoMimic V2 or fallback to mock"""
     try:
         data = request.get_json()
         audio_path = data.get('audio_path')
-        output_path = data.get('output_path', '/app/output/generated_video.mp4')
+        output_path = data.get('output_path')
         reference_video = data.get('reference_video', REFERENCE_VIDEO_PATH)
         
         if not audio_path:
             return jsonify({'error': 'Audio path is required'}), 400
 
         # Check if we have real audio and base video
-        if os.path.exists('/app/input/rohan_base.mp4') and audio_path != '/app/generated_audio/mock_audio.wav':
-            # Use real audio + base video combination
-            video_data = combine_audio_with_base_video(audio_path, '/app/input/rohan_base.mp4', output_path)
+        if os.path.exists(BASE_VIDEO_PATH) and audio_path != MOCK_AUDIO_PATH:
+            # Use real audio + base video combination. Without an explicit output_path the
+            # file is named after the inputs, so different requests never overwrite each other.
+            input_key = cache_key(file_fingerprint(audio_path), file_fingerprint(BASE_VIDEO_PATH))
+            output_path = output_path or f'/app/output/generated_video_{input_key[:16]}.mp4'
+            video_data, _ = video_flight.do(
+                (input_key, output_path),
+                combine_audio_with_base_video, audio_path, BASE_VIDEO_PATH, output_path
+            )
             
             if video_data:
                 return jsonify({
@@ -177,43 +346,95 @@ def generate_video():
             # Fallback to mock response
             return jsonify({
                 'success': True,
-                'video_path': output_path,
+                'video_path': output_path or '/app/output/generated_video.mp4',
                 'message': 'Mock video generated (no real audio or base video missing)'
             })
         
+    except MuxBusy as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': f'Video generation failed: {str(e)}'}), 500
 
-def combine_audio_with_base_video(audio_path, base_video_path, output_path):
-    """Combine ElevenLabs audio with base video using FFmpeg"""
+@app.route('/generate-video/stream', methods=['POST'])
+def generate_video_stream():
+    """Stream the fragmented MP4 while it is muxed; it is saved to output_path as well"""
     try:
-        # Use FFmpeg to combine audio with video
-        cmd = [
-            'ffmpeg', '-y',  # -y to overwrite output file
-            '-i', base_video_path,  # Input video
-            '-i', audio_path,       # Input audio
-            '-c:v', 'copy',         # Copy video stream as-is
-            '-c:a', 'aac',          # Encode audio as AAC
-            '-shortest',            # Stop when shortest stream ends
-            output_path
-        ]
-        
-        print(f"Running FFmpeg command: {' '.join(cmd)}")
+        data = request.get_json()
+        audio_path = data.get('audio_path')
+        output_path = data.get('output_path')
         
-        # Run FFmpeg command
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        if not audio_path:
+            return jsonify({'error': 'Audio path is required'}), 400
+        if not os.path.exists(BASE_VIDEO_PATH):
+            return jsonify({'error': 'Base video not found'}), 404
+        if not os.path.exists(audio_path):
+            return jsonify({'error': f'Audio not found: {audio_path}'}), 404
+
+        # Named after the inputs, as in /generate-video, so concurrent streams never share a file
+        input_key = cache_key(file_fingerprint(audio_path), file_fingerprint(BASE_VIDEO_PATH))
+        output_path = output_path or f'/app/output/generated_video_{input_key[:16]}.mp4'
+
+        # The same video already being made (streamed or not) is sent once it is done
+        call, leader = video_flight.join((input_key, output_path))
+        if not leader:
+            if video_flight.wait(call) and os.path.exists(output_path):
+                return send_file(output_path, mimetype='video/mp4', conditional=True)
+            return jsonify({'error': 'Audio+Video combination failed'}), 500
+
+        try:
+            chunks = muxer.stream(audio_path, BASE_VIDEO_PATH, output_path)
+            # Start ffmpeg now so a busy pool or bad input is still reported as JSON
+            first = next(chunks, None)
+            if first is None:
+                # next() would raise StopIteration, which Flask turns into a blank 500
+                raise RuntimeError('FFmpeg produced no output')
+        except Exception as e:
+            video_flight.finish(call, error=e)
+            raise
+
+        def generate():
+            complete = False
+            try:
+                yield first
+                yield from chunks
+                complete = True
+            finally:
+                video_flight.finish(call, result=complete)
+
+        def close():
+            # Also runs if the client goes away before the body starts
+            chunks.close()
+            video_flight.finish(call, result=False)
+
+        response = Response(stream_with_context(generate()), mimetype='video/mp4')
+        response.call_on_close(close)
+        return response
         
-        if result.returncode == 0 and os.path.exists(output_path):
-            print(f"Successfully created video: {output_path}")
-            return True
-        else:
-            print(f"FFmpeg error: {result.stderr}")
-            return False
+    except MuxBusy as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': f'Video generation failed: {str(e)}'}), 500
+
+def combine_audio_with_base_video(audio_path, base_video_path, output_path):
+    """Combine ElevenLabs audio with base video using FFmpeg"""
+    try:
+        muxer.mux(audio_path, base_video_path, output_path)
+        print(f"Successfully created video: {output_path}")
+        return True
             
+    except MuxBusy:
+        # Overload, not a failed mux: the route answers 503
+        raise
     except Exception as e:
         print(f"Error combining audio with video: {str(e)}")
         return False
 
+def prepare_base_video():
+    """Start preparing the base video so the first request does not pay for it"""
+    if os.path.exists(BASE_VIDEO_PATH):
+        # Returns at once; the muxer prepares in the background and logs the outcome
+        muxer.base(BASE_VIDEO_PATH)
+
 def torch_available():
     """Check if PyTorch is available"""
     try:
@@ -244,4 +465,6 @@ def generate_complete():
         return jsonify({'error': f'Complete generation failed: {str(e)}'}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8001, debug=True)
\ No newline at end of file
+    prepare_base_video()
+    # The reloader would import this module twice and prepare the base video twice
+    app.run(host='0.0.0.0', port=8001, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import unicodedata
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def normalize_text(text):
+    """Normalize text so cosmetic whitespace/unicode differences share a cache entry"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def file_fingerprint(path):
+    """SHA-256 of a file's contents, memoized on (path, mtime, size)"""
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    with _fingerprints_lock:
+        cached = _fingerprints.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    fingerprint = digest.hexdigest()
+
+    with _fingerprints_lock:
+        _fingerprints[path] = (stamp, fingerprint)
+    return fingerprint
+
+
+def cache_key(*parts):
+    """Stable hash of the parts that determine a cached result"""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _link(src, dest):
+    """Hard-link src to dest, replacing dest atomically; copies across filesystems"""
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    tmp_path = f'{dest}.tmp-{uuid.uuid4().hex}'
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+class AudioCache:
+    """Content-addressed, size-bounded LRU store of audio files on disk.
+
+    Files are written to a temp name inside the cache directory and renamed into
+    place, so readers never see a partially written entry. The in-memory index
+    is rebuilt from the directory on startup, oldest access first.
+
+    Eviction skips entries that are being read (reading()), and paths that
+    outlive the request are handed out as links outside the cache
+    (export()), so evicting an entry never removes a file someone is using.
+    """
+
+    def __init__(self, root, max_bytes, suffix='.wav'):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._pins = Counter()
+        self._lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.tmp-'):
+                # Leftover from a write interrupted by a crash
+                os.unlink(path)
+                continue
+            if not name.endswith(self.suffix):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_atime, name[:-len(self.suffix)], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def path_for(self, key):
+        return os.path.join(self.root, key + self.suffix)
+
+    def temp_path(self):
+        """Path inside the cache directory to write a new entry to before commit()"""
+        return os.path.join(self.root, f'.tmp-{uuid.uuid4().hex}{self.suffix}')
+
+    def get(self, key):
+        """Return the path of a cached entry, or None on a miss.
+
+        The entry can be evicted as soon as this returns; use reading() or
+        export() to use the file afterwards.
+        """
+        with self._lock:
+            return self._lookup(key)
+
+    def _lookup(self, key):
+        if key in self._index and os.path.exists(self.path_for(key)):
+            self._index.move_to_end(key)
+            self.hits += 1
+            return self.path_for(key)
+        self._total_bytes -= self._index.pop(key, 0)
+        self.misses += 1
+        return None
+
+    @contextmanager
+    def reading(self, key):
+        """Path of a cached entry (or None) that is not evicted until the block exits"""
+        with self._lock:
+            path = self._lookup(key)
+            if path:
+                self._pins[key] += 1
+        try:
+            yield path
+        finally:
+            if path:
+                with self._lock:
+                    self._pins[key] -= 1
+                    if not self._pins[key]:
+                        del self._pins[key]
+                    # Eviction skipped it while pinned
+                    self._evict()
+
+    def export(self, key, dest):
+        """Link a cached entry to dest and return dest, or None on a miss.
+
+        dest is a hard link (a copy on another filesystem), so it stays
+        readable after the entry is evicted.
+        """
+        with self.reading(key) as path:
+            if path is None:
+                return None
+            _link(path, dest)
+            return dest
+
+    def commit(self, key, tmp_path, export_to=None):
+        """Atomically move a fully written temp file into the cache.
+
+        With export_to, the file is also linked there first, as by export().
+        """
+        path = self.path_for(key)
+        size = os.path.getsize(tmp_path)
+        if export_to:
+            _link(tmp_path, export_to)
+
+        # Renamed under the lock, so a concurrent eviction cannot unlink the new file
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._total_bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+        return path
+
+    def put_bytes(self, key, data):
+        tmp_path = self.temp_path()
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self.commit(key, tmp_path)
+
+    def _evict(self):
+        # Oldest first; never the entry that was just written, or one being read
+        for key in list(self._index)[:-1]:
+            if self._total_bytes <= self.max_bytes:
+                break
+            if self._pins[key]:
+                continue
+            size = self._index.pop(key)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._index),
+                'size_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
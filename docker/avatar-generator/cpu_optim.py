@@ -0,0 +1,281 @@
+import copy
+import os
+import time
+from contextlib import nullcontext
+
+import numpy as np
+import torch
+
+# Dynamic quantization only covers these; Conv layers stay fp32
+QUANTIZABLE_MODULES = {torch.nn.Linear, torch.nn.LSTM, torch.nn.GRU}
+PARITY_TEXT = "Thanks for joining me today, let's talk about your startup."
+ONNX_OPSET = 13
+# VITS sampling settings for the TTS parity run; None keeps the model's value
+PARITY_SETTINGS = {'inference_noise_scale': 0.0, 'inference_noise_scale_dp': 0.0, 'length_scale': None}
+
+_inference_mode = False
+
+
+def inference_context():
+    """torch.inference_mode() once the CPU backend is enabled, otherwise a no-op"""
+    return torch.inference_mode() if _inference_mode else nullcontext()
+
+
+def configure_threads(workers):
+    """Split the cores between concurrent job workers so they do not oversubscribe"""
+    cores = os.cpu_count() or 1
+    intra = int(os.getenv('CPU_INTRA_OP_THREADS', '0')) or max(1, cores // workers)
+    inter = int(os.getenv('CPU_INTER_OP_THREADS', '0')) or 1
+
+    torch.set_num_threads(intra)
+    try:
+        torch.set_num_interop_threads(inter)
+    except RuntimeError:
+        # Can only be set before the first inter-op parallel work runs
+        pass
+
+    return {
+        'intra_op_threads': torch.get_num_threads(),
+        'inter_op_threads': torch.get_num_interop_threads()
+    }
+
+
+def quantize(model, shared=()):
+    """Dynamic int8 copy of model; objects in shared are referenced, not copied"""
+    memo = {id(obj): obj for obj in shared if obj is not None}
+    return torch.quantization.quantize_dynamic(
+        copy.deepcopy(model, memo), QUANTIZABLE_MODULES, dtype=torch.qint8
+    )
+
+
+def count_quantized(model):
+    return sum(1 for module in model.modules() if 'quantized.dynamic' in type(module).__module__)
+
+
+def compare(reference, candidate):
+    """Max abs difference, SNR and length ratio of candidate against reference"""
+    reference = np.asarray(reference, dtype=np.float64).ravel()
+    candidate = np.asarray(candidate, dtype=np.float64).ravel()
+    n = min(len(reference), len(candidate))
+    diff = reference[:n] - candidate[:n]
+    noise = float(np.sum(diff ** 2))
+    signal = float(np.sum(reference[:n] ** 2))
+
+    return {
+        'max_abs_diff': float(np.max(np.abs(diff))) if n else 0.0,
+        'snr_db': round(float(10 * np.log10(signal / noise)), 2) if noise > 0 else None,
+        'length_ratio': round(len(candidate) / len(reference), 4) if len(reference) else None
+    }
+
+
+def _mel_filterbank(sample_rate, n_fft, n_mels):
+    """Triangular filters evenly spaced on the mel scale (HTK formula)"""
+    to_mel = lambda hz: 2595 * np.log10(1 + hz / 700)
+    to_hz = lambda mel: 700 * (10 ** (mel / 2595) - 1)
+    edges = to_hz(np.linspace(0, to_mel(sample_rate / 2), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0, np.minimum(rising, falling))
+
+
+def log_mel(audio, sample_rate, n_fft=1024, hop=256, n_mels=80):
+    """Log-mel spectrogram in dB, shape (frames, n_mels)"""
+    audio = np.asarray(audio, dtype=np.float64).ravel()
+    if len(audio) < n_fft:
+        audio = np.pad(audio, (0, n_fft - len(audio)))
+    frames = np.lib.stride_tricks.sliding_window_view(audio, n_fft)[::hop] * np.hanning(n_fft)
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    mel = power @ _mel_filterbank(sample_rate, n_fft, n_mels).T
+    return 10 * np.log10(np.maximum(mel, 1e-10))
+
+
+def mel_distance(reference, candidate, sample_rate):
+    """Mean absolute log-mel difference in dB, with candidate frames stretched to reference length"""
+    ref = log_mel(reference, sample_rate)
+    cand = log_mel(candidate, sample_rate)
+    # Floor both at 50 dB below the reference peak so silence does not dominate
+    floor = ref.max() - 50
+    ref, cand = np.maximum(ref, floor), np.maximum(cand, floor)
+    if len(cand) != len(ref):
+        positions = np.linspace(0, len(cand) - 1, len(ref))
+        cand = np.stack([np.interp(positions, np.arange(len(cand)), band) for band in cand.T], axis=1)
+    return round(float(np.mean(np.abs(ref - cand))), 3)
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+class OnnxGenerator:
+    """Wav2Lip generator executed by ONNX Runtime with the model's call signature"""
+
+    def __init__(self, onnx_path, threads):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, mel_batch, img_batch):
+        out = self.session.run(None, {
+            'mel': mel_batch.cpu().numpy(),
+            'face': img_batch.cpu().numpy()
+        })[0]
+        return torch.from_numpy(out)
+
+
+def export_wav2lip_onnx(model, onnx_path):
+    """Export the Wav2Lip generator with a dynamic batch dimension"""
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    tmp_path = f'{onnx_path}.tmp'
+    torch.onnx.export(
+        model,
+        (torch.zeros(1, 1, 80, 16), torch.zeros(1, 6, 96, 96)),
+        tmp_path,
+        input_names=['mel', 'face'],
+        output_names=['out'],
+        dynamic_axes={'mel': {0: 'batch'}, 'face': {0: 'batch'}, 'out': {0: 'batch'}},
+        opset_version=ONNX_OPSET
+    )
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+def _optimize_wav2lip(lipsync, threads, min_snr_db, onnx_path):
+    generator = torch.Generator().manual_seed(0)
+    mel = torch.randn(8, 1, 80, 16, generator=generator)
+    face = torch.rand(8, 6, 96, 96, generator=generator)
+
+    if onnx_path:
+        stale = not os.path.exists(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(lipsync.checkpoint_path)
+        if stale:
+            export_wav2lip_onnx(lipsync.model, onnx_path)
+        candidate = OnnxGenerator(onnx_path, threads)
+        backend = 'onnxruntime'
+    else:
+        candidate = quantize(lipsync.model)
+        backend = 'dynamic-int8'
+        if not count_quantized(candidate):
+            # The generator is all convolutions: the "int8" copy would be fp32
+            return {
+                'backend': backend,
+                'applicable': False,
+                'quantized_modules': 0,
+                'enabled': False,
+                'reason': 'no Linear/LSTM/GRU layers to quantize; install onnxruntime for the ONNX backend'
+            }
+
+    with torch.inference_mode():
+        reference, fp32_seconds = _timed(lambda: lipsync.model(mel, face).numpy())
+        optimized, optimized_seconds = _timed(lambda: candidate(mel, face).numpy())
+
+    report = compare(reference, optimized)
+    report.update({
+        'backend': backend,
+        'fp32_seconds': round(fp32_seconds, 4),
+        'optimized_seconds': round(optimized_seconds, 4),
+        'enabled': report['snr_db'] is None or report['snr_db'] >= min_snr_db
+    })
+    if backend == 'dynamic-int8':
+        report['quantized_modules'] = count_quantized(candidate)
+    if report['enabled']:
+        lipsync.model = candidate
+    return report
+
+
+def _onnxruntime_available():
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _set_attrs(objects, values):
+    for obj in objects:
+        for name, value in values.items():
+            setattr(obj, name, value)
+
+
+def _optimize_tts(tts, speaker_id, language, max_length_drift, max_mel_db):
+    synthesizer = tts.synthesizer
+    model = synthesizer.tts_model
+    sample_rate = synthesizer.output_sample_rate
+
+    def synthesize():
+        torch.manual_seed(0)
+        with torch.inference_mode():
+            return tts.tts(text=PARITY_TEXT, speaker=speaker_id, language=language)
+
+    candidate = quantize(model, shared=(
+        getattr(model, 'speaker_manager', None),
+        getattr(model, 'language_manager', None)
+    ))
+    # Sampling noise would swamp the quantization error, so compare with it off
+    # and the same length_scale; the production settings come back afterwards
+    settings = {name: getattr(model, name) for name in PARITY_SETTINGS if hasattr(model, name)}
+    parity = {name: value if PARITY_SETTINGS[name] is None else PARITY_SETTINGS[name]
+              for name, value in settings.items()}
+    _set_attrs((model, candidate), parity)
+    try:
+        reference, fp32_seconds = _timed(synthesize)
+        synthesizer.tts_model = candidate
+        optimized, optimized_seconds = _timed(synthesize)
+    except Exception:
+        synthesizer.tts_model = model
+        raise
+    finally:
+        _set_attrs((model, candidate), settings)
+
+    report = compare(reference, optimized)
+    report['mel_distance_db'] = mel_distance(reference, optimized, sample_rate)
+    audio_seconds = len(reference) / sample_rate
+    report.update({
+        'backend': 'dynamic-int8',
+        'quantized_modules': count_quantized(candidate),
+        'fp32_seconds': round(fp32_seconds, 4),
+        'optimized_seconds': round(optimized_seconds, 4),
+        'fp32_rtf': round(fp32_seconds / audio_seconds, 4),
+        'optimized_rtf': round(optimized_seconds / audio_seconds, 4),
+        # Predicted durations can still shift by a frame, so gate on the
+        # time-aligned spectrogram rather than the raw waveform SNR
+        'enabled': abs(report['length_ratio'] - 1) <= max_length_drift and report['mel_distance_db'] <= max_mel_db
+    })
+    if not report['enabled']:
+        synthesizer.tts_model = model
+    return report
+
+
+def optimize(tts, lipsync, speaker_id, language, workers):
+    """Enable the CPU backend for components that pass a parity check against fp32.
+
+    Thread counts come from configure_threads(); YourTTS gets a dynamic int8
+    copy. The Wav2Lip generator runs in ONNX Runtime when it is installed
+    (CPU_OPT_WAV2LIP_ONNX=0 turns that off); dynamic int8 is the fallback,
+    but it has no layers to quantize there and is reported as not
+    applicable. A component keeps its fp32 model if its parity check fails:
+    waveform SNR for Wav2Lip, log-mel distance of a noise-free synthesis for
+    YourTTS. Returns the per-component report.
+    """
+    global _inference_mode
+
+    threads = configure_threads(workers)
+    min_snr_db = float(os.getenv('CPU_OPT_MIN_SNR_DB', '30'))
+    max_length_drift = float(os.getenv('CPU_OPT_MAX_LENGTH_DRIFT', '0.05'))
+    max_mel_db = float(os.getenv('CPU_OPT_MAX_MEL_DB', '2.0'))
+    onnx_path = None
+    if os.getenv('CPU_OPT_WAV2LIP_ONNX', '1' if _onnxruntime_available() else '0') == '1':
+        onnx_path = os.getenv('CPU_OPT_ONNX_PATH', '/app/cache/wav2lip.onnx')
+
+    report = {'threads': threads, 'components': {}}
+    report['components']['wav2lip'] = _optimize_wav2lip(lipsync, threads['intra_op_threads'], min_snr_db, onnx_path)
+    if speaker_id:
+        report['components']['tts'] = _optimize_tts(tts, speaker_id, language, max_length_drift, max_mel_db)
+
+    _inference_mode = True
+    return report
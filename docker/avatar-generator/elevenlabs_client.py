@@ -0,0 +1,112 @@
+import email.utils
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class ElevenLabsClient:
+    """Shared, connection-pooled HTTP client for the ElevenLabs API.
+
+    One keep-alive session is reused for every call. Each call gets separate
+    connect and read timeouts. 429 and 5xx responses, as well as connection
+    errors, are retried with jittered exponential backoff that honors
+    Retry-After; POSTs are not retried after a read timeout. A semaphore
+    caps in-flight requests at the plan's concurrency limit.
+    """
+
+    def __init__(self, api_key, base_url, pool_size=10, concurrency=2,
+                 connect_timeout=3.05, read_timeout=60, max_retries=3,
+                 backoff=0.5, max_backoff=8, max_retry_after=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['xi-api-key'] = api_key
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0), self.max_retry_after)
+
+        # Full jitter keeps many workers from retrying in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    @staticmethod
+    def _can_retry(method, error):
+        """Idempotent requests retry any transport error. Anything else, such as a
+        TTS POST, only retries if the request cannot have reached ElevenLabs:
+        a read timeout means it did, and sending it again would bill it twice."""
+        return method.upper() in IDEMPOTENT_METHODS or isinstance(error, requests.ConnectionError)
+
+    def request(self, method, path, **kwargs):
+        """Send a request, retrying transient failures; returns the final response"""
+        return self._send(method, path, **kwargs)
+
+    @contextmanager
+    def stream(self, method, path, **kwargs):
+        """Streaming request that holds its concurrency slot until the body is consumed"""
+        response = self._send(method, path, hold_slot=True, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            response.close()
+            self._slots.release()
+
+    def _send(self, method, path, hold_slot=False, **kwargs):
+        """Each attempt holds a concurrency slot only for its HTTP exchange, not
+        while backing off. With hold_slot the slot of the returned response is
+        kept, and the caller releases it."""
+        url = f'{self.base_url}{path}'
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            self._slots.acquire()
+            release = True
+            try:
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == self.max_retries or not self._can_retry(method, e):
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                        release = not hold_slot
+                        return response
+                    response.close()
+            finally:
+                if release:
+                    self._slots.release()
+
+            delay = self._retry_delay(response, attempt)
+            print(f"ElevenLabs {method} {path} attempt {attempt + 1} failed, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import cv2
+import numpy as np
+
+from audio_cache import file_fingerprint
+from singleflight import SingleFlight
+
+# Bumped when the entry layout changes, so older entries are rebuilt
+ENTRY_VERSION = 2
+
+
+class FaceCache:
+    """Face boxes and resized face crops per base video, detected once.
+
+    Each entry is a directory named after the video's content hash holding
+    ``raw_boxes.npy`` (N x 4 detector boxes before smoothing), ``boxes.npy``
+    (N x 4, y1/y2/x1/x2, smoothed over all N frames), ``faces.npy``
+    (N x size x size x 3, uint8) and ``meta.json``. Arrays are opened
+    memory-mapped, so concurrent requests share the page cache instead of
+    each holding a copy. Editing the source video changes its hash, which
+    misses the cache and replaces the stale entry. Each video is detected by
+    one caller at a time; lookups of other videos do not wait for it.
+    """
+
+    def __init__(self, root, detect_boxes, smooth_boxes, img_size):
+        self.root = root
+        self.detect_boxes = detect_boxes
+        self.smooth_boxes = smooth_boxes
+        self.img_size = img_size
+        self._loaded = {}
+        self._lock = threading.Lock()
+        self._builds = SingleFlight()
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, fingerprint):
+        return os.path.join(self.root, fingerprint)
+
+    def lookup(self, video_path, frames, count=None):
+        """Return (boxes, faces) for the first count frames (default: all), computing them on a miss.
+
+        Wav2Lip smooths boxes over the frames it is given, so for a prefix the
+        boxes are smoothed over that prefix alone. Only the last few differ
+        from the cached ones; just those are cropped again.
+        """
+        fingerprint = file_fingerprint(video_path)
+        with self._lock:
+            entry = self._loaded.get(fingerprint)
+        if entry is None:
+            entry = self._load(fingerprint)
+        if entry is None or len(entry[0]) != len(frames):
+            entry, _ = self._builds.do(fingerprint, self._build, video_path, fingerprint, frames)
+        with self._lock:
+            self._loaded[fingerprint] = entry
+
+        boxes, faces, raw_boxes = entry
+        if count is None or count >= len(boxes):
+            return boxes, faces
+
+        smoothed = np.asarray(self.smooth_boxes(np.array(raw_boxes[:count])), dtype=np.int32)
+        faces = list(faces[:count])
+        for i in np.flatnonzero(np.any(smoothed != boxes[:count], axis=1)):
+            faces[i] = self._crop(frames[i], smoothed[i])
+        return smoothed, faces
+
+    def _crop(self, frame, box):
+        y1, y2, x1, x2 = box
+        return cv2.resize(frame[y1:y2, x1:x2], (self.img_size, self.img_size))
+
+    def _load(self, fingerprint):
+        entry_dir = self._entry_dir(fingerprint)
+        try:
+            with open(os.path.join(entry_dir, 'meta.json')) as f:
+                if json.load(f).get('version') != ENTRY_VERSION:
+                    return None
+        except (OSError, ValueError):
+            return None
+        return tuple(
+            np.load(os.path.join(entry_dir, name), mmap_mode='r')
+            for name in ('boxes.npy', 'faces.npy', 'raw_boxes.npy')
+        )
+
+    def _build(self, video_path, fingerprint, frames):
+        raw_boxes = np.asarray(self.detect_boxes(frames))
+        boxes = np.asarray(self.smooth_boxes(raw_boxes.copy()), dtype=np.int32)
+        faces = np.stack([self._crop(frame, box) for frame, box in zip(frames, boxes)])
+
+        tmp_dir = os.path.join(self.root, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, 'raw_boxes.npy'), raw_boxes)
+        np.save(os.path.join(tmp_dir, 'boxes.npy'), boxes)
+        np.save(os.path.join(tmp_dir, 'faces.npy'), faces)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({
+                'version': ENTRY_VERSION,
+                'source': os.path.abspath(video_path),
+                'fingerprint': fingerprint,
+                'frames': len(frames),
+                'img_size': self.img_size
+            }, f)
+
+        entry_dir = self._entry_dir(fingerprint)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.rename(tmp_dir, entry_dir)
+        self._remove_stale(video_path, fingerprint)
+
+        return self._load(fingerprint)
+
+    def _remove_stale(self, video_path, fingerprint):
+        """Drop entries built from an earlier version of the same video"""
+        source = os.path.abspath(video_path)
+        for name in os.listdir(self.root):
+            if name == fingerprint:
+                continue
+            entry_dir = self._entry_dir(name)
+            if name.startswith('.tmp-'):
+                continue
+            try:
+                with open(os.path.join(entry_dir, 'meta.json')) as f:
+                    stale = json.load(f).get('source') == source
+            except (OSError, ValueError):
+                continue
+            if stale:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                with self._lock:
+                    self._loaded.pop(name, None)
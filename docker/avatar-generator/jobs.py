@@ -0,0 +1,147 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class QueueFull(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+class JobError(Exception):
+    """Job failure carrying the HTTP status to report it with"""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+class Job:
+    def __init__(self, kind, fn, args, key=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if self.status == 'succeeded':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """Bounded queue of jobs executed by a fixed pool of worker threads.
+
+    submit() raises QueueFull instead of blocking once max_queued jobs are
+    waiting, so callers can shed load. A job submitted with a key is
+    coalesced with a queued or running job that has the same key: the caller
+    gets that job back and shares its result. Finished jobs are kept for
+    polling until max_finished newer jobs have completed.
+    """
+
+    def __init__(self, workers=None, max_queued=None, max_finished=1000):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queued = max_queued or self.workers * 4
+        self.max_finished = max_finished
+        self._queue = queue.Queue(maxsize=self.max_queued)
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._coalesced = 0
+        self._finished = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+
+    def submit(self, kind, fn, *args, key=None):
+        with self._lock:
+            if key is not None and key in self._inflight:
+                self._coalesced += 1
+                return self._inflight[key]
+
+            job = Job(kind, fn, args, key)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull(f'Job queue is full ({self.max_queued} waiting)')
+            self._jobs[job.id] = job
+            if key is not None:
+                self._inflight[key] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                job.result = job.fn(*job.args)
+                job.status = 'succeeded'
+            except JobError as e:
+                job.error, job.error_status = str(e), e.status
+                job.status = 'failed'
+            except Exception as e:
+                job.error, job.error_status = f'{job.kind} failed: {str(e)}', 500
+                job.status = 'failed'
+            finally:
+                job.finished_at = time.time()
+                job.fn = job.args = None
+                with self._lock:
+                    if job.key is not None:
+                        del self._inflight[job.key]
+                    self._running -= 1
+                    self._finished += 1
+                    self._prune()
+                job._done.set()
+                self._queue.task_done()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'running': self._running,
+                'queued': self._queue.qsize(),
+                'max_queued': self.max_queued,
+                'finished': self._finished,
+                'coalesced': self._coalesced
+            }
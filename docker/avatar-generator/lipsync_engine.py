@@ -0,0 +1,247 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+import torch
+
+from face_cache import FaceCache
+
+WAV2LIP_DIR = os.getenv('WAV2LIP_DIR', '/app/Wav2Lip')
+sys.path.insert(0, WAV2LIP_DIR)
+
+import audio  # noqa: E402  (Wav2Lip's audio helpers)
+import face_detection  # noqa: E402
+from models import Wav2Lip  # noqa: E402
+
+# Defaults from Wav2Lip/inference.py
+MEL_STEP_SIZE = 16
+IMG_SIZE = 96
+FACE_DET_BATCH_SIZE = 16
+WAV2LIP_BATCH_SIZE = 128
+PADS = (0, 10, 0, 0)  # top, bottom, left, right
+SMOOTH_WINDOW = 5
+STATIC_FPS = 25.0
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def get_smoothened_boxes(boxes, window):
+    for i in range(len(boxes)):
+        if i + window > len(boxes):
+            chunk = boxes[len(boxes) - window:]
+        else:
+            chunk = boxes[i:i + window]
+        boxes[i] = np.mean(chunk, axis=0)
+    return boxes
+
+
+class Wav2LipEngine:
+    """Resident Wav2Lip model and S3FD face detector.
+
+    Mirrors Wav2Lip/inference.py with its default arguments, but loads the
+    checkpoint and detector once per process instead of once per request.
+    """
+
+    def __init__(self, checkpoint_path, device, face_cache_dir=None):
+        self.device = device
+        self.checkpoint_path = checkpoint_path
+        self.model = self._load_model(checkpoint_path)
+        self.detector = face_detection.FaceAlignment(
+            face_detection.LandmarksType._2D, flip_input=False, device=device
+        )
+        # The detector keeps per-call state and is not safe to share across threads
+        self._detector_lock = threading.Lock()
+        self.face_cache = FaceCache(face_cache_dir, self.detect_boxes, self.smooth_boxes, IMG_SIZE) if face_cache_dir else None
+
+    def _load_model(self, checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+        state = {k.replace('module.', ''): v for k, v in checkpoint['state_dict'].items()}
+        model = Wav2Lip()
+        model.load_state_dict(state)
+        return model.to(self.device).eval()
+
+    def read_frames(self, face_path):
+        """Return (frames, fps) for a face video or still image"""
+        if face_path.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(face_path)
+            if frame is None:
+                raise ValueError(f'Could not read face image: {face_path}')
+            return [frame], STATIC_FPS
+
+        stream = cv2.VideoCapture(face_path)
+        fps = stream.get(cv2.CAP_PROP_FPS)
+        frames = []
+        while True:
+            ok, frame = stream.read()
+            if not ok:
+                break
+            frames.append(frame)
+        stream.release()
+
+        if not frames:
+            raise ValueError(f'Could not read face video: {face_path}')
+        return frames, fps
+
+    def mel_chunks(self, audio_path, fps):
+        """Split the audio's mel spectrogram into one window per output frame"""
+        if audio_path.endswith('.wav'):
+            wav = audio.load_wav(audio_path, 16000)
+        else:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                wav_path = os.path.join(tmp_dir, 'audio.wav')
+                subprocess.run(
+                    ['ffmpeg', '-y', '-i', audio_path, '-strict', '-2', wav_path],
+                    capture_output=True, check=True
+                )
+                wav = audio.load_wav(wav_path, 16000)
+
+        mel = audio.melspectrogram(wav)
+        if np.isnan(mel.reshape(-1)).sum() > 0:
+            raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
+
+        chunks = []
+        mel_idx_multiplier = 80. / fps
+        i = 0
+        while True:
+            start_idx = int(i * mel_idx_multiplier)
+            if start_idx + MEL_STEP_SIZE > len(mel[0]):
+                chunks.append(mel[:, len(mel[0]) - MEL_STEP_SIZE:])
+                break
+            chunks.append(mel[:, start_idx:start_idx + MEL_STEP_SIZE])
+            i += 1
+        return chunks
+
+    def detect_faces(self, frames):
+        """Return a smoothed (y1, y2, x1, x2) face box for each frame"""
+        return self.smooth_boxes(self.detect_boxes(frames))
+
+    def detect_boxes(self, frames):
+        """Return the padded (x1, y1, x2, y2) detection for each frame, before smoothing"""
+        predictions = []
+        batch_size = FACE_DET_BATCH_SIZE
+        with self._detector_lock:
+            i = 0
+            while i < len(frames):
+                try:
+                    predictions.extend(
+                        self.detector.get_detections_for_batch(np.array(frames[i:i + batch_size]))
+                    )
+                    i += batch_size
+                except RuntimeError:
+                    if batch_size == 1:
+                        raise RuntimeError('Image too big to run face detection on GPU')
+                    batch_size //= 2
+
+        pady1, pady2, padx1, padx2 = PADS
+        results = []
+        for index, (rect, frame) in enumerate(zip(predictions, frames)):
+            if rect is None:
+                raise ValueError(f'Face not detected in frame {index}! Ensure the video contains a face in all the frames.')
+            y1 = max(0, rect[1] - pady1)
+            y2 = min(frame.shape[0], rect[3] + pady2)
+            x1 = max(0, rect[0] - padx1)
+            x2 = min(frame.shape[1], rect[2] + padx2)
+            results.append([x1, y1, x2, y2])
+        return np.array(results)
+
+    @staticmethod
+    def smooth_boxes(boxes):
+        """Smooth (x1, y1, x2, y2) boxes in place as Wav2Lip does; returns (y1, y2, x1, x2) tuples"""
+        boxes = get_smoothened_boxes(boxes, SMOOTH_WINDOW)
+        return [(int(y1), int(y2), int(x1), int(x2)) for x1, y1, x2, y2 in boxes]
+
+    def precompute(self, face_path):
+        """Detect and cache the faces of a base video ahead of the first request"""
+        if self.face_cache is None or face_path.lower().endswith(IMAGE_EXTENSIONS):
+            return None
+        frames, _ = self.read_frames(face_path)
+        boxes, _ = self.face_cache.lookup(face_path, frames)
+        return len(boxes)
+
+    def _faces(self, face_path, frames, count):
+        """Return (boxes, faces) for the first count frames, from the face cache when possible"""
+        if self.face_cache is not None and not face_path.lower().endswith(IMAGE_EXTENSIONS):
+            return self.face_cache.lookup(face_path, frames, count)
+
+        frames = frames[:count]
+        boxes = self.detect_faces(frames)
+        faces = [cv2.resize(frame[y1:y2, x1:x2], (IMG_SIZE, IMG_SIZE)) for frame, (y1, y2, x1, x2) in zip(frames, boxes)]
+        return boxes, faces
+
+    def _batches(self, frames, boxes, faces, mels, start_frame):
+        img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+
+        for i, m in enumerate(mels):
+            idx = (start_frame + i) % len(boxes)
+            y1, y2, x1, x2 = (int(v) for v in boxes[idx])
+
+            img_batch.append(faces[idx])
+            mel_batch.append(m)
+            frame_batch.append(frames[idx].copy())
+            coords_batch.append((y1, y2, x1, x2))
+
+            if len(img_batch) >= WAV2LIP_BATCH_SIZE or i == len(mels) - 1:
+                img_batch = np.asarray(img_batch)
+                mel_batch = np.asarray(mel_batch)
+
+                img_masked = img_batch.copy()
+                img_masked[:, IMG_SIZE // 2:] = 0
+                img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
+                mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+
+                yield img_batch, mel_batch, frame_batch, coords_batch
+                img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+
+    def __call__(self, audio_path, face_path, start_frame=0):
+        """Lip-sync face_path to audio_path, returning (fps, iterator of BGR frames).
+
+        start_frame offsets into the face video, so consecutive segments of one
+        script continue the base video instead of restarting it.
+        """
+        frames, fps = self.read_frames(face_path)
+        mels = self.mel_chunks(audio_path, fps)
+        boxes, faces = self._faces(face_path, frames, min(len(frames), start_frame + len(mels)))
+        return fps, self._generate(frames, boxes, faces, mels, start_frame)
+
+    def _generate(self, frames, boxes, faces, mels, start_frame):
+        for img_batch, mel_batch, frame_batch, coords_batch in self._batches(frames, boxes, faces, mels, start_frame):
+            img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(self.device)
+            mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(self.device)
+
+            with torch.inference_mode():
+                pred = self.model(mel_batch, img_batch)
+            pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
+
+            for p, frame, (y1, y2, x1, x2) in zip(pred, frame_batch, coords_batch):
+                frame[y1:y2, x1:x2] = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+                yield frame
+
+    def render(self, audio_path, face_path, outfile, start_frame=0):
+        """Lip-sync and mux the result with the audio into outfile, returning the frame count"""
+        fps, frames = self(audio_path, face_path, start_frame)
+        count = 0
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            silent_path = os.path.join(tmp_dir, 'result.avi')
+            writer = None
+            for frame in frames:
+                if writer is None:
+                    frame_h, frame_w = frame.shape[:2]
+                    writer = cv2.VideoWriter(silent_path, cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
+                writer.write(frame)
+                count += 1
+            if writer is None:
+                raise ValueError('No frames were generated')
+            writer.release()
+
+            result = subprocess.run(
+                ['ffmpeg', '-y', '-i', audio_path, '-i', silent_path, '-strict', '-2', '-q:v', '1', outfile],
+                capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f'ffmpeg mux failed: {result.stderr}')
+
+        return count
@@ -0,0 +1,317 @@
+import json
+import os
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+
+from audio_cache import file_fingerprint
+
+# Fragment at every keyframe and write moov first, so a reader can start before ffmpeg exits
+FRAGMENTED_MP4_FLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+# Already valid in MP4, so these are copied instead of re-encoded to AAC
+COPY_AUDIO_EXTENSIONS = {'.mp3', '.m4a', '.aac'}
+STREAM_CHUNK_SIZE = 64 * 1024
+# Bumped when the sidecar index format changes, so old sidecars are rebuilt
+INDEX_VERSION = 2
+# After a failed preparation, mux against the raw base for this long before trying again
+PREPARE_RETRY_SECONDS = 300
+
+
+class MuxBusy(Exception):
+    """Raised when no mux slot frees up within the queue timeout"""
+
+
+def probe_keyframes(video_path):
+    """Codec, duration and keyframe times of the first video stream"""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-skip_frame', 'nokey',
+        '-show_entries', 'stream=codec_name:format=duration:frame=pts_time',
+        '-of', 'json', video_path
+    ], capture_output=True, text=True, check=True)
+    info = json.loads(result.stdout)
+
+    return {
+        'codec': info['streams'][0]['codec_name'],
+        'duration': float(info['format']['duration']),
+        'keyframes': [round(float(frame['pts_time']), 3) for frame in info.get('frames', []) if 'pts_time' in frame]
+    }
+
+
+def probe_duration(media_path):
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', media_path
+    ], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip())
+
+
+def max_keyframe_gap(probe):
+    times = probe['keyframes'] + [probe['duration']]
+    return max((b - a for a, b in zip(times, times[1:])), default=probe['duration'])
+
+
+def prepare_base_video(source_path, cache_dir, gop_seconds=1.0):
+    """Faststart, keyframe-aligned copy of the base video plus a summary of it.
+
+    The prepared file and a JSON sidecar index are cached under cache_dir by
+    the source's content hash, so this runs once per base video. A source
+    that is already H.264 with keyframes at most gop_seconds apart is only
+    remuxed; anything else is re-encoded with a keyframe every gop_seconds,
+    so stream-copied muxes get a fragment at least every gop_seconds.
+    """
+    fingerprint = file_fingerprint(source_path)[:16]
+    prepared_path = os.path.join(cache_dir, f'{fingerprint}.mp4')
+    index_path = os.path.join(cache_dir, f'{fingerprint}.json')
+
+    if os.path.exists(index_path) and os.path.exists(prepared_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION:
+            return index
+
+    os.makedirs(cache_dir, exist_ok=True)
+    source = probe_keyframes(source_path)
+    aligned = source['codec'] == 'h264' and max_keyframe_gap(source) <= gop_seconds + 0.001
+
+    if aligned:
+        video_args = ['-c:v', 'copy']
+    else:
+        video_args = [
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p',
+            '-force_key_frames', f'expr:gte(t,n_forced*{gop_seconds})', '-sc_threshold', '0'
+        ]
+
+    tmp_path = os.path.join(cache_dir, f'.tmp-{uuid.uuid4().hex}.mp4')
+    try:
+        subprocess.run(
+            ['ffmpeg', '-y', '-v', 'error', '-i', source_path, '-map', '0:v:0', '-an']
+            + video_args + ['-movflags', '+faststart', tmp_path],
+            capture_output=True, text=True, check=True
+        )
+        prepared = probe_keyframes(tmp_path)
+        os.replace(tmp_path, prepared_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    index = {
+        'version': INDEX_VERSION,
+        'duration': prepared['duration'],
+        'keyframes': len(prepared['keyframes']),
+        'max_keyframe_gap': round(max_keyframe_gap(prepared), 3),
+        'source': source_path,
+        'fingerprint': fingerprint,
+        'prepared_path': prepared_path,
+        'gop_seconds': gop_seconds,
+        're_encoded': not aligned,
+        'prepared': True
+    }
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(index_path + '.tmp', index_path)
+    return index
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 4)
+
+
+class Muxer:
+    """Audio onto a prepared base video, with at most `workers` ffmpeg processes.
+
+    Video is stream-copied from the prepared base and only read for as long
+    as the audio lasts (an explicit -t; -shortest overshoots by tens of
+    seconds with stream copy), or re-encoded from the original while the base
+    is being prepared or if it could not be. MP3/AAC audio is copied as well.
+    Output is fragmented MP4, written to a temp file and moved into place, or
+    streamed to the caller while it is written. Recent latencies are kept for
+    p50/p95.
+    """
+
+    def __init__(self, cache_dir, workers=2, queue_timeout=30, timeout=300, gop_seconds=1.0):
+        self.cache_dir = cache_dir
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.gop_seconds = gop_seconds
+        self._slots = threading.BoundedSemaphore(workers)
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._prepare_lock = threading.Lock()
+        self._bases = {}
+        self._preparing = {}
+        self._latencies = deque(maxlen=1000)
+        self._failures = 0
+
+    def base(self, base_video_path):
+        """Prepared index for base_video_path, without waiting for preparation.
+
+        The first call starts preparing the base in a background thread (it
+        can be a full re-encode) and returns an index pointing at the
+        unprepared video, so muxes re-encode it instead of copying until the
+        prepared copy is ready. After a failed preparation the unprepared
+        index is kept for PREPARE_RETRY_SECONDS before trying again.
+        """
+        stat = os.stat(base_video_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._bases.get(base_video_path)
+            if cached and cached[0] == stamp and time.monotonic() < cached[2]:
+                return cached[1]
+            owner = self._preparing.get(base_video_path) != stamp
+            if owner:
+                self._preparing[base_video_path] = stamp
+
+        index = self._unprepared(base_video_path, 'preparation in progress')
+        if owner:
+            # Stored before the thread starts, so it cannot replace the thread's result
+            with self._lock:
+                self._bases[base_video_path] = (stamp, index, float('inf'))
+            threading.Thread(target=self._prepare, args=(base_video_path, stamp), daemon=True).start()
+        return index
+
+    def _prepare(self, base_video_path, stamp):
+        with self._prepare_lock:
+            try:
+                index = prepare_base_video(base_video_path, self.cache_dir, self.gop_seconds)
+                expires = float('inf')
+                print(f"Prepared base video: {base_video_path}")
+            except Exception as e:
+                print(f"Base video preparation failed, re-encoding on every mux: {e}")
+                index = self._unprepared(base_video_path, e)
+                expires = time.monotonic() + PREPARE_RETRY_SECONDS
+        with self._lock:
+            # Dropped if the file changed meanwhile; a newer preparation owns it
+            if self._preparing.get(base_video_path) == stamp:
+                del self._preparing[base_video_path]
+                self._bases[base_video_path] = (stamp, index, expires)
+
+    @staticmethod
+    def _unprepared(base_video_path, error):
+        try:
+            duration = probe_duration(base_video_path)
+        except Exception:
+            duration = None
+        return {
+            'source': base_video_path,
+            'prepared_path': base_video_path,
+            'duration': duration,
+            'keyframes': None,
+            'max_keyframe_gap': None,
+            're_encoded': None,
+            'prepared': False,
+            'error': str(error)
+        }
+
+    def _command(self, audio_path, index, output):
+        copy_audio = os.path.splitext(audio_path)[1].lower() in COPY_AUDIO_EXTENSIONS
+        duration = probe_duration(audio_path)
+        if index['duration'] is not None:
+            duration = min(duration, index['duration'])
+        if index['prepared']:
+            video_args = ['-c:v', 'copy']
+        else:
+            # Unknown codec and keyframe spacing: encode as preparation would have
+            video_args = [
+                '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p',
+                '-force_key_frames', f'expr:gte(t,n_forced*{self.gop_seconds})', '-sc_threshold', '0'
+            ]
+        return [
+            'ffmpeg', '-y', '-v', 'error',
+            '-i', index['prepared_path'],
+            '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0',
+            *video_args,
+            '-c:a', 'copy' if copy_audio else 'aac',
+            '-t', f'{duration:.3f}',
+            '-movflags', FRAGMENTED_MP4_FLAGS,
+            '-f', 'mp4', output
+        ]
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise MuxBusy(f'All {self._workers} mux workers busy')
+
+    def _record(self, start, ok):
+        with self._lock:
+            if ok:
+                self._latencies.append(time.perf_counter() - start)
+            else:
+                self._failures += 1
+
+    def mux(self, audio_path, base_video_path, output_path):
+        """Write the muxed video to output_path; raises on ffmpeg failure"""
+        index = self.base(base_video_path)
+        self._acquire()
+        start = time.perf_counter()
+        tmp_path = os.path.join(os.path.dirname(output_path) or '.', f'.tmp-{uuid.uuid4().hex}.mp4')
+        ok = False
+        try:
+            cmd = self._command(audio_path, index, tmp_path)
+            print(f"Running FFmpeg command: {' '.join(cmd)}")
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=self.timeout)
+            if result.returncode != 0:
+                raise RuntimeError(f'FFmpeg error: {result.stderr}')
+            os.replace(tmp_path, output_path)
+            ok = True
+        finally:
+            self._slots.release()
+            self._record(start, ok)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def stream(self, audio_path, base_video_path, output_path):
+        """Yield fragmented MP4 chunks as ffmpeg writes them, saving them to output_path too"""
+        index = self.base(base_video_path)
+        self._acquire()
+        start = time.perf_counter()
+        tmp_path = os.path.join(os.path.dirname(output_path) or '.', f'.tmp-{uuid.uuid4().hex}.mp4')
+        process = None
+        ok = False
+        try:
+            cmd = self._command(audio_path, index, 'pipe:1')
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            written = 0
+            with open(tmp_path, 'wb') as f:
+                for chunk in iter(lambda: process.stdout.read(STREAM_CHUNK_SIZE), b''):
+                    f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+            if process.wait(timeout=self.timeout) != 0:
+                raise RuntimeError(f'FFmpeg exited with {process.returncode}')
+            if not written:
+                raise RuntimeError('FFmpeg produced no output')
+            os.replace(tmp_path, output_path)
+            ok = True
+        finally:
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+            self._slots.release()
+            self._record(start, ok)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            failures = self._failures
+            bases = [entry[1] for entry in self._bases.values()]
+        return {
+            'workers': self._workers,
+            'muxes': len(latencies),
+            'failures': failures,
+            'p50_seconds': _percentile(latencies, 50),
+            'p95_seconds': _percentile(latencies, 95),
+            'base_videos': [
+                {
+                    key: index.get(key)
+                    for key in ('source', 'prepared', 'duration', 'keyframes', 'max_keyframe_gap', 're_encoded', 'error')
+                }
+                for index in bases
+            ]
+        }
@@ -0,0 +1,102 @@
+import os
+import queue
+import re
+import struct
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+
+from audio_cache import normalize_text
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+# Synthesized sentences allowed to wait for lip-sync before TTS pauses
+MAX_PENDING_AUDIO = 2
+
+
+def split_sentences(text):
+    """Split a script into sentences on terminal punctuation"""
+    return [s for s in SENTENCE_BOUNDARY.split(normalize_text(text)) if s]
+
+
+def pipelined_segments(sentences, synthesize, render):
+    """Yield (index, render result) per sentence while TTS runs ahead on another thread.
+
+    synthesize(sentence) returns an audio path and render(index, audio_path)
+    turns it into a segment, so sentence N+1 is being synthesized while
+    sentence N is lip-synced.
+    """
+    audio_queue = queue.Queue(maxsize=MAX_PENDING_AUDIO)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                audio_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for index, sentence in enumerate(sentences):
+                if not put((index, synthesize(sentence))):
+                    return
+        except Exception as e:
+            put((None, e))
+            return
+        put((None, None))
+
+    threading.Thread(target=produce, name='tts-producer', daemon=True).start()
+
+    try:
+        while True:
+            index, item = audio_queue.get()
+            if index is None:
+                if item is not None:
+                    raise item
+                return
+            yield index, render(index, item)
+    finally:
+        stop.set()
+
+
+def concat_segments(segment_paths, output_path):
+    """Join segments with the same codec parameters without re-encoding"""
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as list_file:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_file.name, '-c', 'copy', output_path],
+            capture_output=True, text=True
+        )
+    finally:
+        os.unlink(list_file.name)
+
+    if result.returncode != 0:
+        raise RuntimeError(f'ffmpeg concat failed: {result.stderr}')
+    return output_path
+
+
+def wav_stream_header(sample_rate, channels=1, sample_width=2):
+    """RIFF/WAVE header for a PCM stream whose length is not known up front"""
+    unknown = 0xFFFFFFFF
+    byte_rate = sample_rate * channels * sample_width
+    return (
+        b'RIFF' + struct.pack('<I', unknown) + b'WAVE'
+        + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate, byte_rate,
+                                channels * sample_width, sample_width * 8)
+        + b'data' + struct.pack('<I', unknown)
+    )
+
+
+def to_pcm16(wav):
+    """Peak-normalized 16-bit PCM, matching how the TTS synthesizer saves WAVs"""
+    wav = np.asarray(wav, dtype=np.float32)
+    peak = float(np.max(np.abs(wav))) if wav.size else 0.0
+    return (wav * (32767 / max(0.01, peak))).astype(np.int16).tobytes()
@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+"""Install the model files listed in models.json.
+
+Every file is downloaded once into a content-addressed cache
+(blobs/<sha256>) shared by all models and images, then hard-linked into
+its target directory, or copied where the cache is on another filesystem
+(such as a Docker build cache mount). Each target directory keeps a
+.provisioned.json stamp, so a run where everything is already installed
+only stats files. Files should have their size and sha256 pinned in the
+manifest. An unpinned file is still installed, with a warning: a Hugging
+Face file is checked against the Hub's metadata, anything else is trusted
+as downloaded. --require-pinned (or PROVISION_REQUIRE_PINNED=1) refuses
+unpinned files instead. To pin a model, run once with --pin: its size and
+sha256 are written back into the manifest for review.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MANIFEST_PATH = Path(__file__).with_name('models.json')
+DEFAULT_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', os.path.expanduser('~/.cache/agentvc/models'))
+DEFAULT_ENDPOINT = os.getenv('HF_ENDPOINT', 'https://huggingface.co')
+REQUIRE_PINNED = os.getenv('PROVISION_REQUIRE_PINNED') == '1'
+STAMP_NAME = '.provisioned.json'
+BUFFER_SIZE = 1024 * 1024
+# Files at least this large are fetched as several concurrent byte ranges
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+TIMEOUT = (5, 60)
+
+
+class ChecksumMismatch(Exception):
+    """Raised when a file does not match its expected size or checksum"""
+
+
+class RangeNotSupported(Exception):
+    """Raised when the server answers a Range request with the whole file"""
+
+
+def make_session(pool_size):
+    """One keep-alive session shared by every download thread"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=3)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    token = os.getenv('HF_TOKEN')
+    if token:
+        session.headers['Authorization'] = f'Bearer {token}'
+    return session
+
+
+def fetch_hf_metadata(session, endpoint, repo, revision):
+    """Size and checksums of every file in a Hugging Face repo, from the tree API.
+
+    LFS files (the ONNX weights) carry their SHA-256; small files stored
+    directly in git only carry the git blob SHA-1.
+    """
+    url = f'{endpoint}/api/models/{repo}/tree/{revision}?recursive=true'
+    metadata = {}
+    while url:
+        response = session.get(url, timeout=TIMEOUT)
+        response.raise_for_status()
+        for entry in response.json():
+            if entry.get('type') != 'file':
+                continue
+            lfs = entry.get('lfs')
+            metadata[entry['path']] = {
+                'size': entry['size'],
+                'sha256': lfs['oid'] if lfs else None,
+                'git_oid': None if lfs else entry['oid']
+            }
+        url = response.links.get('next', {}).get('url')
+    return metadata
+
+
+def file_digests(path):
+    """SHA-256 and git blob SHA-1 of a file in one read"""
+    sha256 = hashlib.sha256()
+    git_sha1 = hashlib.sha1(f'blob {path.stat().st_size}\0'.encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BUFFER_SIZE), b''):
+            sha256.update(block)
+            git_sha1.update(block)
+    return sha256.hexdigest(), git_sha1.hexdigest()
+
+
+def verify(path, expected):
+    """Check whatever of size, sha256 and git_oid is known; returns the file's SHA-256"""
+    size = path.stat().st_size
+    if expected.get('size') is not None and size != expected['size']:
+        raise ChecksumMismatch(f'{path.name}: expected {expected["size"]} bytes, got {size}')
+
+    sha256, git_oid = file_digests(path)
+    if expected.get('sha256') and sha256 != expected['sha256']:
+        raise ChecksumMismatch(f'{path.name}: SHA-256 {sha256} does not match {expected["sha256"]}')
+    if expected.get('git_oid') and git_oid != expected['git_oid']:
+        raise ChecksumMismatch(f'{path.name}: git oid {git_oid} does not match {expected["git_oid"]}')
+    return sha256
+
+
+def fetch_range(session, url, part_path, start, end):
+    """Write bytes start..end (inclusive) into part_path at their offset"""
+    with open(part_path, 'r+b') as f:
+        response = session.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True, timeout=TIMEOUT)
+        response.raise_for_status()
+        if response.status_code != 206:
+            response.close()
+            raise RangeNotSupported(f'Server ignored the Range header for {url}')
+        f.seek(start)
+        for block in response.iter_content(BUFFER_SIZE):
+            f.write(block)
+
+
+def download_multipart(session, url, part_path, size, connections):
+    """Fetch size bytes as `connections` concurrent ranges; finished ranges survive restarts"""
+    progress_path = part_path.with_name(part_path.name + '.json')
+    part_size = -(-size // connections)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    done = set()
+    if part_path.exists() and part_path.stat().st_size == size and progress_path.exists():
+        done = {tuple(r) for r in json.loads(progress_path.read_text())['done']}
+    else:
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+    lock = threading.Lock()
+
+    def fetch(byte_range):
+        fetch_range(session, url, part_path, *byte_range)
+        with lock:
+            done.add(byte_range)
+            progress_path.write_text(json.dumps({'done': sorted(done)}))
+
+    pending = [r for r in ranges if r not in done]
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        for future in [pool.submit(fetch, r) for r in pending]:
+            future.result()
+    progress_path.unlink(missing_ok=True)
+
+
+def download_stream(session, url, part_path):
+    """Single stream download that resumes from the bytes already in part_path"""
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    response = session.get(url, headers=headers, stream=True, timeout=TIMEOUT)
+    if response.status_code == 416:
+        # Already complete
+        return
+    response.raise_for_status()
+
+    # 200 means the server ignored the Range header: start over
+    mode = 'ab' if response.status_code == 206 else 'wb'
+    with open(part_path, mode) as f:
+        for block in response.iter_content(BUFFER_SIZE):
+            f.write(block)
+
+
+def download(session, url, part_path, size, connections):
+    """Download url into the resumable part_path"""
+    if size is not None and size >= MULTIPART_THRESHOLD and connections > 1:
+        try:
+            download_multipart(session, url, part_path, size, connections)
+            return
+        except RangeNotSupported:
+            part_path.unlink()
+            part_path.with_name(part_path.name + '.json').unlink(missing_ok=True)
+    download_stream(session, url, part_path)
+
+
+def place(src, dst, link=True):
+    """Put src at dst atomically: a hard link if possible, else a copy. Returns True if linked"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f'.{dst.name}.tmp-{uuid.uuid4().hex}')
+    linked = False
+    if link:
+        try:
+            os.link(src, tmp)
+            linked = True
+        except OSError:
+            # Different filesystem, or no hard links
+            pass
+    if not linked:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    return linked
+
+
+class ModelCache:
+    """Content-addressed model store shared across models, checkouts and image builds.
+
+    blobs/ab/<sha256> holds each file once, read-only so that a consumer
+    writing through a hard link fails instead of corrupting the cache.
+    refs/ maps the URL of a file without a pinned hash to the blob it
+    produced, unpacked/<sha256>/ holds extracted archives, and tmp/ holds
+    partial downloads keyed by URL so they resume across runs.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        for sub in ('blobs', 'refs', 'unpacked', 'tmp'):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+
+    def blob(self, sha256):
+        return self.root / 'blobs' / sha256[:2] / sha256
+
+    def has(self, sha256):
+        return sha256 is not None and self.blob(sha256).exists()
+
+    def intact(self, sha256):
+        return file_digests(self.blob(sha256))[0] == sha256
+
+    def part_path(self, url):
+        return self.root / 'tmp' / (hashlib.sha256(url.encode()).hexdigest() + '.part')
+
+    def _ref_path(self, url):
+        return self.root / 'refs' / hashlib.sha256(url.encode()).hexdigest()
+
+    def ref(self, url):
+        """Blob hash a previous run downloaded from url, if it is still cached"""
+        try:
+            sha256 = self._ref_path(url).read_text().strip()
+        except FileNotFoundError:
+            return None
+        return sha256 if self.has(sha256) else None
+
+    def set_ref(self, url, sha256):
+        path = self._ref_path(url)
+        tmp = path.with_name(f'.tmp-{uuid.uuid4().hex}')
+        tmp.write_text(sha256)
+        os.replace(tmp, path)
+
+    def add(self, path, sha256, move):
+        """Store the verified file at path as blob sha256 (moving it, or linking/copying it in)"""
+        blob = self.blob(sha256)
+        if blob.exists():
+            if move:
+                path.unlink()
+            return blob
+        blob.parent.mkdir(exist_ok=True)
+        tmp = blob.with_name(f'.tmp-{uuid.uuid4().hex}')
+        if move:
+            os.replace(path, tmp)
+        else:
+            place(path, tmp)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, blob)
+        return blob
+
+    def unpacked(self, sha256):
+        """Directory with the contents of zip blob sha256, extracted once.
+
+        Members are flattened to their base names, as Coqui TTS does when it
+        unpacks a model archive itself.
+        """
+        directory = self.root / 'unpacked' / sha256
+        if directory.exists():
+            return directory
+        tmp = self.root / 'unpacked' / f'.tmp-{uuid.uuid4().hex}'
+        tmp.mkdir()
+        try:
+            with zipfile.ZipFile(self.blob(sha256)) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    dst = tmp / os.path.basename(member.filename)
+                    with archive.open(member) as src, open(dst, 'wb') as f:
+                        shutil.copyfileobj(src, f, BUFFER_SIZE)
+                    os.chmod(dst, 0o444)
+            os.rename(tmp, directory)
+        except OSError:
+            if not directory.exists():
+                raise
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp)
+        return directory
+
+
+def load_stamps(target):
+    try:
+        with open(target / STAMP_NAME) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_stamps(target, stamps):
+    target.mkdir(parents=True, exist_ok=True)
+    tmp = target / f'{STAMP_NAME}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(stamps, f, indent=2, sort_keys=True)
+    os.replace(tmp, target / STAMP_NAME)
+
+
+def make_stamp(path, sha256, source, archive=None):
+    stat = path.stat()
+    stamp = {'sha256': sha256, 'source': source, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if archive:
+        stamp['archive'] = archive
+    return stamp
+
+
+def is_current(path, stamp, source, mutable=False):
+    """True if path is still the file stamp recorded, installed from blob source (if known)"""
+    if stamp is None or not path.exists():
+        return False
+    if source is not None and stamp['source'] != source:
+        return False
+    if mutable:
+        # Rewritten in place by its consumer; presence is all that can be checked
+        return True
+    stat = path.stat()
+    return (stat.st_size, stat.st_mtime_ns) == (stamp['size'], stamp['mtime_ns'])
+
+
+class Item:
+    """One download unit: a model file, or a model's whole archive"""
+
+    def __init__(self, model, target, url, entry, path=None, archive=None):
+        self.model = model
+        self.target = target
+        self.url = url
+        self.entry = entry
+        self.path = path
+        self.archive = archive
+        self.expected = {'size': entry.get('size'), 'sha256': entry.get('sha256'), 'git_oid': None}
+        self.observed = None
+
+    @property
+    def name(self):
+        return f'{self.model}/{self.path}' if self.path else f'{self.model} (archive)'
+
+    @property
+    def pinned(self):
+        """True if the manifest itself gives the size and sha256 (not just the Hub's metadata)"""
+        return self.entry.get('size') is not None and bool(self.entry.get('sha256'))
+
+
+def model_items(name, model, root, endpoint):
+    target = Path(model['target'])
+    if not target.is_absolute():
+        target = Path(root) / target
+
+    if 'archive' in model:
+        archive = model['archive']
+        return [Item(name, target, archive['url'], archive, archive=archive)]
+
+    items = []
+    hf = model.get('huggingface')
+    for entry in model['files']:
+        if 'url' in entry:
+            url = entry['url']
+        else:
+            url = f"{endpoint}/{hf['repo']}/resolve/{hf.get('revision', 'main')}/{entry['path']}"
+        items.append(Item(name, target, url, entry, path=entry['path']))
+    return items
+
+
+class Provisioner:
+    def __init__(self, manifest, cache, session, endpoint, connections):
+        self.manifest = manifest
+        self.cache = cache
+        self.session = session
+        self.endpoint = endpoint
+        self.connections = connections
+        self._lock = threading.Lock()
+        self._stamps = {}
+        self._hf_metadata = {}
+
+    def stamps(self, target):
+        with self._lock:
+            if target not in self._stamps:
+                self._stamps[target] = load_stamps(target)
+            return self._stamps[target]
+
+    def _record(self, target, key, stamp):
+        with self._lock:
+            self._stamps[target][key] = stamp
+
+    def save(self):
+        with self._lock:
+            for target, stamps in self._stamps.items():
+                save_stamps(target, stamps)
+
+    def _fill_from_huggingface(self, item):
+        """Expected size and checksums from the Hub for files the manifest does not pin"""
+        hf = self.manifest['models'][item.model].get('huggingface')
+        if not hf or item.expected['sha256']:
+            return
+        key = (hf['repo'], hf.get('revision', 'main'))
+        with self._lock:
+            metadata = self._hf_metadata.get(key)
+        if metadata is None:
+            metadata = fetch_hf_metadata(self.session, self.endpoint, *key)
+            with self._lock:
+                self._hf_metadata[key] = metadata
+        if item.path not in metadata:
+            raise FileNotFoundError(f'{item.path} is not in {key[0]}@{key[1]}')
+        for field, value in metadata[item.path].items():
+            if item.expected.get(field) is None:
+                item.expected[field] = value
+
+    def _is_current(self, item):
+        stamps = self.stamps(item.target)
+        source = item.expected['sha256']
+        if item.archive is None:
+            return is_current(item.target / item.path, stamps.get(item.path), source)
+
+        copies = set(item.archive.get('copy', ()))
+        members = {key: stamp for key, stamp in stamps.items() if stamp.get('archive') == item.url}
+        return bool(members) and all(
+            is_current(item.target / key, stamp, source, mutable=key in copies)
+            for key, stamp in members.items()
+        )
+
+    def _adopt(self, item):
+        """Take an installed file that predates the stamp (e.g. from an older download) into the cache"""
+        path = item.target / item.path
+        if not path.exists():
+            return None
+        if item.expected['size'] is not None and path.stat().st_size != item.expected['size']:
+            return None
+        try:
+            sha256 = verify(path, item.expected)
+        except ChecksumMismatch:
+            return None
+        self.cache.add(path, sha256, move=False)
+        return sha256
+
+    def _cached(self, item):
+        """Blob hash for item if the cache has it"""
+        sha256 = item.expected['sha256']
+        if not self.cache.has(sha256):
+            sha256 = None if item.expected['sha256'] else self.cache.ref(item.url)
+        if sha256 and item.archive is None:
+            path = item.target / item.path
+            if path.exists() and path.samefile(self.cache.blob(sha256)) and not self.cache.intact(sha256):
+                # The install is out of date yet is the blob itself: it was
+                # written through the hard link, so the cached copy is damaged too
+                print(f"⚠️  Cached copy of {item.name} was modified; downloading it again")
+                self.cache.blob(sha256).unlink()
+                return None
+        return sha256
+
+    def _fetch(self, item):
+        """Blob hash for item, downloading and verifying it unless the cache has it"""
+        cached = self._cached(item)
+        if cached:
+            return cached
+        if not item.expected['sha256']:
+            self._fill_from_huggingface(item)
+            cached = self._cached(item)
+            if cached:
+                return cached
+
+        if item.archive is None:
+            adopted = self._adopt(item)
+            if adopted:
+                print(f"♻️  Adopted: {item.name}")
+                return adopted
+
+        print(f"📥 Downloading: {item.name}")
+        part_path = self.cache.part_path(item.url)
+        download(self.session, item.url, part_path, item.expected['size'], self.connections)
+        try:
+            sha256 = verify(part_path, item.expected)
+        except ChecksumMismatch:
+            # A corrupt partial file would poison every resume
+            part_path.unlink()
+            raise
+        self.cache.add(part_path, sha256, move=True)
+        self.cache.set_ref(item.url, sha256)
+        return sha256
+
+    def _install(self, item, sha256):
+        if item.archive is None:
+            path = item.target / item.path
+            if not (path.exists() and path.samefile(self.cache.blob(sha256))):
+                place(self.cache.blob(sha256), path)
+            self._record(item.target, item.path, make_stamp(path, sha256, sha256))
+            return
+
+        copies = set(item.archive.get('copy', ()))
+        for member in sorted(self.cache.unpacked(sha256).iterdir()):
+            path = item.target / member.name
+            place(member, path, link=member.name not in copies)
+            member_sha256, _ = file_digests(path)
+            self._record(item.target, member.name, make_stamp(path, member_sha256, sha256, archive=item.url))
+
+    def provision(self, item):
+        """Make item current; returns True if anything had to be done"""
+        if self._is_current(item):
+            print(f"⏭️  Up to date: {item.name}")
+            return False
+        sha256 = self._fetch(item)
+        self._install(item, sha256)
+        print(f"✅ Installed: {item.name}")
+        return True
+
+    def check(self, item, require_pinned=False):
+        """--verify-only: list of problems with item as installed, without changing anything"""
+        stamps = self.stamps(item.target)
+        unpinned = [f'{item.name}: size and sha256 are not pinned in the manifest'] if require_pinned and not item.pinned else []
+        if item.archive is None:
+            path = item.target / item.path
+            if not path.exists():
+                return [f'{item.name}: missing']
+            expected = item.expected
+            stamp = stamps.get(item.path)
+            if not item.pinned and stamp:
+                # Nothing pinned to compare with; at least catch changes since the install
+                expected = {'sha256': stamp['sha256']}
+            try:
+                verify(path, expected)
+            except ChecksumMismatch as e:
+                return unpinned + [str(e)]
+            return unpinned
+
+        copies = set(item.archive.get('copy', ()))
+        members = {key: stamp for key, stamp in stamps.items() if stamp.get('archive') == item.url}
+        if not members:
+            return [f'{item.name}: not installed']
+        problems = unpinned
+        if item.expected['sha256'] and any(s['source'] != item.expected['sha256'] for s in members.values()):
+            problems.append(f'{item.name}: installed from a different archive than the pinned one')
+        for key, stamp in sorted(members.items()):
+            path = item.target / key
+            if not path.exists():
+                problems.append(f'{item.model}/{key}: missing')
+            elif key not in copies and file_digests(path)[0] != stamp['sha256']:
+                problems.append(f'{item.model}/{key}: SHA-256 does not match the archive')
+        return problems
+
+    def observe(self, item):
+        """Size and SHA-256 of what is installed for item, for --pin"""
+        stamps = self.stamps(item.target)
+        if item.archive is None:
+            stamp = stamps.get(item.path)
+            return stamp and {'size': stamp['size'], 'sha256': stamp['sha256']}
+        sources = {s['source'] for s in stamps.values() if s.get('archive') == item.url}
+        if len(sources) != 1 or not self.cache.has(next(iter(sources))):
+            return None
+        sha256 = sources.pop()
+        return {'size': self.cache.blob(sha256).stat().st_size, 'sha256': sha256}
+
+
+def load_manifest(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp = Path(f'{path}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    os.replace(tmp, path)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Install models from the model manifest')
+    parser.add_argument('models', nargs='*', help='models to install (default: all)')
+    parser.add_argument('--manifest', type=Path, default=MANIFEST_PATH)
+    parser.add_argument('--root', type=Path, default=Path.cwd(), help='base for relative targets')
+    parser.add_argument('--cache-dir', type=Path, default=Path(DEFAULT_CACHE_DIR))
+    parser.add_argument('--endpoint', default=DEFAULT_ENDPOINT, help='Hugging Face endpoint (or a local stub)')
+    parser.add_argument('--workers', type=int, default=4, help='files downloaded at once')
+    parser.add_argument('--connections', type=int, default=4, help='ranges per large file')
+    parser.add_argument('--verify-only', action='store_true', help='re-hash installed files; change nothing')
+    parser.add_argument('--pin', action='store_true',
+                        help='record the sizes and hashes of unpinned files in the manifest')
+    parser.add_argument('--require-pinned', action='store_true', default=REQUIRE_PINNED,
+                        help='refuse files without a pinned size and sha256 (default: PROVISION_REQUIRE_PINNED=1)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    manifest = load_manifest(args.manifest)
+    unknown = [name for name in args.models if name not in manifest['models']]
+    if unknown:
+        print(f"❌ Not in {args.manifest}: {', '.join(unknown)}")
+        return 1
+
+    names = args.models or list(manifest['models'])
+    endpoint = args.endpoint.rstrip('/')
+    items = [item for name in names for item in model_items(name, manifest['models'][name], args.root, endpoint)]
+    provisioner = Provisioner(
+        manifest, ModelCache(args.cache_dir), make_session(args.workers * args.connections),
+        endpoint, args.connections
+    )
+
+    unpinned = [item for item in items if not item.pinned]
+    if unpinned and args.require_pinned and not args.pin and not args.verify_only:
+        for item in unpinned:
+            print(f"❌ {item.name}: size and sha256 are not pinned in {args.manifest}")
+        print("Refusing to install unverified files; run with --pin to download and record them")
+        return 1
+    if unpinned and not args.pin and not args.verify_only:
+        for item in unpinned:
+            hub = 'huggingface' in manifest['models'][item.model] and item.archive is None
+            check = 'checked against the Hugging Face metadata' if hub else 'installed without verification'
+            print(f"⚠️  {item.name}: not pinned in {args.manifest}; {check}")
+
+    if args.verify_only:
+        problems = [problem for item in items for problem in provisioner.check(item, args.require_pinned)]
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            return 1
+        print(f"✅ Verified {len(items)} item(s) of {', '.join(names)}")
+        return 0
+
+    print(f"🚀 Provisioning {', '.join(names)}...")
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(provisioner.provision, item): item for item in items}
+        for future, item in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ Failed to provision {item.name}: {e}")
+                failed.append(item)
+
+    # Written even after failures, so finished files are skipped next time
+    provisioner.save()
+
+    if args.pin:
+        pinned = 0
+        for item in items:
+            observed = provisioner.observe(item)
+            if observed and not item.pinned:
+                item.entry.update(observed)
+                pinned += 1
+        if pinned:
+            save_manifest(args.manifest, manifest)
+            print(f"📌 Pinned {pinned} file(s) in {args.manifest}")
+
+    if failed:
+        return 1
+    print('🎉 All models provisioned')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
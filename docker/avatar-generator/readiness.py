@@ -0,0 +1,60 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Skip(Exception):
+    """Raised inside a startup step that does not apply to this deployment"""
+
+
+class Readiness:
+    """Per-component startup status and load timings.
+
+    The service counts as ready once every registered component is either
+    ready or skipped; a failed component keeps it unready.
+    """
+
+    def __init__(self, components):
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._finished_at = None
+        self._components = {name: {'status': 'pending'} for name in components}
+
+    @contextmanager
+    def component(self, name):
+        start = time.perf_counter()
+        self._set(name, status='loading')
+        try:
+            yield
+        except Skip as e:
+            self._set(name, status='skipped', reason=str(e))
+        except Exception as e:
+            self._set(name, status='failed', error=str(e), seconds=round(time.perf_counter() - start, 3))
+            raise
+        else:
+            self._set(name, status='ready', seconds=round(time.perf_counter() - start, 3))
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self._components[name] = fields
+
+    def finish(self):
+        with self._lock:
+            self._finished_at = time.time()
+
+    @property
+    def ready(self):
+        with self._lock:
+            return self._finished_at is not None and all(
+                c['status'] in ('ready', 'skipped') for c in self._components.values()
+            )
+
+    def report(self):
+        with self._lock:
+            finished_at = self._finished_at
+            components = {name: dict(c) for name, c in self._components.items()}
+        return {
+            'ready': self.ready,
+            'startup_seconds': round((finished_at or time.time()) - self._started_at, 3),
+            'components': components
+        }
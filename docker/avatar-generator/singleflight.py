@@ -0,0 +1,75 @@
+import threading
+
+
+class _Call:
+    def __init__(self, key):
+        self.key = key
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait and get the same result, or the same exception. Nothing is
+    remembered once the call returns, so this is not a cache. Work that does
+    not fit in one function call, such as a streamed response, can hold a
+    key with join() and release it with finish().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._coalesced = 0
+
+    def join(self, key):
+        """Return (call, leader). The leader does the work and must finish(call);
+        anyone else gets the outcome from wait(call)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(key)
+            else:
+                self._coalesced += 1
+        return call, leader
+
+    def finish(self, call, result=None, error=None):
+        """Publish the leader's outcome and release the key; later calls are ignored"""
+        with self._lock:
+            if call.done.is_set():
+                return
+            call.result, call.error = result, error
+            if self._calls.get(call.key) is call:
+                del self._calls[call.key]
+            call.done.set()
+
+    @staticmethod
+    def wait(call):
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn, *args):
+        """Return (result, shared); shared is True if another caller did the work"""
+        call, leader = self.join(key)
+        if not leader:
+            return self.wait(call), True
+
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.finish(call, error=e)
+            raise
+        except BaseException:
+            self.finish(call, error=RuntimeError(f'Call for {key!r} was interrupted'))
+            raise
+        self.finish(call, result=result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'coalesced': self._coalesced}
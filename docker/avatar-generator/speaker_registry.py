@@ -0,0 +1,95 @@
+import os
+import threading
+
+import numpy as np
+
+from audio_cache import file_fingerprint
+
+
+class SpeakerRegistry:
+    """Speaker embeddings for YourTTS voice cloning, computed once per reference WAV.
+
+    Embeddings are keyed by the WAV's content hash, so two paths holding the
+    same sample share one entry. Each registered speaker remembers the mtime
+    and size of its WAV and is re-encoded only when the file changes on disk.
+    Registered ids are installed into the model's speaker manager, so synthesis
+    can pass ``speaker=<id>`` and skip the audio load and encoder pass.
+    """
+
+    def __init__(self, speaker_manager):
+        self._manager = speaker_manager
+        self._speakers = {}
+        self._embeddings = {}
+        self._lock = threading.Lock()
+
+    def register(self, speaker_id, speaker_wav):
+        """Register (or refresh) speaker_id from speaker_wav and return its content hash"""
+        if not os.path.exists(speaker_wav):
+            raise FileNotFoundError(f'Speaker WAV not found: {speaker_wav}')
+
+        stat = os.stat(speaker_wav)
+        fingerprint = file_fingerprint(speaker_wav)
+
+        with self._lock:
+            embedding = self._embeddings.get(fingerprint)
+
+        if embedding is None:
+            embedding = np.asarray(
+                self._manager.compute_embedding_from_clip(speaker_wav),
+                dtype=np.float32
+            )
+
+        with self._lock:
+            self._embeddings.setdefault(fingerprint, embedding)
+            self._speakers[speaker_id] = {
+                'speaker_wav': speaker_wav,
+                'fingerprint': fingerprint,
+                'stamp': (stat.st_mtime_ns, stat.st_size)
+            }
+            self._manager.embeddings_by_names[speaker_id] = [self._embeddings[fingerprint]]
+
+        return fingerprint
+
+    def resolve(self, speaker_id=None, speaker_wav=None):
+        """Return (speaker_id, fingerprint) for a registered id or a reference WAV path"""
+        if speaker_id:
+            with self._lock:
+                entry = self._speakers.get(speaker_id)
+            if entry is None:
+                raise KeyError(f'Unknown speaker_id: {speaker_id}')
+
+            try:
+                stat = os.stat(entry['speaker_wav'])
+                changed = (stat.st_mtime_ns, stat.st_size) != entry['stamp']
+            except FileNotFoundError:
+                # Keep serving the embedding we already have
+                changed = False
+            if changed:
+                return speaker_id, self.register(speaker_id, entry['speaker_wav'])
+            return speaker_id, entry['fingerprint']
+
+        if not speaker_wav:
+            raise ValueError('speaker_id or speaker_wav is required')
+
+        speaker_id = f'wav-{file_fingerprint(speaker_wav)[:16]}'
+        with self._lock:
+            known = speaker_id in self._speakers
+        if known:
+            return self.resolve(speaker_id=speaker_id)
+        return speaker_id, self.register(speaker_id, speaker_wav)
+
+    def embedding(self, speaker_id):
+        """The stored embedding of a registered speaker"""
+        with self._lock:
+            return self._embeddings[self._speakers[speaker_id]['fingerprint']]
+
+    def list(self):
+        with self._lock:
+            return [
+                {
+                    'speaker_id': speaker_id,
+                    'speaker_wav': entry['speaker_wav'],
+                    'fingerprint': entry['fingerprint']
+                }
+                for speaker_id, entry in self._speakers.items()
+            ]
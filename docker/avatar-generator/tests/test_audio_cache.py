@@ -0,0 +1,184 @@
+"""AudioCache hits, LRU eviction, and eviction while entries are in use."""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_cache import AudioCache, cache_key, normalize_text  # noqa: E402
+
+ENTRY_BYTES = 1000
+
+
+def payload(key):
+    return key.encode().ljust(ENTRY_BYTES, b'.')
+
+
+class AudioCacheLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.root = os.path.join(self.tmp, 'cache')
+        self.cache = AudioCache(self.root, 3 * ENTRY_BYTES)
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get('a'))
+        path = self.cache.put_bytes('a', payload('a'))
+        self.assertEqual(self.cache.get('a'), path)
+        self.assertEqual(self.cache.get('a'), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), payload('a'))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (2, 1, 0.6667))
+        self.assertEqual((stats['entries'], stats['size_bytes']), (1, ENTRY_BYTES))
+
+    def test_least_recently_used_is_evicted_first(self):
+        for key in 'abc':
+            self.cache.put_bytes(key, payload(key))
+        self.cache.get('a')
+        self.cache.put_bytes('d', payload('d'))
+
+        self.assertIsNone(self.cache.get('b'))
+        for key in 'acd':
+            self.assertIsNotNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertFalse(os.path.exists(self.cache.path_for('b')))
+
+    def test_overwriting_a_key_keeps_one_entry(self):
+        self.cache.put_bytes('a', payload('a'))
+        self.cache.put_bytes('a', b'shorter')
+        self.assertEqual(self.cache.stats()['size_bytes'], len(b'shorter'))
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+    def test_file_removed_behind_its_back_is_a_miss(self):
+        self.cache.put_bytes('a', payload('a'))
+        os.unlink(self.cache.path_for('a'))
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['size_bytes'], 0)
+
+    def test_index_is_rebuilt_on_restart(self):
+        for key in 'ab':
+            self.cache.put_bytes(key, payload(key))
+        with open(os.path.join(self.root, '.tmp-interrupted.wav'), 'wb') as f:
+            f.write(b'partial')
+
+        reopened = AudioCache(self.root, 3 * ENTRY_BYTES)
+        self.assertEqual(reopened.stats()['size_bytes'], 2 * ENTRY_BYTES)
+        self.assertIsNotNone(reopened.get('a'))
+        self.assertEqual(sorted(os.listdir(self.root)), ['a.wav', 'b.wav'])
+
+    def test_keys_ignore_cosmetic_text_differences(self):
+        self.assertEqual(normalize_text('  Hello\n  world '), 'Hello world')
+        self.assertEqual(cache_key(normalize_text('Hello  world'), 'en'), cache_key('Hello world', 'en'))
+        self.assertNotEqual(cache_key('Hello world', 'en'), cache_key('Hello world', 'fr'))
+
+
+class AudioCacheEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cache = AudioCache(os.path.join(self.tmp, 'cache'), 3 * ENTRY_BYTES)
+
+    def put(self, key):
+        return self.cache.put_bytes(key, payload(key))
+
+    def test_pinned_entry_is_skipped_by_eviction(self):
+        self.put('a')
+        with self.cache.reading('a') as path:
+            for key in 'bcde':
+                self.put(key)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), payload('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNone(self.cache.get('c'))
+        self.assertIsNotNone(self.cache.get('a'))
+
+    def test_eviction_deferred_by_a_pin_runs_on_release(self):
+        with self.cache.reading('missing') as path:
+            self.assertIsNone(path)
+        for key in 'abc':
+            self.put(key)
+        with self.cache.reading('a'), self.cache.reading('b'), self.cache.reading('c'):
+            self.put('d')
+            self.put('e')
+            # Only d could go; the pinned entries wait
+            self.assertEqual(self.cache.stats()['entries'], 4)
+            self.assertEqual(self.cache.stats()['size_bytes'], 4 * ENTRY_BYTES)
+        self.assertLessEqual(self.cache.stats()['size_bytes'], 3 * ENTRY_BYTES)
+        self.assertIsNotNone(self.cache.get('e'))
+
+    def test_export_outlives_eviction(self):
+        self.put('a')
+        dest = os.path.join(self.tmp, 'out', 'a.wav')
+        self.assertEqual(self.cache.export('a', dest), dest)
+        for key in 'bcde':
+            self.put(key)
+        self.assertIsNone(self.cache.get('a'))
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), payload('a'))
+        self.assertIsNone(self.cache.export('a', dest))
+
+    def test_commit_can_export(self):
+        tmp_path = self.cache.temp_path()
+        with open(tmp_path, 'wb') as f:
+            f.write(payload('a'))
+        dest = os.path.join(self.tmp, 'out', 'a.wav')
+        self.cache.commit('a', tmp_path, export_to=dest)
+        for key in 'bcde':
+            self.put(key)
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), payload('a'))
+
+    def test_concurrent_eviction_never_removes_a_file_being_read(self):
+        keys = [f'k{i}' for i in range(12)]
+        for key in keys[:3]:
+            self.put(key)
+        errors = []
+        stop = threading.Event()
+
+        def reader(offset):
+            n = offset
+            while not stop.is_set():
+                key = keys[n % len(keys)]
+                n += 1
+                try:
+                    with self.cache.reading(key) as path:
+                        if path is None:
+                            continue
+                        time.sleep(0.001)
+                        with open(path, 'rb') as f:
+                            if f.read() != payload(key):
+                                errors.append(f'{key}: wrong content')
+                except OSError as e:
+                    errors.append(f'{key}: {e}')
+
+        def writer(offset):
+            n = offset
+            while not stop.is_set():
+                self.put(keys[n % len(keys)])
+                n += 1
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(6)]
+        threads += [threading.Thread(target=writer, args=(i * 5,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stats = self.cache.stats()
+        self.assertGreater(stats['evictions'], 0)
+        self.assertLessEqual(stats['size_bytes'], 3 * ENTRY_BYTES)
+        cached = [name for name in os.listdir(self.cache.root) if not name.startswith('.tmp-')]
+        self.assertEqual(len(cached), stats['entries'])
+
+
+if __name__ == '__main__':
+    unittest.main()
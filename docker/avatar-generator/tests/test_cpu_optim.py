@@ -0,0 +1,60 @@
+"""Wav2Lip backend selection in cpu_optim, with a small convolutional stand-in
+for the generator.
+"""
+import os
+import sys
+import unittest
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cpu_optim  # noqa: E402
+
+
+class ConvGenerator(torch.nn.Module):
+    """Same inputs and output shape as Wav2Lip, and like it only convolutions"""
+
+    def __init__(self):
+        super().__init__()
+        self.face = torch.nn.Conv2d(6, 3, 3, padding=1)
+        self.audio = torch.nn.Conv2d(1, 3, 3, padding=1)
+
+    def forward(self, mel, face):
+        return torch.sigmoid(self.face(face) + self.audio(mel).mean(dim=(2, 3), keepdim=True))
+
+
+class Lipsync:
+    def __init__(self, model):
+        self.model = model
+        self.checkpoint_path = __file__
+
+
+class Wav2LipBackendTest(unittest.TestCase):
+    def test_dynamic_int8_without_quantizable_layers_is_not_applicable(self):
+        model = ConvGenerator().eval()
+        lipsync = Lipsync(model)
+        report = cpu_optim._optimize_wav2lip(lipsync, 1, 30.0, None)
+        self.assertEqual(report['backend'], 'dynamic-int8')
+        self.assertFalse(report['applicable'])
+        self.assertFalse(report['enabled'])
+        self.assertEqual(report['quantized_modules'], 0)
+        self.assertIs(lipsync.model, model)
+
+    def test_dynamic_int8_with_linear_layers_is_benchmarked(self):
+        class WithHead(ConvGenerator):
+            def __init__(self):
+                super().__init__()
+                self.head = torch.nn.Linear(96, 96)
+
+            def forward(self, mel, face):
+                return self.head(super().forward(mel, face))
+
+        report = cpu_optim._optimize_wav2lip(Lipsync(WithHead().eval()), 1, 0.0, None)
+        self.assertEqual(report['quantized_modules'], 1)
+        self.assertNotIn('applicable', report)
+        self.assertIn('optimized_seconds', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""scripts/download-whisper-model.py against the Hub stub from
+test_provision_models: it provisions whisper-tiny-en and writes index.json.
+"""
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_provision_models import FILES, REPO, HubHandler, HubState, sha256  # noqa: E402
+
+SCRIPT = Path(__file__).resolve().parents[3] / 'scripts' / 'download-whisper-model.py'
+spec = importlib.util.spec_from_file_location('download_whisper_model', SCRIPT)
+download_whisper_model = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(download_whisper_model)
+
+
+class DownloadWhisperModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), HubHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.endpoint = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.hub = self.server.state = HubState()
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.target = self.tmp / 'root' / 'public' / 'models' / 'whisper-tiny-en'
+        self.manifest_path = self.tmp / 'models.json'
+        self.manifest_path.write_text(json.dumps({
+            'version': 1,
+            'models': {
+                'whisper-tiny-en': {
+                    'huggingface': {'repo': REPO, 'revision': 'main'},
+                    'target': 'public/models/whisper-tiny-en',
+                    'files': [{'path': path} for path in FILES]
+                }
+            }
+        }))
+
+    def run_main(self, *args):
+        with redirect_stdout(io.StringIO()):
+            return download_whisper_model.main([
+                '--manifest', str(self.manifest_path),
+                '--root', str(self.tmp / 'root'),
+                '--cache-dir', str(self.tmp / 'cache'),
+                '--endpoint', self.endpoint,
+                *args
+            ])
+
+    def read_index(self):
+        return json.loads((self.target / 'index.json').read_text())
+
+    def test_writes_index(self):
+        self.assertEqual(self.run_main(), 0)
+        index = self.read_index()
+        self.assertEqual(index['model_name'], 'whisper-tiny.en')
+        self.assertEqual(index['repo'], REPO)
+        self.assertEqual(index['revision'], 'main')
+        self.assertEqual(index['files'], list(FILES))
+        self.assertIsNotNone(index['downloaded_at'])
+        for path, data in FILES.items():
+            entry = index['manifest'][path]
+            self.assertEqual(entry['size'], len(data))
+            self.assertEqual(entry['sha256'], sha256(data))
+            self.assertEqual(entry['mtime_ns'], (self.target / path).stat().st_mtime_ns)
+
+    def test_index_lists_only_installed_files_after_a_failure(self):
+        self.hub.corrupt.add('tokenizer.json')
+        self.assertEqual(self.run_main(), 1)
+        self.assertEqual(set(self.read_index()['manifest']), set(FILES) - {'tokenizer.json'})
+
+        self.hub.corrupt.clear()
+        self.assertEqual(self.run_main(), 0)
+        self.assertEqual(set(self.read_index()['manifest']), set(FILES))
+
+    def test_rerun_skips_installed_files_and_keeps_downloaded_at(self):
+        self.assertEqual(self.run_main(), 0)
+        downloaded_at = self.read_index()['downloaded_at']
+        self.hub.requests.clear()
+
+        self.assertEqual(self.run_main(), 0)
+        self.assertEqual(self.hub.requests, [])
+        self.assertEqual(self.read_index()['downloaded_at'], downloaded_at)
+
+    def test_verify_only_leaves_index_alone(self):
+        self.assertEqual(self.run_main('--verify-only'), 1)
+        self.assertFalse((self.target / 'index.json').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
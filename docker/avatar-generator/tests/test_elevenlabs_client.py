@@ -0,0 +1,201 @@
+"""ElevenLabsClient against a local http.server stub of the API.
+
+The stub is reached through ELEVENLABS_BASE_URL, the same variable the
+service reads, and replays a scripted list of responses per path.
+"""
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from elevenlabs_client import ElevenLabsClient  # noqa: E402
+
+
+class StubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.script = {}
+        self.hits = {}
+        self.active = 0
+        self.max_active = 0
+
+    def next_action(self, path):
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+            actions = self.script.get(path) or [('ok', 0)]
+            return actions.pop(0) if len(actions) > 1 else actions[0]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        state = self.server.state
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        kind, arg = state.next_action(self.path)
+
+        with state.lock:
+            state.active += 1
+            state.max_active = max(state.max_active, state.active)
+        try:
+            if kind == 'reset':
+                # SO_LINGER 0 turns close() into a TCP RST
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                self.close_connection = True
+                return
+            if kind == 'status':
+                status, headers = arg
+            else:
+                time.sleep(arg)
+                status, headers = 200, {}
+            body = b'audio' * 100 if status == 200 else b'{"detail": "error"}'
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with state.lock:
+                state.active -= 1
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class ElevenLabsClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls._saved_url = os.environ.get('ELEVENLABS_BASE_URL')
+        os.environ['ELEVENLABS_BASE_URL'] = f'http://127.0.0.1:{cls.server.server_address[1]}/v1'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        if cls._saved_url is None:
+            os.environ.pop('ELEVENLABS_BASE_URL', None)
+        else:
+            os.environ['ELEVENLABS_BASE_URL'] = cls._saved_url
+
+    def setUp(self):
+        self.state = self.server.state = StubState()
+
+    def client(self, **kwargs):
+        options = dict(concurrency=2, max_retries=3, backoff=0.01, max_backoff=0.05,
+                       connect_timeout=1, read_timeout=2)
+        options.update(kwargs)
+        client = ElevenLabsClient('test-key', os.environ['ELEVENLABS_BASE_URL'], **options)
+        self.addCleanup(client.session.close)
+        return client
+
+    def test_429_waits_for_retry_after(self):
+        self.state.script['/v1/user'] = [('status', (429, {'Retry-After': '0.3'})), ('ok', 0)]
+        started = time.monotonic()
+        response = self.client().get('/user')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.state.hits['/v1/user'], 2)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    def test_retry_after_is_capped(self):
+        self.state.script['/v1/user'] = [('status', (429, {'Retry-After': '3600'})), ('ok', 0)]
+        started = time.monotonic()
+        self.assertEqual(self.client(max_retry_after=0.1).get('/user').status_code, 200)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_5xx_then_success(self):
+        self.state.script['/v1/text-to-speech/v'] = [
+            ('status', (503, {})), ('status', (500, {})), ('ok', 0)]
+        response = self.client().post('/text-to-speech/v', json={'text': 'hi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.state.hits['/v1/text-to-speech/v'], 3)
+
+    def test_5xx_gives_up_after_max_retries(self):
+        self.state.script['/v1/user'] = [('status', (502, {}))]
+        response = self.client(max_retries=2).get('/user')
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(self.state.hits['/v1/user'], 3)
+
+    def test_connection_reset_is_retried(self):
+        self.state.script['/v1/text-to-speech/v'] = [('reset', None), ('ok', 0)]
+        response = self.client().post('/text-to-speech/v', json={'text': 'hi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.state.hits['/v1/text-to-speech/v'], 2)
+
+    def test_post_read_timeout_is_not_retried(self):
+        self.state.script['/v1/text-to-speech/v'] = [('ok', 1)]
+        with self.assertRaises(requests.ReadTimeout):
+            self.client(read_timeout=0.2).post('/text-to-speech/v', json={'text': 'hi'})
+        self.assertEqual(self.state.hits['/v1/text-to-speech/v'], 1)
+
+    def test_get_read_timeout_is_retried(self):
+        self.state.script['/v1/user'] = [('ok', 1), ('ok', 0)]
+        response = self.client(read_timeout=0.2).get('/user')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.state.hits['/v1/user'], 2)
+
+    def test_concurrency_cap(self):
+        self.state.script['/v1/user'] = [('ok', 0.2)]
+        client = self.client(concurrency=2)
+        threads = [threading.Thread(target=client.get, args=('/user',)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.state.hits['/v1/user'], 6)
+        self.assertEqual(self.state.max_active, 2)
+
+    def test_stream_holds_slot_until_closed(self):
+        client = self.client(concurrency=1)
+        finished = threading.Event()
+        with client.stream('POST', '/text-to-speech/v/stream', json={'text': 'hi'}) as response:
+            self.assertEqual(response.status_code, 200)
+            waiter = threading.Thread(target=lambda: (client.get('/user'), finished.set()))
+            waiter.start()
+            self.assertFalse(finished.wait(0.3))
+            b''.join(response.iter_content(64))
+        waiter.join(2)
+        self.assertTrue(finished.is_set())
+
+    def test_stream_backoff_releases_slot(self):
+        self.state.script['/v1/text-to-speech/v/stream'] = [
+            ('status', (429, {'Retry-After': '1'})), ('ok', 0)]
+        client = self.client(concurrency=1)
+        streamed = threading.Event()
+
+        def stream():
+            with client.stream('POST', '/text-to-speech/v/stream', json={'text': 'hi'}) as response:
+                response.content
+            streamed.set()
+
+        thread = threading.Thread(target=stream)
+        thread.start()
+        time.sleep(0.2)
+        started = time.monotonic()
+        self.assertEqual(client.get('/user').status_code, 200)
+        # Served while the stream was backing off, not after it finished
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertFalse(streamed.is_set())
+        thread.join(5)
+        self.assertTrue(streamed.is_set())
+        self.assertEqual(self.state.hits['/v1/text-to-speech/v/stream'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
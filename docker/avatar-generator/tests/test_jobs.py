@@ -0,0 +1,105 @@
+"""JobQueue: coalescing by key, load shedding, and failure reporting."""
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import JobError, JobQueue, QueueFull  # noqa: E402
+
+
+class Gate:
+    """A job function that blocks until released and counts its runs"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = 0
+
+    def __call__(self, value):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return value
+
+
+class JobQueueTest(unittest.TestCase):
+    def test_same_key_shares_the_job_in_flight(self):
+        jobs = JobQueue(workers=1)
+        gate = Gate()
+        first = jobs.submit('render', gate, 'a', key='k')
+        gate.started.wait(5)
+        queued = jobs.submit('render', gate, 'b', key='other')
+
+        self.assertIs(jobs.submit('render', gate, 'a', key='k'), first)
+        self.assertIs(jobs.submit('render', gate, 'b', key='other'), queued)
+        self.assertEqual(jobs.stats()['coalesced'], 2)
+
+        gate.release.set()
+        self.assertTrue(first.wait(5))
+        self.assertTrue(queued.wait(5))
+        self.assertEqual((first.result, queued.result), ('a', 'b'))
+        self.assertEqual(gate.calls, 2)
+
+    def test_key_is_released_once_the_job_finishes(self):
+        jobs = JobQueue(workers=1)
+        first = jobs.submit('render', lambda: 1, key='k')
+        self.assertTrue(first.wait(5))
+
+        second = jobs.submit('render', lambda: 2, key='k')
+        self.assertIsNot(second, first)
+        self.assertTrue(second.wait(5))
+        self.assertEqual(second.result, 2)
+
+    def test_jobs_without_a_key_are_never_coalesced(self):
+        jobs = JobQueue(workers=1)
+        gate = Gate()
+        running = jobs.submit('render', gate, 1)
+        gate.started.wait(5)
+        self.assertIsNot(jobs.submit('render', gate, 1), jobs.submit('render', gate, 1))
+        gate.release.set()
+        running.wait(5)
+        self.assertEqual(jobs.stats()['coalesced'], 0)
+
+    def test_full_queue_sheds_load_but_still_coalesces(self):
+        jobs = JobQueue(workers=1, max_queued=1)
+        gate = Gate()
+        jobs.submit('render', gate, 0)
+        gate.started.wait(5)
+        waiting = jobs.submit('render', gate, 1, key='k')
+
+        with self.assertRaises(QueueFull):
+            jobs.submit('render', gate, 2)
+        self.assertIs(jobs.submit('render', gate, 1, key='k'), waiting)
+        gate.release.set()
+        self.assertTrue(waiting.wait(5))
+
+    def test_failures_carry_their_status(self):
+        jobs = JobQueue(workers=1)
+
+        def not_found():
+            raise JobError('No such avatar', status=404)
+
+        def broken():
+            raise ValueError('bad frame')
+
+        for fn, status, error in ((not_found, 404, 'No such avatar'), (broken, 500, 'render failed: bad frame')):
+            job = jobs.submit('render', fn)
+            self.assertTrue(job.wait(5))
+            self.assertEqual((job.status, job.error_status, job.error), ('failed', status, error))
+            self.assertEqual(job.to_dict()['error'], error)
+
+    def test_finished_jobs_are_pruned(self):
+        jobs = JobQueue(workers=1, max_finished=2)
+        submitted = [jobs.submit('render', lambda i=i: i) for i in range(4)]
+        for job in submitted:
+            job.wait(5)
+        job = jobs.submit('render', lambda: None)
+        job.wait(5)
+        self.assertIsNone(jobs.get(submitted[0].id))
+        self.assertIs(jobs.get(job.id), job)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+"""Muxer base-video preparation and admission, with ffmpeg/ffprobe mocked out,
+and how api.simple reports a busy muxer.
+"""
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import mux  # noqa: E402
+from mux import MuxBusy, Muxer  # noqa: E402
+
+
+def prepared_index(path, cache_dir=None, gop_seconds=1.0):
+    return {'source': path, 'prepared_path': path, 'duration': 10.0, 'keyframes': 10,
+            'max_keyframe_gap': 1.0, 're_encoded': False, 'prepared': True}
+
+
+class MuxerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.base_path = os.path.join(self.tmp, 'base.mp4')
+        with open(self.base_path, 'wb') as f:
+            f.write(b'video')
+        patcher = mock.patch.object(mux, 'probe_duration', return_value=10.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_prepared(self, muxer):
+        deadline = time.monotonic() + 5
+        while not muxer.base(self.base_path)['prepared']:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_base_does_not_wait_for_preparation(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_prepare(path, cache_dir, gop_seconds):
+            calls.append(path)
+            release.wait(5)
+            return prepared_index(path)
+
+        muxer = Muxer(self.tmp)
+        with mock.patch.object(mux, 'prepare_base_video', slow_prepare):
+            started = time.monotonic()
+            for _ in range(3):
+                index = muxer.base(self.base_path)
+                self.assertFalse(index['prepared'])
+                self.assertEqual(index['prepared_path'], self.base_path)
+            self.assertLess(time.monotonic() - started, 1)
+
+            release.set()
+            self.wait_prepared(muxer)
+        self.assertEqual(calls, [self.base_path])
+
+    def test_failed_preparation_is_retried_after_a_while(self):
+        muxer = Muxer(self.tmp)
+        with mock.patch.object(mux, 'prepare_base_video', side_effect=RuntimeError('no ffmpeg')) as prepare:
+            muxer.base(self.base_path)
+            deadline = time.monotonic() + 5
+            while 'no ffmpeg' not in (muxer.base(self.base_path).get('error') or ''):
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+            self.assertEqual(prepare.call_count, 1)
+
+        later = mock.Mock(monotonic=lambda: time.monotonic() + mux.PREPARE_RETRY_SECONDS + 1)
+        with mock.patch.object(mux, 'prepare_base_video', side_effect=prepared_index):
+            with mock.patch.object(mux, 'time', later):
+                self.assertFalse(muxer.base(self.base_path)['prepared'])
+            self.wait_prepared(muxer)
+
+    def test_busy_when_no_slot_frees_up(self):
+        muxer = Muxer(self.tmp, workers=1, queue_timeout=0.1)
+        with mock.patch.object(mux, 'prepare_base_video', side_effect=prepared_index):
+            self.wait_prepared(muxer)
+        muxer._slots.acquire()
+        try:
+            with self.assertRaises(MuxBusy):
+                muxer.mux(self.base_path, self.base_path, os.path.join(self.tmp, 'out.mp4'))
+        finally:
+            muxer._slots.release()
+
+
+class MuxerCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.muxer = Muxer(self.tmp)
+        patcher = mock.patch.object(mux, 'probe_duration', lambda path: 4.0 if path.endswith('.mp3') else 10.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def option(self, cmd, flag):
+        return cmd[cmd.index(flag) + 1]
+
+    def test_prepared_base_is_stream_copied_for_as_long_as_the_audio(self):
+        cmd = self.muxer._command('speech.mp3', prepared_index('base.mp4'), 'out.mp4')
+        self.assertEqual(self.option(cmd, '-c:v'), 'copy')
+        self.assertEqual(self.option(cmd, '-c:a'), 'copy')
+        self.assertEqual(self.option(cmd, '-t'), '4.000')
+        self.assertEqual(cmd[-1], 'out.mp4')
+
+    def test_unprepared_base_is_re_encoded(self):
+        index = Muxer._unprepared('base.mp4', 'preparation in progress')
+        cmd = self.muxer._command('speech.wav', index, 'pipe:1')
+        self.assertEqual(self.option(cmd, '-c:v'), 'libx264')
+        self.assertEqual(self.option(cmd, '-c:a'), 'aac')
+
+    def test_audio_longer_than_the_base_is_cut_to_it(self):
+        index = dict(prepared_index('base.mp4'), duration=2.5)
+        self.assertEqual(self.option(self.muxer._command('speech.mp3', index, 'out.mp4'), '-t'), '2.500')
+
+    def test_mux_moves_the_output_into_place_and_records_latency(self):
+        base_path = os.path.join(self.tmp, 'base.mp4')
+        with open(base_path, 'wb') as f:
+            f.write(b'video')
+        output_path = os.path.join(self.tmp, 'out.mp4')
+
+        def ffmpeg(cmd, **kwargs):
+            with open(cmd[-1], 'wb') as f:
+                f.write(b'muxed')
+            return mock.Mock(returncode=0, stderr='')
+
+        def failing_ffmpeg(cmd, **kwargs):
+            with open(cmd[-1], 'wb') as f:
+                f.write(b'partial')
+            return mock.Mock(returncode=1, stderr='Invalid data')
+
+        with mock.patch.object(mux, 'prepare_base_video', side_effect=prepared_index):
+            with mock.patch.object(mux, 'subprocess', mock.Mock(run=ffmpeg)):
+                self.muxer.mux('speech.mp3', base_path, output_path)
+            with mock.patch.object(mux, 'subprocess', mock.Mock(run=failing_ffmpeg)):
+                with self.assertRaises(RuntimeError):
+                    self.muxer.mux('speech.mp3', base_path, os.path.join(self.tmp, 'failed.mp4'))
+
+        with open(output_path, 'rb') as f:
+            self.assertEqual(f.read(), b'muxed')
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'failed.mp4')))
+        self.assertEqual([name for name in os.listdir(self.tmp) if name.startswith('.tmp-')], [])
+        stats = self.muxer.stats()
+        self.assertEqual((stats['muxes'], stats['failures']), (1, 1))
+        self.assertIsNotNone(stats['p50_seconds'])
+        # Both slots are free again
+        for _ in range(2):
+            self.assertTrue(self.muxer._slots.acquire(timeout=0))
+
+
+class GenerateVideoBusyTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        with mock.patch.dict(os.environ, {
+            'ELEVENLABS_CACHE_DIR': os.path.join(cls.tmp, 'speech'),
+            'BASE_VIDEO_CACHE_DIR': os.path.join(cls.tmp, 'base_video')
+        }):
+            spec = importlib.util.spec_from_file_location('api_simple', os.path.join(APP_DIR, 'api.simple.py'))
+            cls.api = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(cls.api)
+        cls.client = cls.api.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        self.base_path = os.path.join(self.tmp, 'base.mp4')
+        self.audio_path = os.path.join(self.tmp, 'speech.mp3')
+        for path in (self.base_path, self.audio_path):
+            with open(path, 'wb') as f:
+                f.write(os.path.basename(path).encode())
+        patcher = mock.patch.object(self.api, 'BASE_VIDEO_PATH', self.base_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_generate_video_answers_503_when_busy(self):
+        with mock.patch.object(self.api.muxer, 'mux', side_effect=MuxBusy('All 2 mux workers busy')):
+            response = self.client.post('/generate-video', json={
+                'audio_path': self.audio_path, 'output_path': os.path.join(self.tmp, 'out.mp4')})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('busy', response.get_json()['error'])
+
+    def test_stream_answers_503_when_busy(self):
+        def busy(*args):
+            raise MuxBusy('All 2 mux workers busy')
+            yield
+
+        with mock.patch.object(self.api.muxer, 'stream', busy):
+            response = self.client.post('/generate-video/stream', json={'audio_path': self.audio_path})
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
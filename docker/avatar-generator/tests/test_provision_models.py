@@ -0,0 +1,316 @@
+"""provision_models (the models.json provisioner) against a local
+http.server stub of the Hugging Face Hub.
+
+The stub serves the tree API and resolve/ downloads for one repo, honours
+Range requests, and can truncate or corrupt the next response for a file.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import provision_models  # noqa: E402
+
+REPO = 'stub-org/stub-model'
+FILES = {
+    'config.json': json.dumps({'model_type': 'stub', 'padding': 'x' * 2000}).encode(),
+    'tokenizer.json': json.dumps({'vocab': list(range(500))}).encode(),
+    'onnx/model.onnx': bytes(range(256)) * 256,
+}
+# Stored in LFS, so the tree API gives their SHA-256 rather than a git oid
+LFS = {'onnx/model.onnx'}
+
+
+def git_oid(data):
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class HubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.truncate = {}
+        self.corrupt = set()
+
+    def downloads(self, name=None):
+        with self.lock:
+            return [(path, rng) for path, rng in self.requests
+                    if '/resolve/' in path and (name is None or path.endswith(f'/{name}'))]
+
+
+class HubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.server.state
+        with state.lock:
+            state.requests.append((self.path, self.headers.get('Range')))
+
+        if self.path.startswith(f'/api/models/{REPO}/tree/'):
+            entries = [{'type': 'directory', 'path': 'onnx', 'oid': git_oid(b''), 'size': 0}]
+            for path, data in FILES.items():
+                entry = {'type': 'file', 'path': path, 'size': len(data), 'oid': git_oid(data)}
+                if path in LFS:
+                    entry['lfs'] = {'oid': sha256(data), 'size': len(data), 'pointerSize': 130}
+                entries.append(entry)
+            return self._send(200, json.dumps(entries).encode(), [('Content-Type', 'application/json')])
+
+        match = re.match(rf'^/{REPO}/resolve/[^/]+/(.+)$', self.path)
+        if not match or match.group(1) not in FILES:
+            return self._send(404)
+        name = match.group(1)
+        data = FILES[name]
+        if name in state.corrupt:
+            data = data[:-1] + bytes([data[-1] ^ 1])
+
+        status, start, end = 200, 0, len(data) - 1
+        byte_range = self.headers.get('Range')
+        if byte_range:
+            first, last = byte_range[len('bytes='):].split('-')
+            start, end = int(first), int(last) if last else len(data) - 1
+            if start >= len(data):
+                return self._send(416)
+            status = 206
+        body = data[start:end + 1]
+
+        with state.lock:
+            cut = state.truncate.pop(name, None)
+        if cut is None:
+            return self._send(status, body, [('Accept-Ranges', 'bytes')])
+
+        # Promise the whole body, send part of it, then drop the connection
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:cut])
+        self.wfile.flush()
+        self.close_connection = True
+        self.connection.shutdown(socket.SHUT_RDWR)
+
+
+class ProvisionModelsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), HubHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.endpoint = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.hub = self.server.state = HubState()
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cache_dir = self.tmp / 'cache'
+        self.target = self.tmp / 'root' / 'models' / 'stub'
+        self.write_manifest(pinned=True)
+
+    def write_manifest(self, pinned):
+        files = []
+        for path, data in FILES.items():
+            entry = {'path': path}
+            if pinned:
+                entry.update(size=len(data), sha256=sha256(data))
+            files.append(entry)
+        self.manifest = {
+            'version': 1,
+            'models': {
+                'stub': {
+                    'huggingface': {'repo': REPO, 'revision': 'main'},
+                    'target': 'models/stub',
+                    'files': files
+                }
+            }
+        }
+        self.manifest_path = self.tmp / 'models.json'
+        self.manifest_path.write_text(json.dumps(self.manifest))
+
+    def run_main(self, *args):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            code = provision_models.main([
+                '--manifest', str(self.manifest_path),
+                '--root', str(self.tmp / 'root'),
+                '--cache-dir', str(self.cache_dir),
+                '--endpoint', self.endpoint,
+                *args
+            ])
+        return code, output.getvalue()
+
+    def assert_installed(self):
+        for path, data in FILES.items():
+            self.assertEqual((self.target / path).read_bytes(), data, path)
+
+    def test_installs_and_verifies(self):
+        code, _ = self.run_main()
+        self.assertEqual(code, 0)
+        self.assert_installed()
+        self.assertEqual(self.run_main('--verify-only')[0], 0)
+
+    def test_resumes_after_truncated_download(self):
+        part_path = provision_models.ModelCache(self.cache_dir).part_path(
+            f'{self.endpoint}/{REPO}/resolve/main/onnx/model.onnx')
+        # Bytes are written a block at a time, so cut on a block boundary
+        self.hub.truncate['onnx/model.onnx'] = 3 * 4096
+
+        with mock.patch.object(provision_models, 'BUFFER_SIZE', 4096):
+            code, output = self.run_main()
+            self.assertEqual(code, 1)
+            self.assertIn('Failed to provision stub/onnx/model.onnx', output)
+            self.assertEqual(part_path.stat().st_size, 3 * 4096)
+            self.assertFalse((self.target / 'onnx/model.onnx').exists())
+
+            self.assertEqual(self.run_main()[0], 0)
+        self.assert_installed()
+        self.assertEqual(self.hub.downloads('onnx/model.onnx')[-1][1], f'bytes={3 * 4096}-')
+        self.assertFalse(part_path.exists())
+
+    def test_multipart_resume_refetches_only_the_broken_range(self):
+        self.hub.truncate['onnx/model.onnx'] = 100
+        with mock.patch.object(provision_models, 'MULTIPART_THRESHOLD', 1024):
+            self.assertEqual(self.run_main('--connections', '4')[0], 1)
+            first_run = len(self.hub.downloads('onnx/model.onnx'))
+            self.assertEqual(self.run_main('--connections', '4')[0], 0)
+        self.assertEqual(first_run, 4)
+        self.assertEqual(len(self.hub.downloads('onnx/model.onnx')), 5)
+        self.assert_installed()
+
+    def test_rejects_checksum_mismatch(self):
+        self.hub.corrupt.add('onnx/model.onnx')
+        code, output = self.run_main()
+        self.assertEqual(code, 1)
+        self.assertIn('does not match', output)
+        self.assertFalse((self.target / 'onnx/model.onnx').exists())
+        # Neither cached nor kept as a partial download that later runs would resume
+        self.assertFalse(provision_models.ModelCache(self.cache_dir).has(sha256(FILES['onnx/model.onnx'])))
+        self.assertEqual(list((self.cache_dir / 'tmp').iterdir()), [])
+
+        self.hub.corrupt.clear()
+        self.assertEqual(self.run_main()[0], 0)
+        self.assert_installed()
+
+    def test_pin_checks_downloads_against_the_tree_api(self):
+        self.write_manifest(pinned=False)
+        self.hub.corrupt.add('config.json')
+
+        code, output = self.run_main('--pin')
+        self.assertEqual(code, 1)
+        self.assertIn('git oid', output)
+        self.assertTrue(any('/tree/main' in path for path, _ in self.hub.requests))
+        self.assertFalse((self.target / 'config.json').exists())
+
+        files = {entry['path']: entry for entry in json.loads(self.manifest_path.read_text())['models']['stub']['files']}
+        self.assertNotIn('sha256', files['config.json'])
+        for path in ('tokenizer.json', 'onnx/model.onnx'):
+            self.assertEqual(files[path]['sha256'], sha256(FILES[path]))
+            self.assertEqual(files[path]['size'], len(FILES[path]))
+
+    def test_installs_unpinned_hub_files_checked_against_the_tree_api(self):
+        self.write_manifest(pinned=False)
+        self.hub.corrupt.add('tokenizer.json')
+        code, output = self.run_main()
+        self.assertEqual(code, 1)
+        self.assertEqual(output.count('checked against the Hugging Face metadata'), len(FILES))
+        self.assertIn('git oid', output)
+        self.assertFalse((self.target / 'tokenizer.json').exists())
+
+        self.hub.corrupt.clear()
+        self.assertEqual(self.run_main()[0], 0)
+        self.assert_installed()
+
+    def test_installs_unpinned_url_files_with_a_warning(self):
+        url = f'{self.endpoint}/{REPO}/resolve/main/config.json'
+        self.manifest = {'version': 1, 'models': {'plain': {
+            'target': 'models/plain', 'files': [{'path': 'config.json', 'url': url}]}}}
+        self.manifest_path.write_text(json.dumps(self.manifest))
+
+        code, output = self.run_main()
+        self.assertEqual(code, 0)
+        self.assertIn('installed without verification', output)
+        self.assertEqual((self.tmp / 'root/models/plain/config.json').read_bytes(), FILES['config.json'])
+
+    def test_require_pinned_refuses_unpinned_files(self):
+        self.write_manifest(pinned=False)
+        code, output = self.run_main('--require-pinned')
+        self.assertEqual(code, 1)
+        self.assertIn('not pinned', output)
+        self.assertEqual(self.hub.requests, [])
+
+    def test_verify_only_checks_unpinned_files_against_their_stamp(self):
+        self.write_manifest(pinned=False)
+        self.assertEqual(self.run_main()[0], 0)
+        self.assertEqual(self.run_main('--verify-only')[0], 0)
+
+        code, output = self.run_main('--verify-only', '--require-pinned')
+        self.assertEqual(code, 1)
+        self.assertEqual(output.count('not pinned'), len(FILES))
+
+        (self.target / 'config.json').unlink()
+        (self.target / 'config.json').write_bytes(b'{}')
+        code, output = self.run_main('--verify-only')
+        self.assertEqual(code, 1)
+        self.assertIn('config.json: SHA-256', output)
+
+    def test_skips_installed_files(self):
+        self.assertEqual(self.run_main()[0], 0)
+        self.hub.requests.clear()
+
+        code, output = self.run_main()
+        self.assertEqual(code, 0)
+        self.assertEqual(output.count('Up to date'), len(FILES))
+        self.assertEqual(self.hub.requests, [])
+
+    def test_adopts_verified_files_already_present(self):
+        for path, data in FILES.items():
+            (self.target / path).parent.mkdir(parents=True, exist_ok=True)
+            (self.target / path).write_bytes(data)
+
+        code, output = self.run_main()
+        self.assertEqual(code, 0)
+        self.assertEqual(output.count('Adopted'), len(FILES))
+        self.assertEqual(self.hub.downloads(), [])
+        self.assert_installed()
+
+    def test_replaces_present_file_that_fails_verification(self):
+        (self.target / 'onnx').mkdir(parents=True)
+        (self.target / 'onnx/model.onnx').write_bytes(b'stale weights')
+
+        self.assertEqual(self.run_main()[0], 0)
+        self.assertEqual(len(self.hub.downloads('onnx/model.onnx')), 1)
+        self.assert_installed()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""SingleFlight: one execution per key among concurrent callers."""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight  # noqa: E402
+
+
+class SingleFlightTest(unittest.TestCase):
+    def run_concurrently(self, flight, key, fn, callers=8):
+        results = [None] * callers
+        errors = [None] * callers
+        barrier = threading.Barrier(callers)
+
+        def call(i):
+            barrier.wait()
+            try:
+                results[i] = flight.do(key, fn)
+            except Exception as e:
+                errors[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results, errors
+
+    def test_concurrent_callers_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        def work():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'audio'
+
+        results, errors = self.run_concurrently(flight, 'k', work)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(errors, [None] * 8)
+        self.assertEqual(sorted(shared for _, shared in results), [False] + [True] * 7)
+        self.assertEqual({result for result, _ in results}, {'audio'})
+        self.assertEqual(flight.stats(), {'in_flight': 0, 'coalesced': 7})
+
+    def test_error_reaches_every_caller(self):
+        flight = SingleFlight()
+
+        def work():
+            time.sleep(0.2)
+            raise RuntimeError('upstream 500')
+
+        _, errors = self.run_concurrently(flight, 'k', work)
+        self.assertEqual({str(error) for error in errors}, {'upstream 500'})
+
+    def test_different_keys_run_separately(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('a', lambda: 1), (1, False))
+        self.assertEqual(flight.do('b', lambda: 2), (2, False))
+
+    def test_nothing_is_remembered_after_the_call(self):
+        flight = SingleFlight()
+        calls = []
+        for _ in range(3):
+            flight.do('k', calls.append, 1)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(flight.stats()['coalesced'], 0)
+
+    def test_join_holds_the_key_until_finish(self):
+        flight = SingleFlight()
+        call, leader = flight.join('stream')
+        follower_call, follower_leader = flight.join('stream')
+        self.assertTrue(leader)
+        self.assertFalse(follower_leader)
+        self.assertIs(follower_call, call)
+
+        waited = []
+        thread = threading.Thread(target=lambda: waited.append(flight.wait(follower_call)))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(waited, [])
+
+        flight.finish(call, result='/tmp/out.mp4')
+        flight.finish(call, error=RuntimeError('ignored'))
+        thread.join(5)
+        self.assertEqual(waited, ['/tmp/out.mp4'])
+        self.assertTrue(flight.join('stream')[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""SpeakerRegistry with a counting stand-in for the YourTTS speaker manager."""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from speaker_registry import SpeakerRegistry  # noqa: E402
+
+
+class SpeakerManager:
+    """Embeds a clip as its byte length; records every clip it encodes"""
+
+    def __init__(self):
+        self.embeddings_by_names = {}
+        self.encoded = []
+
+    def compute_embedding_from_clip(self, wav_path):
+        self.encoded.append(wav_path)
+        with open(wav_path, 'rb') as f:
+            return [float(len(f.read()))] * 4
+
+
+class SpeakerRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.manager = SpeakerManager()
+        self.registry = SpeakerRegistry(self.manager)
+
+    def wav(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_registered_speaker_is_encoded_once(self):
+        path = self.wav('rohan.wav', b'RIFF' * 100)
+        fingerprint = self.registry.register('rohan', path)
+        for _ in range(3):
+            self.assertEqual(self.registry.resolve(speaker_id='rohan'), ('rohan', fingerprint))
+
+        self.assertEqual(self.manager.encoded, [path])
+        self.assertEqual(list(self.registry.embedding('rohan')), [400.0] * 4)
+        self.assertIs(self.manager.embeddings_by_names['rohan'][0], self.registry.embedding('rohan'))
+
+    def test_same_content_shares_one_embedding(self):
+        first = self.registry.register('a', self.wav('a.wav', b'sample'))
+        second = self.registry.register('b', self.wav('b.wav', b'sample'))
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.manager.encoded), 1)
+        self.assertIs(self.registry.embedding('a'), self.registry.embedding('b'))
+
+    def test_changed_wav_is_encoded_again(self):
+        path = self.wav('rohan.wav', b'old')
+        old = self.registry.register('rohan', path)
+        self.wav('rohan.wav', b'newer take')
+
+        _, new = self.registry.resolve(speaker_id='rohan')
+        self.assertNotEqual(new, old)
+        self.assertEqual(list(self.registry.embedding('rohan')), [10.0] * 4)
+        self.assertEqual(len(self.manager.encoded), 2)
+
+    def test_deleted_wav_keeps_its_embedding(self):
+        path = self.wav('rohan.wav', b'sample')
+        fingerprint = self.registry.register('rohan', path)
+        os.unlink(path)
+        self.assertEqual(self.registry.resolve(speaker_id='rohan'), ('rohan', fingerprint))
+
+    def test_resolve_by_path_registers_it_once(self):
+        path = self.wav('guest.wav', b'guest voice')
+        speaker_id, fingerprint = self.registry.resolve(speaker_wav=path)
+        self.assertEqual(speaker_id, f'wav-{fingerprint[:16]}')
+        self.assertEqual(self.registry.resolve(speaker_wav=path), (speaker_id, fingerprint))
+        self.assertEqual(len(self.manager.encoded), 1)
+        self.assertEqual([entry['speaker_id'] for entry in self.registry.list()], [speaker_id])
+
+    def test_errors(self):
+        with self.assertRaises(KeyError):
+            self.registry.resolve(speaker_id='nobody')
+        with self.assertRaises(ValueError):
+            self.registry.resolve()
+        with self.assertRaises(FileNotFoundError):
+            self.registry.register('ghost', os.path.join(self.tmp, 'missing.wav'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+"""VoiceCatalog against a scripted stand-in for the ElevenLabs client."""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from voice_catalog import CatalogUnavailable, VoiceCatalog  # noqa: E402
+
+
+class Response:
+    def __init__(self, status_code, voices=(), etag=None):
+        self.status_code = status_code
+        self._voices = list(voices)
+        self.headers = {'ETag': etag} if etag else {}
+        self.text = '' if status_code in (200, 304) else 'upstream error'
+
+    def json(self):
+        return {'voices': [{'voice_id': voice_id, 'name': voice_id.title()} for voice_id in self._voices]}
+
+
+class StubClient:
+    """Answers /voices from `responses`, repeating the last one; records each call"""
+
+    def __init__(self, *responses, delay=0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, path, headers=None):
+        with self.lock:
+            self.calls.append(dict(headers or {}))
+            response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        time.sleep(self.delay)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def voice_ids(voices):
+    return [voice['voice_id'] for voice in voices]
+
+
+class VoiceCatalogRefreshTest(unittest.TestCase):
+    def test_fresh_list_is_served_without_fetching(self):
+        client = StubClient(Response(200, ['alice']))
+        catalog = VoiceCatalog(client, ttl=60)
+        for _ in range(5):
+            self.assertEqual(voice_ids(catalog.voices()), ['alice'])
+        self.assertEqual(len(client.calls), 1)
+
+    def test_cold_callers_share_one_fetch(self):
+        client = StubClient(Response(200, ['alice']), delay=0.2)
+        catalog = VoiceCatalog(client, ttl=60)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(voice_ids(catalog.voices()))) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, [['alice']] * 6)
+        self.assertEqual(len(client.calls), 1)
+
+    def test_stale_list_is_served_while_one_refresh_runs(self):
+        client = StubClient(Response(200, ['alice']), Response(200, ['alice', 'bob']))
+        catalog = VoiceCatalog(client, ttl=0.05, max_stale=60)
+        catalog.voices()
+        time.sleep(0.1)
+        client.delay = 0.2
+
+        started = time.monotonic()
+        for _ in range(5):
+            self.assertEqual(voice_ids(catalog.voices()), ['alice'])
+        self.assertLess(time.monotonic() - started, 0.15)
+
+        deadline = time.monotonic() + 5
+        while voice_ids(catalog.voices()) != ['alice', 'bob']:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertEqual(len(client.calls), 2)
+        self.assertGreaterEqual(catalog.stats()['stale_served'], 5)
+
+    def test_past_max_stale_callers_wait_for_the_refresh(self):
+        client = StubClient(Response(200, ['alice']), Response(200, ['bob']))
+        catalog = VoiceCatalog(client, ttl=0.05, max_stale=0)
+        catalog.voices()
+        time.sleep(0.1)
+        self.assertEqual(voice_ids(catalog.voices()), ['bob'])
+
+    def test_etag_is_replayed_and_304_keeps_the_list(self):
+        client = StubClient(Response(200, ['alice'], etag='"v1"'), Response(304))
+        catalog = VoiceCatalog(client, ttl=60)
+        catalog.voices()
+        self.assertEqual(voice_ids(catalog.refresh()), ['alice'])
+
+        self.assertEqual(client.calls, [{}, {'If-None-Match': '"v1"'}])
+        stats = catalog.stats()
+        self.assertEqual((stats['fetches'], stats['not_modified'], stats['voices']), (2, 1, 1))
+
+    def test_unknown_voice_refreshes_at_most_once_per_interval(self):
+        client = StubClient(Response(200, ['alice']), Response(200, ['alice', 'bob']))
+        catalog = VoiceCatalog(client, ttl=60, min_refresh_interval=0.3)
+        self.assertTrue(catalog.has_voice('alice'))
+        self.assertFalse(catalog.has_voice('carol'))
+        self.assertEqual(len(client.calls), 1)
+
+        time.sleep(0.35)
+        self.assertTrue(catalog.has_voice('bob'))
+        self.assertEqual(len(client.calls), 2)
+
+
+class VoiceCatalogFailureTest(unittest.TestCase):
+    def test_failure_without_a_list_is_cached(self):
+        client = StubClient(Response(503))
+        catalog = VoiceCatalog(client, ttl=60, error_ttl=30)
+
+        with self.assertRaises(CatalogUnavailable):
+            catalog.voices()
+        for _ in range(5):
+            self.assertIsNone(catalog.has_voice('alice'))
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(catalog.stats()['errors'], 1)
+
+    def test_fetches_again_once_the_failure_expires(self):
+        client = StubClient(ConnectionError('down'), Response(200, ['alice']))
+        catalog = VoiceCatalog(client, ttl=60, error_ttl=0.1)
+
+        self.assertIsNone(catalog.has_voice('alice'))
+        time.sleep(0.15)
+        self.assertTrue(catalog.has_voice('alice'))
+        self.assertEqual(len(client.calls), 2)
+
+    def test_failure_past_max_stale_serves_the_stale_list(self):
+        client = StubClient(Response(200, ['alice']), Response(500))
+        catalog = VoiceCatalog(client, ttl=0.05, max_stale=0, error_ttl=30)
+        self.assertEqual([voice['voice_id'] for voice in catalog.voices()], ['alice'])
+        time.sleep(0.1)
+
+        # The first call past max_stale blocks on the failing fetch; the rest do not fetch at all
+        self.assertEqual(len(catalog.voices()), 1)
+        for _ in range(5):
+            self.assertEqual(len(catalog.voices()), 1)
+            self.assertTrue(catalog.has_voice('alice'))
+        self.assertEqual(len(client.calls), 2)
+
+    def test_unknown_voice_while_failing_is_not_rejected(self):
+        client = StubClient(Response(200, ['alice']), Response(500))
+        catalog = VoiceCatalog(client, ttl=60, min_refresh_interval=0, error_ttl=30)
+        catalog.voices()
+
+        self.assertIsNone(catalog.has_voice('bob'))
+        self.assertIsNone(catalog.has_voice('bob'))
+        self.assertEqual(len(client.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import numpy as np
+import torch
+
+
+def batch_synthesize(synthesizer, texts, d_vectors, language):
+    """Synthesize several texts in one padded forward pass of a d-vector VITS model.
+
+    Mirrors TTS.tts.utils.synthesis.synthesis() for YourTTS, but stacks the
+    inputs into a batch. Each text is synthesized as a single utterance
+    (no sentence splitting). Returns one float waveform per text, trimmed to
+    its own length. Raises if the loaded model cannot run batched inference,
+    so callers can fall back to one call per text.
+    """
+    model = synthesizer.tts_model
+    device = next(model.parameters()).device
+
+    token_ids = [model.tokenizer.text_to_ids(text, language=language) for text in texts]
+    lengths = [len(ids) for ids in token_ids]
+    padded = np.zeros((len(texts), max(lengths)), dtype=np.int64)
+    for row, ids in enumerate(token_ids):
+        padded[row, :len(ids)] = ids
+
+    aux_input = {
+        'x_lengths': torch.tensor(lengths, dtype=torch.long, device=device),
+        'd_vectors': torch.tensor(np.stack(d_vectors), dtype=torch.float32, device=device),
+        'speaker_ids': None,
+        'language_ids': None
+    }
+    language_manager = getattr(model, 'language_manager', None)
+    if language_manager is not None:
+        language_id = language_manager.name_to_id[language]
+        aux_input['language_ids'] = torch.full((len(texts),), language_id, dtype=torch.long, device=device)
+
+    with torch.inference_mode():
+        outputs = model.inference(torch.from_numpy(padded).to(device), aux_input=aux_input)
+
+    hop_length = synthesizer.tts_config.audio.hop_length
+    frame_counts = outputs['y_mask'].sum(dim=(1, 2)).long().tolist()
+    waveforms = outputs['model_outputs'].squeeze(1).cpu().numpy()
+    return [waveforms[row, :frames * hop_length] for row, frames in enumerate(frame_counts)]
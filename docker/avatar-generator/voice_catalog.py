@@ -0,0 +1,172 @@
+import threading
+import time
+
+
+class CatalogUnavailable(Exception):
+    """Raised when there is no voice list to serve and the upstream fetch failed"""
+
+
+class VoiceCatalog:
+    """In-process cache of the ElevenLabs voice list.
+
+    Entries younger than ttl are served as is. Older ones are served stale
+    while a single background refresh runs, up to max_stale; past that,
+    callers block on the refresh. Concurrent callers always share one
+    upstream fetch. When the upstream sent an ETag it is replayed with
+    If-None-Match, so an unchanged list costs a 304 instead of a full body.
+    A failed fetch is remembered for error_ttl: until then callers get the
+    stale list (or CatalogUnavailable if there is none) without another
+    fetch, so an outage does not put a blocking retry on every request.
+    """
+
+    def __init__(self, client, ttl=300, max_stale=3600, min_refresh_interval=5, error_ttl=30):
+        self.client = client
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.min_refresh_interval = min_refresh_interval
+        self.error_ttl = error_ttl
+        self._lock = threading.Lock()
+        self._voices = None
+        self._by_id = {}
+        self._etag = None
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._inflight = None
+        self._last_error = None
+        self._failed_at = None
+        self._stats = {'fetches': 0, 'not_modified': 0, 'errors': 0, 'stale_served': 0}
+
+    def _fetch(self):
+        headers = {'If-None-Match': self._etag} if self._etag and self._voices is not None else {}
+        response = self.client.get('/voices', headers=headers)
+
+        if response.status_code == 304:
+            self._stats['not_modified'] += 1
+            return None, self._etag
+        if response.status_code != 200:
+            raise CatalogUnavailable(f'Failed to fetch voices: {response.status_code} {response.text}')
+
+        voices = [
+            {
+                'voice_id': voice['voice_id'],
+                'name': voice['name'],
+                'category': voice.get('category', 'unknown')
+            }
+            for voice in response.json().get('voices', [])
+        ]
+        return voices, response.headers.get('ETag')
+
+    def _refresh(self):
+        """Fetch once for everyone waiting; returns the event of the fetch in flight"""
+        with self._lock:
+            if self._inflight is not None:
+                return self._inflight
+            self._inflight = threading.Event()
+            self._attempted_at = time.monotonic()
+            event = self._inflight
+
+        try:
+            voices, etag = self._fetch()
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+                self._last_error = str(e)
+                self._failed_at = time.monotonic()
+        else:
+            with self._lock:
+                self._stats['fetches'] += 1
+                if voices is not None:
+                    self._voices = voices
+                    self._by_id = {voice['voice_id']: voice for voice in voices}
+                self._etag = etag
+                self._fetched_at = time.monotonic()
+                self._last_error = None
+                self._failed_at = None
+        finally:
+            with self._lock:
+                self._inflight = None
+            event.set()
+        return event
+
+    def _refresh_and_wait(self):
+        self._refresh().wait()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._inflight is not None:
+                return
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _failing(self):
+        """True if the last fetch failed less than error_ttl ago; call with the lock held"""
+        return self._failed_at is not None and time.monotonic() - self._failed_at < self.error_ttl
+
+    def voices(self):
+        """The voice list, refreshing it if it is older than ttl"""
+        with self._lock:
+            voices = self._voices
+            age = time.monotonic() - self._fetched_at
+            failing = self._failing()
+            error = self._last_error
+
+        if voices is not None and age < self.ttl:
+            return voices
+        if failing:
+            # Fetched and failed moments ago: serve what there is instead of fetching again
+            if voices is None:
+                raise CatalogUnavailable(error or 'Voice list unavailable')
+            with self._lock:
+                self._stats['stale_served'] += 1
+            return voices
+        if voices is not None and age < self.ttl + self.max_stale:
+            with self._lock:
+                self._stats['stale_served'] += 1
+            self._refresh_in_background()
+            return voices
+
+        return self.refresh()
+
+    def refresh(self):
+        """Refetch now, ignoring the TTL; returns the current list"""
+        self._refresh_and_wait()
+        with self._lock:
+            if self._voices is None:
+                raise CatalogUnavailable(self._last_error or 'Voice list unavailable')
+            return self._voices
+
+    def has_voice(self, voice_id):
+        """True or False if the catalog can tell, None if no voice list is available.
+
+        An unknown id triggers one early refresh (rate-limited by
+        min_refresh_interval), so voices cloned since the last fetch are found.
+        While fetches are failing an unknown id gives None, as the stale list
+        cannot rule out a voice added since.
+        """
+        try:
+            self.voices()
+        except CatalogUnavailable:
+            return None
+
+        with self._lock:
+            if voice_id in self._by_id:
+                return True
+            if self._failing():
+                return None
+            recently = time.monotonic() - self._attempted_at < self.min_refresh_interval
+
+        if not recently:
+            self._refresh_and_wait()
+        with self._lock:
+            if voice_id in self._by_id:
+                return True
+            return None if self._failing() else False
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                voices=len(self._voices) if self._voices is not None else None,
+                age_seconds=round(time.monotonic() - self._fetched_at, 1) if self._voices is not None else None,
+                ttl_seconds=self.ttl,
+                last_error=self._last_error
+            )
@@ -0,0 +1,174 @@
+"""Resident EchoMimic pipeline built from the classes in the upstream repo.
+
+Upstream only ships CLI scripts (infer_audio2vid.py), which load every model
+for each run. This module does the same setup once and exposes the entry
+points the worker keeps resident: load_pipeline(), encode_reference() and
+generate(). Model paths come from EchoMimic's own animation config.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+ECHOMIMIC_DIR = os.getenv('ECHOMIMIC_DIR', '/app/echomimic')
+CONFIG_PATH = os.getenv('ECHOMIMIC_CONFIG', os.path.join(ECHOMIMIC_DIR, 'configs/prompts/animation.yaml'))
+
+# infer_audio2vid.py defaults
+WIDTH = int(os.getenv('ECHOMIMIC_WIDTH', '512'))
+HEIGHT = int(os.getenv('ECHOMIMIC_HEIGHT', '512'))
+MAX_FRAMES = int(os.getenv('ECHOMIMIC_MAX_FRAMES', '1200'))
+STEPS = int(os.getenv('ECHOMIMIC_STEPS', '30'))
+CFG = float(os.getenv('ECHOMIMIC_CFG', '2.5'))
+SEED = int(os.getenv('ECHOMIMIC_SEED', '420'))
+FPS = int(os.getenv('ECHOMIMIC_FPS', '24'))
+SAMPLE_RATE = 16000
+CONTEXT_FRAMES = 12
+CONTEXT_OVERLAP = 3
+FACEMASK_DILATION = 0.1
+FACECROP_DILATION = 0.5
+
+if ECHOMIMIC_DIR not in sys.path:
+    sys.path.insert(0, ECHOMIMIC_DIR)
+
+
+class Pipeline:
+    def __init__(self, pipe, face_detector, device, dtype):
+        self.pipe = pipe
+        self.face_detector = face_detector
+        self.device = device
+        self.dtype = dtype
+
+
+def _path(value):
+    """Config paths are relative to the EchoMimic checkout"""
+    return value if os.path.isabs(value) else os.path.join(ECHOMIMIC_DIR, value)
+
+
+def load_pipeline():
+    from diffusers import AutoencoderKL, DDIMScheduler
+    from facenet_pytorch import MTCNN
+    from omegaconf import OmegaConf
+    from src.models.face_locator import FaceLocator
+    from src.models.unet_2d_condition import UNet2DConditionModel
+    from src.models.unet_3d_echo import EchoUNet3DConditionModel
+    from src.models.whisper.audio2feature import load_audio_model
+    from src.pipelines.pipeline_echo_mimic import Audio2VideoPipeline
+
+    config = OmegaConf.load(CONFIG_PATH)
+    infer_config = OmegaConf.load(_path(config.inference_config))
+    device = os.getenv('ECHOMIMIC_DEVICE') or ('cuda' if torch.cuda.is_available() else 'cpu')
+    # Half precision is only worth it (and only supported everywhere) on GPU
+    dtype = torch.float16 if config.weight_dtype == 'fp16' and device != 'cpu' else torch.float32
+
+    vae = AutoencoderKL.from_pretrained(_path(config.pretrained_vae_path))
+    reference_unet = UNet2DConditionModel.from_pretrained(_path(config.pretrained_base_model_path), subfolder='unet')
+    reference_unet.load_state_dict(torch.load(_path(config.reference_unet_path), map_location='cpu'))
+
+    motion_module_path = _path(config.motion_module_path)
+    denoising_unet = EchoUNet3DConditionModel.from_pretrained_2d(
+        _path(config.pretrained_base_model_path),
+        motion_module_path if os.path.exists(motion_module_path) else '',
+        subfolder='unet',
+        unet_additional_kwargs=infer_config.unet_additional_kwargs
+    )
+    denoising_unet.load_state_dict(torch.load(_path(config.denoising_unet_path), map_location='cpu'), strict=False)
+
+    face_locator = FaceLocator(320, conditioning_channels=1, block_out_channels=(16, 32, 96, 256))
+    face_locator.load_state_dict(torch.load(_path(config.face_locator_path), map_location='cpu'))
+
+    audio_guider = load_audio_model(model_path=_path(config.audio_model_path), device=device)
+    face_detector = MTCNN(image_size=320, margin=0, min_face_size=20, thresholds=[0.6, 0.7, 0.7],
+                          factor=0.709, post_process=True, device=device)
+    scheduler = DDIMScheduler(**OmegaConf.to_container(infer_config.noise_scheduler_kwargs))
+
+    pipe = Audio2VideoPipeline(
+        vae=vae,
+        reference_unet=reference_unet,
+        denoising_unet=denoising_unet,
+        audio_guider=audio_guider,
+        face_locator=face_locator,
+        scheduler=scheduler
+    ).to(device, dtype=dtype)
+    return Pipeline(pipe, face_detector, device, dtype)
+
+
+def _read_reference(path):
+    """BGR reference image: the file itself, or the first frame of a video"""
+    image = cv2.imread(path)
+    if image is not None:
+        return image
+    capture = cv2.VideoCapture(path)
+    ok, frame = capture.read()
+    capture.release()
+    if not ok:
+        raise ValueError(f'Could not read a frame from {path}')
+    return frame
+
+
+def _select_face(boxes, probs):
+    """Largest confident detection, as in infer_audio2vid.py"""
+    if boxes is None or probs is None:
+        return None
+    boxes = [box for box, prob in zip(boxes, probs) if prob > 0.8]
+    if not boxes:
+        return None
+    return max(boxes, key=lambda box: (box[3] - box[1]) * (box[2] - box[0]))
+
+
+def encode_reference(pipeline, path):
+    """Face crop and mask for the reference, ready for the pipeline; cached per file by the worker"""
+    from src.utils.util import crop_and_pad
+
+    face_img = _read_reference(path)
+    face_mask = np.zeros(face_img.shape[:2], dtype='uint8')
+    boxes, probs = pipeline.face_detector.detect(face_img)
+    box = _select_face(boxes, probs)
+    if box is None:
+        face_mask[:, :] = 255
+    else:
+        x1, y1, x2, y2 = np.round(box[:4]).astype('int')
+        r_pad, c_pad = int((y2 - y1) * FACEMASK_DILATION), int((x2 - x1) * FACEMASK_DILATION)
+        face_mask[max(0, y1 - r_pad):y2 + r_pad, max(0, x1 - c_pad):x2 + c_pad] = 255
+        r_pad, c_pad = int((y2 - y1) * FACECROP_DILATION), int((x2 - x1) * FACECROP_DILATION)
+        crop_rect = [max(0, x1 - c_pad), max(0, y1 - r_pad),
+                     min(x2 + c_pad, face_img.shape[1]), min(y2 + r_pad, face_img.shape[0])]
+        face_img = cv2.resize(crop_and_pad(face_img, crop_rect), (WIDTH, HEIGHT))
+        face_mask = cv2.resize(crop_and_pad(face_mask, crop_rect), (WIDTH, HEIGHT))
+
+    # Tensors, so the cache can torch.load them with weights_only
+    return {
+        'image': torch.from_numpy(np.ascontiguousarray(face_img[:, :, ::-1])),
+        'mask': torch.from_numpy(face_mask)
+    }
+
+
+def generate(pipeline, reference, audio_path, output_path):
+    from src.utils.util import save_videos_grid
+
+    ref_image = Image.fromarray(reference['image'].numpy())
+    mask = reference['mask'].to(device=pipeline.device, dtype=pipeline.dtype)[None, None, None] / 255.0
+
+    video = pipeline.pipe(
+        ref_image, audio_path, mask, WIDTH, HEIGHT, MAX_FRAMES, STEPS, CFG,
+        generator=torch.manual_seed(SEED),
+        audio_sample_rate=SAMPLE_RATE,
+        context_frames=CONTEXT_FRAMES,
+        fps=FPS,
+        context_overlap=CONTEXT_OVERLAP
+    ).videos
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        silent_path = os.path.join(tmp_dir, 'video.mp4')
+        save_videos_grid(video, silent_path, n_rows=1, fps=FPS)
+        result = subprocess.run([
+            'ffmpeg', '-y', '-i', silent_path, '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy', '-c:a', 'aac', '-shortest',
+            output_path
+        ], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Adding audio failed: {result.stderr}')
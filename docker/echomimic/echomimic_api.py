@@ -1,16 +1,64 @@
-
+import fcntl
+import hashlib
+import multiprocessing
 import os
-import sys
-import json
+import threading
 from flask import Flask, request, jsonify
-import subprocess
-import tempfile
+import uuid
+from echomimic_worker import EchoMimicSupervisor, QueueFull, file_key
 
 app = Flask(__name__)
 
+# The diffusion pipeline stays loaded in one worker process instead of one process per request
+worker = EchoMimicSupervisor(
+    job_timeout=float(os.getenv('ECHOMIMIC_JOB_TIMEOUT', '1800')),
+    load_timeout=float(os.getenv('ECHOMIMIC_LOAD_TIMEOUT', '900')),
+    cache_dir=os.getenv('ECHOMIMIC_REFERENCE_CACHE_DIR', '/app/cache/references'),
+    cache_entries=int(os.getenv('ECHOMIMIC_REFERENCE_CACHE_ENTRIES', '8')),
+    max_queued=int(os.getenv('ECHOMIMIC_MAX_QUEUED', '4'))
+)
+# A request gives up after its job could have loaded the worker and rendered
+# (behind the jobs ahead of it, see wait_budget()), plus this margin
+WAIT_MARGIN = float(os.getenv('ECHOMIMIC_WAIT_MARGIN', '60'))
+
+# Only one process per host holds the pipeline. Serve from a single process
+# (python echomimic_api.py, or gunicorn -w 1 --threads N); extra gunicorn
+# workers would each need their own copy, so they answer 503 instead.
+PIPELINE_LOCK = os.getenv('ECHOMIMIC_PIPELINE_LOCK', '/tmp/echomimic-pipeline.lock')
+_pipeline_lock_file = None
+_pipeline_pid = None
+_pipeline_claim = threading.Lock()
+
+def claim_pipeline():
+    """True if this process runs the pipeline, starting it on the first successful claim"""
+    global _pipeline_lock_file, _pipeline_pid
+    with _pipeline_claim:
+        if _pipeline_pid not in (None, os.getpid()):
+            # Forked (gunicorn --preload) after the parent claimed it: the
+            # lock is shared with the parent, but the supervisor thread is not
+            return False
+        if _pipeline_lock_file is None:
+            lock_file = open(PIPELINE_LOCK, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            # Held open for the life of the process; the lock goes when it exits
+            _pipeline_lock_file, _pipeline_pid = lock_file, os.getpid()
+            worker.start()
+        return True
+
+# Load the pipeline as soon as the app is imported, but not in the worker
+# process, which re-imports this module under spawn
+if multiprocessing.current_process().name == 'MainProcess':
+    claim_pipeline()
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy', 'service': 'echomimic-v2'})
+    if not claim_pipeline():
+        return jsonify({'status': 'standby', 'service': 'echomimic-v2', 'pid': os.getpid()})
+    return jsonify({'status': 'healthy', 'service': 'echomimic-v2', 'worker': worker.stats()})
 
 @app.route('/generate-avatar', methods=['POST'])
 def generate_avatar():
@@ -19,34 +67,50 @@ def generate_avatar():
         data = request.get_json()
         audio_path = data.get('audio_path')
         reference_video = data.get('reference_video', '/app/input/reference.mp4')
-        output_path = data.get('output_path', '/app/output/generated.mp4')
+        output_path = data.get('output_path')
         
         if not audio_path:
             return jsonify({'error': 'Audio path is required'}), 400
+        if not claim_pipeline():
+            # Retried claims pick the pipeline up if the process holding it exits
+            return jsonify({'error': 'EchoMimic runs in another worker process; serve with a single worker'}), 503
+
+        # Identical requests in flight share one render; without an explicit
+        # output_path the file is named after the inputs so jobs never collide
+        try:
+            input_key = hashlib.sha256(f'{file_key(reference_video)}:{file_key(audio_path)}'.encode()).hexdigest()
+        except OSError:
+            input_key = None
+        output_path = output_path or f'/app/output/generated_{(input_key or uuid.uuid4().hex)[:16]}.mp4'
+        key = (input_key, output_path) if input_key else None
             
-        # Run EchoMimic inference
-        cmd = [
-            'python', '/app/echomimic/inference.py',
-            '--reference_video', reference_video,
-            '--audio_path', audio_path,
-            '--output_path', output_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # Run EchoMimic inference on the resident worker
+        try:
+            job = worker.submit(reference_video, audio_path, output_path, key=key)
+        except QueueFull as e:
+            response = jsonify({'error': f'{str(e)}, retry later'})
+            response.headers['Retry-After'] = '60'
+            return response, 503
+        wait = worker.wait_budget(job) + WAIT_MARGIN
+        if not job.wait(wait):
+            return jsonify({'error': f'EchoMimic job did not finish within {wait:.0f}s'}), 504
         
-        if result.returncode == 0:
+        if job.error is None:
             return jsonify({
                 'success': True,
                 'video_path': output_path,
-                'message': 'Avatar generated successfully'
+                'message': 'Avatar generated successfully',
+                'reference_cache': job.result['reference_cache'],
+                'seconds': job.result['seconds']
             })
         else:
             return jsonify({
-                'error': f'Generation failed: {result.stderr}'
+                'error': job.error
             }), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8003, debug=True)
+    # The reloader would start a second process with its own copy of the pipeline
+    app.run(host='0.0.0.0', port=8003, debug=True, use_reloader=False)
@@ -0,0 +1,405 @@
+import hashlib
+import importlib
+import multiprocessing
+import os
+import queue
+import subprocess
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+ECHOMIMIC_DIR = os.getenv('ECHOMIMIC_DIR', '/app/echomimic')
+INFERENCE_SCRIPT = os.path.join(ECHOMIMIC_DIR, 'inference.py')
+# Module that builds the pipeline from EchoMimic's classes and the entry points it provides
+RESIDENT_MODULE = os.getenv('ECHOMIMIC_RESIDENT_MODULE', 'echomimic_adapter')
+RESIDENT_API = ('load_pipeline', 'encode_reference', 'generate')
+
+
+_file_keys = {}
+_file_keys_lock = threading.Lock()
+
+
+def file_key(path):
+    """Content hash of a file, memoized on (path, mtime, size), so renamed copies match"""
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _file_keys_lock:
+        cached = _file_keys.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    key = digest.hexdigest()[:32]
+    with _file_keys_lock:
+        _file_keys[path] = (stamp, key)
+    return key
+
+
+class ReferenceCache:
+    """Prepared references (the face crop and mask from encode_reference, not VAE
+    latents) by content hash: an in-memory LRU backed by .pt files on disk"""
+
+    def __init__(self, cache_dir, max_entries):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get_or_encode(self, path, encode):
+        """Return (reference, 'memory' | 'disk' | 'miss')"""
+        key = file_key(path)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key], 'memory'
+
+        import torch
+
+        disk_path = os.path.join(self.cache_dir, f'{key}.pt') if self.cache_dir else None
+        if disk_path and os.path.exists(disk_path):
+            reference, source = torch.load(disk_path, map_location='cpu'), 'disk'
+        else:
+            reference, source = encode(path), 'miss'
+            if disk_path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f'{disk_path}.tmp-{uuid.uuid4().hex}'
+                torch.save(reference, tmp_path)
+                os.replace(tmp_path, disk_path)
+
+        self._entries[key] = reference
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return reference, source
+
+
+class ResidentBackend:
+    """Pipeline loaded once by the adapter module and reused for every job"""
+
+    mode = 'resident'
+
+    def __init__(self, module, references):
+        self.module = module
+        self.references = references
+        self.pipeline = module.load_pipeline()
+
+    def render(self, reference_video, audio_path, output_path):
+        reference, source = self.references.get_or_encode(
+            reference_video, lambda path: self.module.encode_reference(self.pipeline, path)
+        )
+        self.module.generate(self.pipeline, reference, audio_path, output_path)
+        return {'reference_cache': source}
+
+
+class SubprocessBackend:
+    """Fallback when the EchoMimic classes cannot be imported: one process per job, as before"""
+
+    mode = 'subprocess'
+
+    def render(self, reference_video, audio_path, output_path):
+        result = subprocess.run([
+            'python', INFERENCE_SCRIPT,
+            '--reference_video', reference_video,
+            '--audio_path', audio_path,
+            '--output_path', output_path
+        ], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f'Generation failed: {result.stderr}')
+        return {'reference_cache': None}
+
+
+def load_backend(references):
+    try:
+        module = importlib.import_module(RESIDENT_MODULE)
+    except ImportError as e:
+        print(f"Cannot import {RESIDENT_MODULE} ({e}); running one process per job")
+        return SubprocessBackend()
+
+    missing = [name for name in RESIDENT_API if not callable(getattr(module, name, None))]
+    if missing:
+        raise RuntimeError(f"{RESIDENT_MODULE} does not define {', '.join(missing)}")
+    return ResidentBackend(module, references)
+
+
+def worker_main(conn, cache_dir, cache_entries):
+    """Worker process: load the backend once, then render jobs received on conn until it closes"""
+    start = time.perf_counter()
+    try:
+        backend = load_backend(ReferenceCache(cache_dir, cache_entries))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+        return
+    conn.send(('ready', backend.mode, round(time.perf_counter() - start, 3)))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        start = time.perf_counter()
+        try:
+            info = backend.render(**job)
+            info['seconds'] = round(time.perf_counter() - start, 3)
+            conn.send(('done', info))
+        except Exception as e:
+            conn.send(('failed', str(e)))
+
+
+class WorkerCrashed(Exception):
+    """The worker process died while rendering a job"""
+
+
+class QueueFull(Exception):
+    """Raised by submit() when max_queued jobs are already waiting"""
+
+
+class Job:
+    def __init__(self, reference_video, audio_path, output_path, key=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.output_path = output_path
+        self.args = {
+            'reference_video': reference_video,
+            'audio_path': audio_path,
+            'output_path': output_path
+        }
+        # Jobs queued or rendering ahead of this one when it was submitted
+        self.ahead = 0
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class EchoMimicSupervisor:
+    """Runs the EchoMimic pipeline in one long-lived worker process and keeps it alive.
+
+    Jobs are queued here and handed to the worker one at a time over a pipe.
+    If the worker dies or exceeds job_timeout, the job it was rendering fails,
+    the process is restarted with exponential backoff, and queued jobs carry on
+    with the new process. The job that crashed is not retried, so one bad
+    input cannot put the worker into a crash loop. A job submitted with the
+    key of a queued or running job is coalesced with it; any other job is
+    refused with QueueFull once max_queued jobs are waiting. Each job renders
+    to a private file that is moved to output_path only once it is complete.
+    """
+
+    def __init__(self, job_timeout=1800, load_timeout=900, cache_dir=None, cache_entries=8,
+                 restart_backoff=1, max_backoff=30, max_queued=4):
+        self.job_timeout = job_timeout
+        self.load_timeout = load_timeout
+        self.cache_dir = cache_dir
+        self.cache_entries = cache_entries
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self.max_queued = max_queued
+        self._ctx = multiprocessing.get_context('spawn')
+        self._jobs = queue.Queue()
+        self._inflight = {}
+        self._current = None
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        self._failures_in_row = 0
+        self._started = False
+        self._stats = {
+            'state': 'stopped',
+            'mode': None,
+            'pid': None,
+            'load_seconds': None,
+            'restarts': 0,
+            'crashes': 0,
+            'completed': 0,
+            'failed': 0,
+            'coalesced': 0,
+            'reference_cache': {'memory': 0, 'disk': 0, 'miss': 0},
+            'last_error': None
+        }
+
+    def start(self):
+        """Start the supervisor thread (and with it the worker); later calls do nothing"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, reference_video, audio_path, output_path, key=None):
+        self.start()
+        with self._lock:
+            if key is not None and key in self._inflight:
+                self._stats['coalesced'] += 1
+                return self._inflight[key]
+            queued = self._jobs.qsize()
+            if queued >= self.max_queued:
+                raise QueueFull(f'EchoMimic queue is full ({queued} waiting)')
+            job = Job(reference_video, audio_path, output_path, key)
+            job.ahead = queued + (self._current is not None)
+            if key is not None:
+                self._inflight[key] = job
+            # Under the lock, so the next submit counts this job as queued
+            self._jobs.put(job)
+        return job
+
+    def wait_budget(self, job):
+        """Seconds a caller may wait for job: a load, its own render and one per job ahead of it"""
+        return self.load_timeout + (job.ahead + 1) * self.job_timeout
+
+    def _set(self, **fields):
+        with self._lock:
+            self._stats.update(fields)
+
+    def _count(self, field):
+        with self._lock:
+            self._stats[field] += 1
+
+    def _spawn(self):
+        if self._process is not None:
+            self._stop_process()
+            self._count('restarts')
+
+        self._set(state='starting')
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(child_conn, self.cache_dir, self.cache_entries),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._process, self._conn = process, parent_conn
+
+        if not self._poll(self.load_timeout):
+            raise RuntimeError('EchoMimic worker did not load in time')
+        message = parent_conn.recv()
+        if message[0] != 'ready':
+            raise RuntimeError(f'EchoMimic worker failed to load: {message[1]}')
+        self._set(state='ready', mode=message[1], load_seconds=message[2], pid=process.pid)
+
+    def _poll(self, timeout):
+        """Wait for a message; False on timeout, WorkerCrashed if the process dies"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self._conn.poll(1):
+                    return True
+            except (EOFError, OSError):
+                raise WorkerCrashed('EchoMimic worker exited')
+            if not self._process.is_alive():
+                raise WorkerCrashed(f'EchoMimic worker exited with code {self._process.exitcode}')
+            if time.monotonic() >= deadline:
+                return False
+
+    def _stop_process(self):
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join()
+        self._conn.close()
+        self._set(state='stopped', pid=None)
+
+    def _ensure_worker(self):
+        if self._process is not None and self._process.is_alive():
+            return
+        if self._process is not None and self._stats['state'] in ('ready', 'busy'):
+            # Died while idle
+            self._count('crashes')
+            self._failures_in_row += 1
+        if self._failures_in_row:
+            delay = min(self.max_backoff, self.restart_backoff * 2 ** (self._failures_in_row - 1))
+            self._set(state='restarting')
+            time.sleep(delay)
+
+        try:
+            self._spawn()
+        except Exception as e:
+            if self._process is not None:
+                self._stop_process()
+            self._failures_in_row += 1
+            self._set(state='failed', last_error=str(e))
+            raise
+
+    def _render(self, job):
+        self._ensure_worker()
+        root, ext = os.path.splitext(job.output_path)
+        tmp_path = f'{root}.tmp-{job.id}{ext}'
+        try:
+            result = self._send(dict(job.args, output_path=tmp_path))
+            os.replace(tmp_path, job.output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return result
+
+    def _send(self, args):
+        self._conn.send(args)
+        self._set(state='busy')
+        try:
+            if not self._poll(self.job_timeout):
+                self._stop_process()
+                raise WorkerCrashed(f'EchoMimic job timed out after {self.job_timeout}s; worker restarted')
+            status, payload = self._conn.recv()
+        except EOFError:
+            self._process.join()
+            return self._crashed(f'EchoMimic worker exited with code {self._process.exitcode}')
+        except WorkerCrashed as e:
+            return self._crashed(str(e))
+
+        self._failures_in_row = 0
+        self._set(state='ready')
+        if status == 'failed':
+            raise RuntimeError(payload)
+        with self._lock:
+            if payload['reference_cache']:
+                self._stats['reference_cache'][payload['reference_cache']] += 1
+        return payload
+
+    def _crashed(self, error):
+        self._count('crashes')
+        self._failures_in_row += 1
+        self._set(state='crashed', last_error=error)
+        raise WorkerCrashed(error)
+
+    def _run(self):
+        while True:
+            try:
+                job = self._jobs.get(timeout=1)
+            except queue.Empty:
+                # Load up front and bring a crashed worker back before the next job needs it
+                try:
+                    self._ensure_worker()
+                except Exception as e:
+                    print(f"EchoMimic worker start failed: {e}")
+                continue
+            with self._lock:
+                self._current = job
+            try:
+                result = self._render(job)
+            except Exception as e:
+                self._count('failed')
+                error, result = str(e), None
+            else:
+                self._count('completed')
+                error = None
+            with self._lock:
+                self._current = None
+                if job.key is not None:
+                    del self._inflight[job.key]
+            job.finish(result=result, error=error)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, reference_cache=dict(self._stats['reference_cache']))
+        stats['queued'] = self._jobs.qsize()
+        return stats
@@ -0,0 +1,167 @@
+"""
+Layer index for sliced G-code files.
+
+One scan records the byte offset and Z height of every ;LAYER_CHANGE line and
+the offset of every `G1 Z... F6000` line (where extruder changes are inserted).
+The index is cached in a JSON sidecar next to the G-code and reused until the
+file's size or mtime changes. With it, a rewrite only has to look at those
+lines and can copy everything between them as raw byte ranges. The index also
+notes whether the file already carries ;GROUP_START markers, i.e. is rewritten
+output rather than a fresh slice.
+"""
+import bisect
+import json
+import mmap
+import os
+
+INDEX_VERSION = 2
+LAYER_MARK = b';LAYER_CHANGE'
+GROUP_MARK = b';GROUP_START'
+TRIGGER_PREFIX = b'G1 Z'
+TRIGGER_FEED = b'F6000'
+COPY_BUFFER = 1024 * 1024
+ENCODING = 'utf-8'
+
+
+def index_path_for(gcode_path):
+    return f"{gcode_path}.index.json"
+
+
+def _line_bounds(data, pos, size):
+    """Start offset of the line containing pos, and the offset just past its newline"""
+    start = data.rfind(b'\n', 0, pos) + 1
+    end = data.find(b'\n', pos)
+    return start, size if end == -1 else end + 1
+
+
+def _layer_z(data, offset, size):
+    """Z height from the ;Z: comment slicers write right after ;LAYER_CHANGE, if present"""
+    end = data.find(b'\n', offset)
+    line = data[offset:size if end == -1 else end].strip()
+    if line.startswith(b';Z:'):
+        try:
+            return float(line[3:])
+        except ValueError:
+            return None
+    return None
+
+
+def scan_gcode(gcode_path):
+    """Build the index for gcode_path with a single pass of C-level searches"""
+    stat = os.stat(gcode_path)
+    index = {
+        "version": INDEX_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "has_cr": False,
+        "group_markers": False,
+        "layers": [],
+        "triggers": [],
+    }
+    if stat.st_size == 0:
+        return index
+
+    size = stat.st_size
+    with open(gcode_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # Text-mode readers translate \r and \r\n; byte-range copies would not
+        index["has_cr"] = data.find(b'\r') != -1
+        index["group_markers"] = data.find(GROUP_MARK) != -1
+
+        pos = data.find(LAYER_MARK)
+        while pos != -1:
+            start, end = _line_bounds(data, pos, size)
+            index["layers"].append({"offset": start, "z": _layer_z(data, end, size)})
+            pos = data.find(LAYER_MARK, end)
+
+        pos = data.find(TRIGGER_PREFIX)
+        while pos != -1:
+            start, end = _line_bounds(data, pos, size)
+            line = data[start:end].strip()
+            if line.startswith(TRIGGER_PREFIX) and TRIGGER_FEED in line:
+                index["triggers"].append(start)
+            pos = data.find(TRIGGER_PREFIX, end)
+
+    return index
+
+
+def load_index(gcode_path):
+    """Index for gcode_path from its sidecar, rescanning (and rewriting the sidecar) if stale"""
+    stat = os.stat(gcode_path)
+    sidecar = index_path_for(gcode_path)
+    try:
+        with open(sidecar) as f:
+            index = json.load(f)
+        if (index.get("version"), index.get("size"), index.get("mtime_ns")) == \
+                (INDEX_VERSION, stat.st_size, stat.st_mtime_ns):
+            return index
+    except (OSError, ValueError):
+        pass
+
+    index = scan_gcode(gcode_path)
+    tmp_path = f"{sidecar}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, sidecar)
+    except OSError:
+        # The index is only a cache; a read-only directory just means rescanning next time
+        pass
+    return index
+
+
+def event_offsets(index):
+    """Sorted start offsets of every line a rewrite has to look at"""
+    return sorted({layer["offset"] for layer in index["layers"]} | set(index["triggers"]))
+
+
+def copy_range(src, dst, start, end):
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = src.read(min(COPY_BUFFER, remaining))
+        if not block:
+            break
+        dst.write(block)
+        remaining -= len(block)
+
+
+def rewrite_indexed(gcode_path, dst, index, machine, start=0, on_layer=None):
+    """
+    Write gcode_path to the binary file dst, passing only the lines that matter
+    through `machine` and copying the byte ranges between them unchanged.
+
+    `machine` must provide feed(line) -> list of lines to write in its place,
+    needs_line() -> True if the next line must be fed even though it is not
+    an indexed one, and finish() -> lines to append at the end.
+
+    Reading starts at `start`, which must be 0 or an indexed line. Before each
+    ;LAYER_CHANGE line is fed, on_layer(input_offset, output_offset) is called;
+    if it returns True the rewrite stops there and that input offset is
+    returned, leaving the rest of the output to the caller. Otherwise None is
+    returned once the whole file and finish() have been written.
+    """
+    events = event_offsets(index)
+    layer_offsets = {layer["offset"] for layer in index["layers"]}
+    size = index["size"]
+    next_event = bisect.bisect_left(events, start)
+    pos = start
+    with open(gcode_path, 'rb') as src:
+        while pos < size:
+            event_at = events[next_event] if next_event < len(events) else size
+            if pos == event_at and on_layer is not None and pos in layer_offsets:
+                if on_layer(pos, dst.tell()):
+                    return pos
+            if pos < event_at and not machine.needs_line():
+                copy_range(src, dst, pos, event_at)
+                pos = event_at
+                continue
+
+            src.seek(pos)
+            line = src.readline()
+            if pos == event_at:
+                next_event += 1
+            pos += len(line)
+            dst.write(''.join(machine.feed(line.decode(ENCODING))).encode(ENCODING))
+
+    dst.write(''.join(machine.finish()).encode(ENCODING))
+    return None
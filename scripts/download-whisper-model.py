@@ -1,73 +1,86 @@
 #!/usr/bin/env python3
+"""Install the Whisper tiny.en ONNX model into public/models.
 
-import os
-import requests
+The file list lives in docker/avatar-generator/models.json with the other
+models; this runs the shared provisioning tool for just this model, which
+downloads in parallel with resume and skips files already installed and
+verified. Afterwards index.json is written next to the files, in the
+format the standalone downloader used: the repo, revision and file list,
+plus the size, mtime and SHA-256 of each file that is installed. Extra
+arguments (--verify-only, --pin, --cache-dir, ...) are passed through.
+"""
+
+import argparse
 import json
+import os
+import sys
+from datetime import datetime, timezone
 from pathlib import Path
 
-def download_file(url, filepath):
-    """Download a file from URL to filepath"""
-    print(f"📥 Downloading: {filepath.name}")
-    
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    
-    # Create directory if it doesn't exist
-    filepath.parent.mkdir(parents=True, exist_ok=True)
-    
-    with open(filepath, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-    
-    print(f"✅ Downloaded: {filepath.name}")
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / 'docker' / 'avatar-generator'))
+
+import provision_models  # noqa: E402
+
+MODEL = 'whisper-tiny-en'
+
+
+def write_index(manifest_path, root):
+    """Record what is installed in index.json; returns its path, or None if nothing is"""
+    model = provision_models.load_manifest(manifest_path)['models'][MODEL]
+    items = provision_models.model_items(MODEL, model, root, '')
+    target = items[0].target
+    if not target.is_dir():
+        return None
+    stamps = provision_models.load_stamps(target)
 
-def main():
-    # Create models directory
-    models_dir = Path(__file__).parent.parent / "public" / "models" / "whisper-tiny-en"
-    models_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Whisper tiny.en model files from Hugging Face
-    model_files = [
-        'config.json',
-        'generation_config.json',
-        'merges.txt',
-        'normalizer.json',
-        'preprocessor_config.json',
-        'tokenizer.json',
-        'tokenizer_config.json',
-        'vocab.json',
-        'onnx/decoder_model_merged.onnx',
-        'onnx/encoder_model.onnx'
-    ]
-    
-    base_url = 'https://huggingface.co/Xenova/whisper-tiny.en/resolve/main/'
-    
-    print('🚀 Starting Whisper model download...')
-    
-    for file in model_files:
-        url = base_url + file
-        filepath = models_dir / file
-        
-        try:
-            download_file(url, filepath)
-        except Exception as e:
-            print(f"❌ Failed to download {file}: {e}")
-            return 1
-    
-    print('🎉 All model files downloaded successfully!')
-    print(f'📁 Model location: {models_dir}')
-    
-    # Create a simple index file to verify the model is available
+    files = [item.path for item in items]
+    installed = {}
+    for item in items:
+        stamp = stamps.get(item.path)
+        if stamp:
+            installed[item.path] = {
+                'size': stamp['size'],
+                'mtime_ns': stamp['mtime_ns'],
+                'sha256': stamp['sha256'],
+                # What models.json pins, if anything
+                'expected': {'size': item.entry.get('size'), 'sha256': item.entry.get('sha256')}
+            }
+    # When the newest file was written, not when this script last ran
+    newest = max((entry['mtime_ns'] for entry in installed.values()), default=None)
+
+    hf = model['huggingface']
     index_data = {
         "model_name": "whisper-tiny.en",
-        "files": model_files,
-        "downloaded_at": "2025-01-08"
+        "repo": hf['repo'],
+        "revision": hf.get('revision', 'main'),
+        "files": files,
+        "downloaded_at": newest and datetime.fromtimestamp(newest / 1e9, timezone.utc).isoformat(timespec='seconds'),
+        "manifest": installed
     }
-    
-    with open(models_dir / "index.json", 'w') as f:
+
+    index_path = target / 'index.json'
+    tmp_index = target / 'index.json.tmp'
+    with open(tmp_index, 'w') as f:
         json.dump(index_data, f, indent=2)
-    
-    return 0
+    os.replace(tmp_index, index_path)
+    return index_path
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--manifest', type=Path, default=provision_models.MANIFEST_PATH)
+    parser.add_argument('--root', type=Path, default=REPO_ROOT)
+    parser.add_argument('--verify-only', action='store_true')
+    args, _ = parser.parse_known_args(argv)
+
+    code = provision_models.main([MODEL, '--root', str(REPO_ROOT)] + argv)
+    if not args.verify_only:
+        # Written even after failures, so it lists what did get installed
+        write_index(args.manifest, args.root)
+    return code
+
 
 if __name__ == "__main__":
-    exit(main())
\ No newline at end of file
+    sys.exit(main())
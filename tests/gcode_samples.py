@@ -0,0 +1,57 @@
+"""Synthetic sliced G-code and protocol settings shared by the G-code rewrite tests."""
+import itertools
+import random
+
+import numpy as np
+
+INKS = ('Alginate', 'Collagen', 'Gelatin')
+PRINTHEADS = ('Printhead 1', 'Printhead 2', 'Printhead 3')
+
+PRESETS = {
+    printhead: {'temperature': 20 + i, 'extrusionRate': 90 + i, 'nozzleDiameter': 0.41, 'inkName': ink}
+    for i, (printhead, ink) in enumerate(zip(PRINTHEADS, INKS))
+}
+
+CALIBRATION = {
+    'extruder_1': [1.5, 2.25, -0.5],
+    'extruder_2': [-118.7, -1.1, -1.3],
+    'extruder_3': [-121.2, 0.4, 0.25],
+}
+
+SURFACES = ({'selectedSurface': 'Petri dish'}, {'selectedSurface': 'Well plate'}, {'selectedSurface': 'Glass slide'}, {})
+
+LAYER_HEIGHT = np.float64(0.3)
+
+
+def make_gcode(layers=12, seed=0, newline='\n', final_newline=True):
+    """A sliced-looking file: a header, then per layer ;LAYER_CHANGE, ;Z:, a G1 Z... F6000 move and extrusions"""
+    rng = random.Random(seed)
+    lines = ['; generated by PrusaSlicer 2.6.0', 'M82 ; absolute extrusion', 'G21', 'G90', 'G28']
+    for layer in range(layers):
+        z = round(0.3 * (layer + 1), 2)
+        lines += [';LAYER_CHANGE', f';Z:{z}', ';HEIGHT:0.3']
+        # Some layers start with a travel before the Z move, some have none at all
+        if rng.random() < 0.3:
+            lines.append(f'G1 X{rng.uniform(0, 50):.3f} Y{rng.uniform(0, 50):.3f} F9000')
+        if rng.random() < 0.9:
+            lines.append(f'G1 Z{z} F6000')
+        for _ in range(rng.randint(0, 6)):
+            lines.append(f'G1 X{rng.uniform(0, 50):.3f} Y{rng.uniform(0, 50):.3f} E{rng.uniform(0, 2):.5f}')
+        if rng.random() < 0.2:
+            lines.append(f'G1 Z{z + 0.4:.2f} F6000 ; lift')
+    lines.append('M84 ; disable motors')
+    text = newline.join(lines)
+    return text + newline if final_newline else text
+
+
+def groups_for(printheads, spans=((0, 1), (2, 4), (6, 8))):
+    """Layer groups printing spans[i] with the ink loaded in printheads[i]"""
+    return [
+        {'start': start, 'end': end, 'inkName': PRESETS[printhead]['inkName']}
+        for printhead, (start, end) in zip(printheads, spans)
+    ]
+
+
+def printhead_sequences(length=3):
+    """Every sequence of printheads of the given length, so every (from, to) extruder change occurs"""
+    return itertools.product(PRINTHEADS, repeat=length)
@@ -0,0 +1,41 @@
+"""
+Stand-in for the app.py that app_modifications.py is pasted into: the imports
+and globals the fragment expects, then the fragment itself. Being a real module,
+its functions can be pickled by name for the batch endpoint's process pool.
+"""
+import json
+import logging
+import os
+import sys
+import types
+
+import numpy as np
+from flask import Flask, jsonify, request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEGACY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'legacy_app_modifications.py')
+
+# gcode_index sits next to app_modifications.py
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def exec_fragment(path, namespace):
+    """Run the fragment at path in namespace, after the globals app.py gives it"""
+    namespace.update(
+        json=json, logging=logging, os=os, np=np, jsonify=jsonify, request=request,
+        app=Flask(namespace['__name__']), reference_coordinates={},
+    )
+    with open(path) as f:
+        exec(compile(f.read(), path, 'exec'), namespace)
+
+
+def load_fragment(path, name):
+    """The fragment at path as a module of its own"""
+    module = types.ModuleType(name)
+    module.__file__ = path
+    exec_fragment(path, vars(module))
+    return module
+
+
+exec_fragment(os.path.join(ROOT, 'app_modifications.py'), globals())
@@ -0,0 +1,218 @@
+"""
+Re-saving a protocol: insert_extruder_changes from the pristine copy, the
+derived.json checkpoints, and incremental output that must always equal a
+rewrite from scratch.
+"""
+import copy
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import protocol_app  # noqa: E402
+from gcode_index import load_index, rewrite_indexed  # noqa: E402
+from gcode_samples import CALIBRATION, INKS, LAYER_HEIGHT, PRESETS, SURFACES, groups_for, make_gcode  # noqa: E402
+
+LAYERS = 30
+
+
+def random_groups(rng, layers=LAYERS):
+    groups = []
+    layer = rng.randint(0, 3)
+    while layer < layers and len(groups) < 6:
+        end = min(layers - 1, layer + rng.randint(0, 5))
+        groups.append({'start': layer, 'end': end, 'inkName': rng.choice(INKS)})
+        layer = end + 1 + rng.randint(0, 3)
+    return groups
+
+
+def edit_groups(rng, groups, layers=LAYERS):
+    """groups with one random edit applied that still makes a valid protocol"""
+    while True:
+        edited = copy.deepcopy(groups)
+        op = rng.choice(('ink', 'start', 'end', 'drop', 'add', 'replace'))
+        if op == 'replace' or not edited:
+            edited = random_groups(rng, layers)
+        elif op == 'ink':
+            rng.choice(edited)['inkName'] = rng.choice(INKS)
+        elif op in ('start', 'end'):
+            rng.choice(edited)[op] += rng.choice((-3, -2, -1, 1, 2, 3))
+        elif op == 'drop':
+            edited.remove(rng.choice(edited))
+        else:
+            start = rng.randrange(layers)
+            edited.append({'start': start, 'end': min(layers - 1, start + rng.randint(0, 3)),
+                           'inkName': rng.choice(INKS)})
+        if not edited or edited == groups:
+            continue
+        try:
+            return protocol_app.ProtocolModel(edited, PRESETS).layer_groups
+        except protocol_app.InvalidProtocol:
+            continue
+
+
+class IncrementalRewriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        patcher = mock.patch.object(protocol_app, 'reference_coordinates', copy.deepcopy(CALIBRATION))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fed = 0
+        feed = protocol_app.ExtruderChangeRewriter.feed
+
+        def counting_feed(rewriter, line):
+            self.fed += 1
+            return feed(rewriter, line)
+
+        patcher = mock.patch.object(protocol_app.ExtruderChangeRewriter, 'feed', counting_feed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', newline='') as f:
+            f.write(text)
+        return path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def save(self, path, groups, build_plate=SURFACES[0], infill=20):
+        self.fed = 0
+        protocol_app.insert_extruder_changes(
+            path, copy.deepcopy(groups), copy.deepcopy(PRESETS), LAYER_HEIGHT, dict(build_plate), infill
+        )
+        return self.read(path)
+
+    def from_scratch(self, gcode, groups, **settings):
+        path = self.write(f'scratch{random.random()}.gcode', gcode)
+        return self.save(path, groups, **settings)
+
+    def derived_state(self, path):
+        with open(protocol_app.derived_state_path_for(path)) as f:
+            return json.load(f)
+
+    def assert_checkpoints_valid(self, path, groups):
+        """Every layer has a checkpoint, and resuming at any of them reproduces the rest of the output"""
+        state = self.derived_state(path)
+        pristine = protocol_app.pristine_path_for(path)
+        index = load_index(pristine)
+        output = self.read(path)
+        self.assertEqual([checkpoint[0] for checkpoint in state['checkpoints']],
+                         [layer['offset'] for layer in index['layers']])
+        self.assertEqual(state['output'], protocol_app.file_stamp(path))
+        self.assertEqual(state['pristine'], protocol_app.file_stamp(pristine))
+        for input_offset, output_offset, rewriter_state in state['checkpoints']:
+            rewriter = protocol_app.ExtruderChangeRewriter(
+                protocol_app.ProtocolModel(groups, PRESETS), LAYER_HEIGHT, SURFACES[0], 20
+            )
+            rewriter.restore(rewriter_state)
+            dst = io.BytesIO()
+            rewrite_indexed(pristine, dst, index, rewriter, start=input_offset)
+            self.assertEqual(dst.getvalue(), output[output_offset:])
+
+    def test_edit_sequences_match_a_rewrite_from_scratch(self):
+        for seed in range(8):
+            rng = random.Random(seed)
+            gcode = make_gcode(layers=LAYERS, seed=seed)
+            path = self.write(f'part{seed}.gcode', gcode)
+            groups = protocol_app.ProtocolModel(random_groups(rng), PRESETS).layer_groups
+            for step in range(10):
+                with self.subTest(seed=seed, step=step, groups=groups):
+                    self.assertEqual(self.save(path, groups), self.from_scratch(gcode, groups))
+                    self.assertEqual(self.derived_state(path)['layer_groups'], groups)
+                    self.assert_checkpoints_valid(path, groups)
+                groups = edit_groups(rng, groups)
+            self.assertEqual(self.read(protocol_app.pristine_path_for(path)), gcode.encode())
+
+    def test_saving_the_same_protocol_again_is_a_no_op(self):
+        path = self.write('part.gcode', make_gcode(layers=LAYERS))
+        groups = groups_for(('Printhead 1', 'Printhead 3', 'Printhead 2'))
+        output = self.save(path, groups)
+        stamp = protocol_app.file_stamp(path)
+
+        self.assertEqual(self.save(path, groups), output)
+        self.assertEqual(self.fed, 0)
+        self.assertEqual(protocol_app.file_stamp(path), stamp)
+
+    def test_a_late_edit_only_rewrites_the_layers_after_it(self):
+        gcode = make_gcode(layers=LAYERS, seed=11)
+        path = self.write('part.gcode', gcode)
+        groups = [{'start': 2, 'end': 5, 'inkName': 'Alginate'}, {'start': 20, 'end': 24, 'inkName': 'Collagen'}]
+        self.save(path, groups)
+        fresh = self.fed
+
+        groups[1]['end'] = 26
+        output = self.save(path, groups)
+        self.assertLess(self.fed * 3, fresh)
+        self.assertEqual(output, self.from_scratch(gcode, groups))
+
+    def test_a_settings_change_rewrites_everything(self):
+        gcode = make_gcode(layers=LAYERS, seed=12)
+        path = self.write('part.gcode', gcode)
+        groups = groups_for(('Printhead 2', 'Printhead 1'))
+        self.save(path, groups)
+        for settings in ({'infill': 0}, {'build_plate': SURFACES[1]}):
+            with self.subTest(settings=settings):
+                self.assertEqual(self.save(path, groups, **settings), self.from_scratch(gcode, groups, **settings))
+                self.assertGreater(self.fed, 0)
+
+    def test_a_new_slice_replaces_the_pristine_copy(self):
+        path = self.write('part.gcode', make_gcode(layers=LAYERS, seed=13))
+        groups = groups_for(('Printhead 1', 'Printhead 2'))
+        self.save(path, groups)
+
+        sliced_again = make_gcode(layers=LAYERS, seed=14)
+        self.write('part.gcode', sliced_again)
+        self.assertEqual(self.save(path, groups), self.from_scratch(sliced_again, groups))
+        self.assertEqual(self.read(protocol_app.pristine_path_for(path)), sliced_again.encode())
+
+    def test_output_edited_elsewhere_is_redone_from_the_pristine_copy(self):
+        gcode = make_gcode(layers=LAYERS, seed=15)
+        path = self.write('part.gcode', gcode)
+        groups = groups_for(('Printhead 3', 'Printhead 1'))
+        output = self.save(path, groups)
+
+        with open(path, 'ab') as f:
+            f.write(b'; edited by hand\n')
+        self.assertEqual(self.save(path, groups), output)
+        self.assert_checkpoints_valid(path, groups)
+
+    def test_processed_file_without_pristine_copy_is_refused(self):
+        path = self.write('part.gcode', make_gcode(layers=LAYERS, seed=16))
+        groups = groups_for(('Printhead 1', 'Printhead 2'))
+        self.save(path, groups)
+        os.remove(protocol_app.pristine_path_for(path))
+        os.remove(protocol_app.derived_state_path_for(path))
+        output = self.read(path)
+
+        with self.assertRaises(protocol_app.GcodeAlreadyProcessed):
+            self.save(path, groups)
+        self.assertEqual(self.read(path), output)
+
+    def test_crlf_input_is_rewritten_line_by_line(self):
+        gcode = make_gcode(layers=LAYERS, seed=17, newline='\r\n')
+        path = self.write('part.gcode', gcode)
+        groups = groups_for(('Printhead 2', 'Printhead 3'))
+        output = self.save(path, groups)
+
+        self.assertNotIn(b'\r', output)
+        self.assertEqual(self.derived_state(path)['checkpoints'], [])
+        self.assertEqual(self.save(path, groups), output)
+        self.assertEqual(self.fed, 0)
+
+        groups[1]['end'] += 2
+        self.assertEqual(self.save(path, groups), self.from_scratch(gcode, groups))
+
+
+if __name__ == '__main__':
+    unittest.main()
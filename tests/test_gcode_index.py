@@ -0,0 +1,172 @@
+"""gcode_index: the layer/trigger scan, its sidecar, and rewrite_indexed against a line-by-line rewrite."""
+import copy
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import protocol_app  # noqa: E402
+from gcode_index import index_path_for, load_index, rewrite_indexed, scan_gcode  # noqa: E402
+from gcode_samples import LAYER_HEIGHT, PRESETS, SURFACES, groups_for, make_gcode  # noqa: E402
+
+GROUPS = groups_for(('Printhead 2', 'Printhead 1', 'Printhead 3'))
+
+
+def rewriter(infill=20, groups=GROUPS):
+    protocol = protocol_app.ProtocolModel(copy.deepcopy(groups), copy.deepcopy(PRESETS))
+    return protocol_app.ExtruderChangeRewriter(protocol, LAYER_HEIGHT, SURFACES[0], infill)
+
+
+def rewrite_every_line(path, machine):
+    """The reference: every line through feed(), line endings kept as they are"""
+    out = []
+    with open(path, 'rb') as f:
+        for line in f:
+            out.extend(machine.feed(line.decode()))
+    out.extend(machine.finish())
+    return ''.join(out).encode()
+
+
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_offsets_point_at_layer_and_trigger_lines(self):
+        for newline in ('\n', '\r\n'):
+            with self.subTest(newline=repr(newline)):
+                data = make_gcode(seed=1, newline=newline).encode()
+                index = scan_gcode(self.write('part.gcode', data))
+                lines = data.splitlines(keepends=True)
+                starts = [sum(len(line) for line in lines[:i]) for i in range(len(lines))]
+                expected_layers = [start for start, line in zip(starts, lines) if line.startswith(b';LAYER_CHANGE')]
+                expected_triggers = [start for start, line in zip(starts, lines)
+                                     if line.startswith(b'G1 Z') and b'F6000' in line]
+
+                self.assertEqual([layer['offset'] for layer in index['layers']], expected_layers)
+                self.assertEqual([layer['z'] for layer in index['layers']][:3], [0.3, 0.6, 0.9])
+                self.assertEqual(index['triggers'], expected_triggers)
+                self.assertEqual(index['has_cr'], newline == '\r\n')
+                self.assertFalse(index['group_markers'])
+
+    def test_empty_file(self):
+        index = scan_gcode(self.write('empty.gcode', b''))
+        self.assertEqual((index['layers'], index['triggers'], index['size']), ([], [], 0))
+
+    def test_group_markers_are_noticed(self):
+        path = self.write('done.gcode', b';LAYER_CHANGE\n;GROUP_START INK=Alginate\nG1 Z0.3 F6000\n')
+        self.assertTrue(scan_gcode(path)['group_markers'])
+
+    def test_sidecar_is_reused_until_the_file_changes(self):
+        path = self.write('part.gcode', make_gcode(seed=2).encode())
+        index = load_index(path)
+        with open(index_path_for(path)) as f:
+            self.assertEqual(json.load(f), index)
+
+        # A sidecar that still matches the file's size and mtime is trusted as it is
+        with open(index_path_for(path), 'w') as f:
+            json.dump(dict(index, triggers=[]), f)
+        self.assertEqual(load_index(path)['triggers'], [])
+
+        with open(path, 'ab') as f:
+            f.write(b';LAYER_CHANGE\n;Z:9.9\nG1 Z9.9 F6000\n')
+        index = load_index(path)
+        self.assertEqual(index['layers'][-1]['z'], 9.9)
+        self.assertEqual(len(index['triggers']), len(scan_gcode(path)['triggers']))
+
+
+class RewriteIndexedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', newline='') as f:
+            f.write(text)
+        return path
+
+    def test_matches_a_line_by_line_rewrite(self):
+        case = 0
+        for newline in ('\n', '\r\n'):
+            for final_newline in (True, False):
+                for infill in (0, 20):
+                    case += 1
+                    path = self.write(f'case{case}.gcode', make_gcode(seed=case, newline=newline,
+                                                                      final_newline=final_newline))
+                    with self.subTest(newline=repr(newline), final_newline=final_newline, infill=infill):
+                        dst = io.BytesIO()
+                        self.assertIsNone(rewrite_indexed(path, dst, load_index(path), rewriter(infill)))
+                        self.assertEqual(dst.getvalue(), rewrite_every_line(path, rewriter(infill)))
+
+    def test_crlf_lines_are_copied_and_fed_with_their_endings(self):
+        path = self.write('crlf.gcode', make_gcode(seed=4, newline='\r\n'))
+        dst = io.BytesIO()
+        rewrite_indexed(path, dst, load_index(path), rewriter())
+        output = dst.getvalue()
+        with open(path, 'rb') as f:
+            for line in f:
+                self.assertIn(line, output)
+        self.assertIn(b';GROUP_START INK=Collagen', output)
+
+    def test_on_layer_stop(self):
+        path = self.write('part.gcode', make_gcode(seed=6))
+        index = load_index(path)
+        full = rewrite_every_line(path, rewriter())
+        stop_at = index['layers'][5]['offset']
+        calls = []
+        dst = io.BytesIO()
+
+        def on_layer(input_offset, output_offset):
+            calls.append((input_offset, output_offset, dst.tell()))
+            return input_offset == stop_at
+
+        self.assertEqual(rewrite_indexed(path, dst, index, rewriter(), on_layer=on_layer), stop_at)
+        self.assertEqual([call[0] for call in calls], [layer['offset'] for layer in index['layers'][:6]])
+        for _, output_offset, written in calls:
+            self.assertEqual(output_offset, written)
+
+        # Everything before the stop is written, the ;LAYER_CHANGE line it stopped at is not
+        with open(path, 'rb') as f:
+            head = f.read(stop_at)
+        prefix_machine = rewriter()
+        expected = ''.join(out for line in head.splitlines(keepends=True)
+                           for out in prefix_machine.feed(line.decode())).encode()
+        self.assertEqual(dst.getvalue(), expected)
+        self.assertTrue(full.startswith(expected))
+
+    def test_resume_from_a_layer(self):
+        path = self.write('part.gcode', make_gcode(seed=8))
+        index = load_index(path)
+        full = rewrite_every_line(path, rewriter())
+        snapshots = {}
+        first = rewriter()
+
+        def on_layer(input_offset, output_offset):
+            snapshots[input_offset] = (output_offset, first.snapshot())
+            return False
+
+        rewrite_indexed(path, io.BytesIO(), index, first, on_layer=on_layer)
+        for layer in index['layers']:
+            output_offset, state = snapshots[layer['offset']]
+            resumed = rewriter()
+            resumed.restore(json.loads(json.dumps(state)))
+            dst = io.BytesIO()
+            rewrite_indexed(path, dst, index, resumed, start=layer['offset'])
+            with self.subTest(layer=layer):
+                self.assertEqual(dst.getvalue(), full[output_offset:])
+
+
+if __name__ == '__main__':
+    unittest.main()
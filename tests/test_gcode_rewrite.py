@@ -0,0 +1,129 @@
+"""
+insert_extruder_changes against the implementation it replaced
+(fixtures/legacy_app_modifications.py): same bytes for every extruder change,
+surface, infill and line ending.
+"""
+import copy
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import protocol_app  # noqa: E402
+from gcode_samples import (  # noqa: E402
+    CALIBRATION, LAYER_HEIGHT, PRESETS, SURFACES, groups_for, make_gcode, printhead_sequences
+)
+
+legacy = protocol_app.load_fragment(protocol_app.LEGACY_PATH, 'legacy_app_modifications')
+
+
+class LegacyOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.calibrate(CALIBRATION)
+
+    def calibrate(self, calibration):
+        for module in (protocol_app, legacy):
+            patcher = mock.patch.object(module, 'reference_coordinates', copy.deepcopy(calibration))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, name, gcode):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', newline='') as f:
+            f.write(gcode)
+        return path
+
+    def rewrite_both(self, name, gcode, groups, build_plate, infill):
+        """(legacy output, new output) for the same input and settings; legacy errors propagate"""
+        legacy_path = self.write(f'{name}.legacy.gcode', gcode)
+        path = self.write(f'{name}.gcode', gcode)
+        legacy.insert_extruder_changes(
+            legacy_path, copy.deepcopy(groups), copy.deepcopy(PRESETS), LAYER_HEIGHT, dict(build_plate), infill
+        )
+        protocol_app.insert_extruder_changes(
+            path, copy.deepcopy(groups), copy.deepcopy(PRESETS), LAYER_HEIGHT, dict(build_plate), infill
+        )
+        with open(legacy_path, 'rb') as f, open(path, 'rb') as g:
+            return f.read(), g.read()
+
+    def test_every_extruder_change_matches_legacy(self):
+        case = 0
+        for printheads in printhead_sequences():
+            for surface_index, build_plate in enumerate(SURFACES):
+                for infill in (0, 20):
+                    for newline in ('\n', '\r\n'):
+                        case += 1
+                        gcode = make_gcode(seed=case, newline=newline, final_newline=case % 3 != 0)
+                        with self.subTest(printheads=printheads, build_plate=build_plate, infill=infill,
+                                          newline=repr(newline)):
+                            expected, actual = self.rewrite_both(
+                                f'case{case}', gcode, groups_for(printheads), build_plate, infill
+                            )
+                            self.assertEqual(actual, expected)
+
+    def test_matches_legacy_without_calibration(self):
+        self.calibrate({})
+        compared = 0
+        for case, printheads in enumerate(printhead_sequences()):
+            gcode = make_gcode(seed=case)
+            try:
+                expected, actual = self.rewrite_both(
+                    f'case{case}', gcode, groups_for(printheads), SURFACES[0], 20
+                )
+            except TypeError:
+                # The legacy 3->2 reverse move needed Extruder 1's calibration; the new one falls back
+                continue
+            compared += 1
+            with self.subTest(printheads=printheads):
+                self.assertEqual(actual, expected)
+        self.assertGreater(compared, 0)
+
+    def test_adjacent_and_single_layer_groups_match_legacy(self):
+        spans = ((0, 0), (1, 1), (2, 10))
+        for printheads in (('Printhead 1', 'Printhead 3', 'Printhead 2'), ('Printhead 3', 'Printhead 2', 'Printhead 1')):
+            groups = groups_for(printheads, spans)
+            with self.subTest(printheads=printheads):
+                expected, actual = self.rewrite_both('adjacent', make_gcode(seed=7), groups, SURFACES[0], 0)
+                self.assertEqual(actual, expected)
+
+    def test_extruder_change_lines_matches_legacy(self):
+        gcode = make_gcode(seed=3)
+        groups = groups_for(('Printhead 2', 'Printhead 3', 'Printhead 1'))
+        expected, _ = self.rewrite_both('lines', gcode, groups, SURFACES[0], 20)
+        lines = protocol_app.extruder_change_lines(
+            iter(gcode.splitlines(keepends=True)), groups, copy.deepcopy(PRESETS), LAYER_HEIGHT, SURFACES[0], 20
+        )
+        self.assertEqual(''.join(lines).encode(), expected)
+
+    def test_failure_midway_leaves_the_file_untouched(self):
+        gcode = make_gcode(seed=5)
+        path = self.write('broken.gcode', gcode)
+        feed = protocol_app.ExtruderChangeRewriter.feed
+        calls = []
+
+        def failing_feed(rewriter, line):
+            calls.append(line)
+            if len(calls) > 10:
+                raise OSError('disk full')
+            return feed(rewriter, line)
+
+        with mock.patch.object(protocol_app.ExtruderChangeRewriter, 'feed', failing_feed):
+            with self.assertRaises(OSError):
+                protocol_app.insert_extruder_changes(
+                    path, groups_for(('Printhead 1', 'Printhead 2')), copy.deepcopy(PRESETS),
+                    LAYER_HEIGHT, SURFACES[0], 20
+                )
+        with open(path) as f:
+            self.assertEqual(f.read(), gcode)
+        self.assertEqual(glob.glob(os.path.join(self.tmp, '*.tmp')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""/save-protocol1-batch: per-protocol statuses, with the rewrites running in spawned pool workers."""
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import protocol_app  # noqa: E402
+from gcode_samples import CALIBRATION, PRESETS, make_gcode  # noqa: E402
+
+SLICING_SETTINGS = {'layerHeight': 0.3, 'buildPlate': {'selectedSurface': 'Petri dish'}, 'infillPercentage': 20}
+
+
+class ProtocolBatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.workers = mock.patch.object(protocol_app, 'PROTOCOL_WORKERS', 2)
+        cls.workers.start()
+        cls.client = protocol_app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        if protocol_app._protocol_pool is not None:
+            protocol_app.discard_protocol_pool(protocol_app._protocol_pool)
+        cls.workers.stop()
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.addCleanup(os.chdir, cwd)
+        patcher = mock.patch.object(protocol_app, 'reference_coordinates', copy.deepcopy(CALIBRATION))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def gcode(self, name, seed=0):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(make_gcode(seed=seed))
+        return path
+
+    def payload(self, name, gcode_file_path, groups):
+        return {
+            'protocol_name': name,
+            'layerGroups': groups,
+            'gcode_file_path': gcode_file_path,
+            'printhead_presets': copy.deepcopy(PRESETS),
+            'slicing_settings': copy.deepcopy(SLICING_SETTINGS),
+        }
+
+    def expected_output(self, seed, groups):
+        """What /save-protocol1 writes for the same protocol, in this process"""
+        path = self.gcode(f'expected{seed}.gcode', seed)
+        protocol_app.insert_extruder_changes(
+            path, copy.deepcopy(groups), copy.deepcopy(PRESETS), protocol_app.np.float64(0.3),
+            SLICING_SETTINGS['buildPlate'], SLICING_SETTINGS['infillPercentage']
+        )
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def post(self, payloads):
+        response = self.client.post('/save-protocol1-batch', json={'protocols': payloads})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_each_protocol_gets_its_own_status(self):
+        groups = [{'start': 0, 'end': 2, 'inkName': 'Alginate'}, {'start': 4, 'end': 6, 'inkName': 'Gelatin'}]
+        saved = self.gcode('saved.gcode', seed=1)
+        processed = self.gcode('processed.gcode', seed=2)
+        protocol_app.insert_extruder_changes(processed, copy.deepcopy(groups), copy.deepcopy(PRESETS), 0.3, {}, 20)
+        os.remove(protocol_app.pristine_path_for(processed))
+        os.remove(protocol_app.derived_state_path_for(processed))
+
+        body = self.post([
+            self.payload('saved', saved, groups),
+            self.payload('bad ink', saved, [{'start': 0, 'end': 2, 'inkName': 'Agarose'}]),
+            'not a payload',
+            self.payload('', saved, groups),
+            self.payload('conflict', processed, groups),
+            self.payload('missing', os.path.join(self.tmp, 'missing.gcode'), groups),
+        ])
+
+        statuses = [(result['protocol_name'], result['status']) for result in body['results']]
+        self.assertEqual(statuses, [
+            ('saved', 'saved'),
+            ('bad ink', 'invalid'),
+            (None, 'invalid'),
+            ('', 'invalid'),
+            ('conflict', 'conflict'),
+            ('missing', 'failed'),
+        ])
+        self.assertEqual((body['saved'], body['failed']), (1, 5))
+        for result in body['results'][1:]:
+            self.assertTrue(result['error'])
+        self.assertIn('Agarose', body['results'][1]['error'])
+        self.assertIsNone(body['results'][0]['error'])
+
+        with open(saved, 'rb') as f:
+            self.assertEqual(f.read(), self.expected_output(1, groups))
+        self.assertEqual(sorted(os.listdir('saved_protocols')), ['conflict.json', 'missing.json', 'saved.json'])
+
+    def test_saves_of_one_file_keep_their_order(self):
+        path = self.gcode('part.gcode', seed=3)
+        first = [{'start': 0, 'end': 2, 'inkName': 'Collagen'}, {'start': 3, 'end': 5, 'inkName': 'Alginate'}]
+        last = [{'start': 1, 'end': 3, 'inkName': 'Gelatin'}, {'start': 6, 'end': 8, 'inkName': 'Collagen'}]
+        other = self.gcode('other.gcode', seed=4)
+
+        body = self.post([
+            self.payload('first', path, first),
+            self.payload('other', other, first),
+            self.payload('last', path, last),
+        ])
+
+        self.assertEqual([result['status'] for result in body['results']], ['saved'] * 3)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.expected_output(3, last))
+        with open(other, 'rb') as f:
+            self.assertEqual(f.read(), self.expected_output(4, first))
+
+    def test_a_dead_worker_fails_only_its_protocols(self):
+        path = self.gcode('part.gcode')
+        groups = [{'start': 0, 'end': 2, 'inkName': 'Collagen'}]
+        broken = protocol_app.BrokenProcessPool('worker killed')
+        with mock.patch.object(protocol_app, 'submit_rewrites', side_effect=lambda rewrites: (
+                protocol_app.protocol_pool(), mock.Mock(result=mock.Mock(side_effect=broken)))):
+            body = self.post([self.payload('a', path, groups), {'protocol_name': 'b'}])
+        self.assertEqual([result['status'] for result in body['results']], ['failed', 'invalid'])
+        self.assertIn('Worker process died', body['results'][0]['error'])
+
+        # The broken pool was dropped and the next batch gets a fresh one
+        body = self.post([self.payload('a', path, groups)])
+        self.assertEqual(body['results'][0]['status'], 'saved')
+
+    def test_missing_batch(self):
+        for data in ({}, {'protocols': []}, {'protocols': 'scaffold'}, ['scaffold']):
+            with self.subTest(data=data):
+                response = self.client.post('/save-protocol1-batch', json=data)
+                self.assertEqual(response.status_code, 400)
+
+    def test_pool_workers_are_spawned(self):
+        pool = protocol_app.protocol_pool()
+        self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""ProtocolModel: the ink index, group ordering, and what it rejects before any file is touched."""
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import protocol_app  # noqa: E402
+from gcode_samples import PRESETS, make_gcode  # noqa: E402
+
+ProtocolModel = protocol_app.ProtocolModel
+InvalidProtocol = protocol_app.InvalidProtocol
+
+
+def presets(**changes):
+    result = copy.deepcopy(PRESETS)
+    result.update(changes)
+    return result
+
+
+class ProtocolModelTest(unittest.TestCase):
+    def test_ink_index_and_sorted_groups(self):
+        groups = [
+            {'start': 6, 'end': 8, 'inkName': 'Alginate', 'color': '#fff'},
+            {'start': 0, 'end': 2, 'inkName': 'Gelatin'},
+            {'start': 3, 'end': 3, 'inkName': 'Collagen'},
+        ]
+        protocol = ProtocolModel(groups, PRESETS)
+        self.assertEqual(protocol.ink_index, {
+            'Alginate': ('Printhead 1', 0, PRESETS['Printhead 1']),
+            'Collagen': ('Printhead 2', 1, PRESETS['Printhead 2']),
+            'Gelatin': ('Printhead 3', 2, PRESETS['Printhead 3']),
+        })
+        self.assertEqual(protocol.layer_groups, [
+            {'start': 0, 'end': 2, 'inkName': 'Gelatin'},
+            {'start': 3, 'end': 3, 'inkName': 'Collagen'},
+            {'start': 6, 'end': 8, 'inkName': 'Alginate'},
+        ])
+
+    def test_empty_printheads_are_skipped(self):
+        empty = {'temperature': None, 'extrusionRate': None, 'nozzleDiameter': None, 'inkName': None}
+        protocol = ProtocolModel([{'start': 0, 'end': 1, 'inkName': 'Collagen'}],
+                                 presets(**{'Printhead 1': empty, 'Printhead 3': None}))
+        self.assertEqual(list(protocol.ink_index), ['Collagen'])
+
+    def test_rejected(self):
+        group = {'start': 0, 'end': 1, 'inkName': 'Alginate'}
+        cases = {
+            'duplicate ink': ([group], presets(**{'Printhead 2': dict(PRESETS['Printhead 1'])})),
+            'unknown printhead': ([group], presets(**{'Printhead 4': {'inkName': 'Agarose'}})),
+            'ink not loaded': ([dict(group, inkName='Agarose')], PRESETS),
+            'missing ink': ([{'start': 0, 'end': 1}], PRESETS),
+            'start after end': ([dict(group, start=3, end=2)], PRESETS),
+            'negative layer': ([dict(group, start=-1)], PRESETS),
+            'string layer': ([dict(group, end='4')], PRESETS),
+            'float layer': ([dict(group, end=4.0)], PRESETS),
+            'bool layer': ([dict(group, start=True)], PRESETS),
+            'missing layer': ([{'inkName': 'Alginate', 'start': 0}], PRESETS),
+            'overlap': ([group, {'start': 1, 'end': 4, 'inkName': 'Collagen'}], PRESETS),
+            'overlap out of order': ([{'start': 5, 'end': 9, 'inkName': 'Collagen'},
+                                      {'start': 2, 'end': 5, 'inkName': 'Gelatin'}], PRESETS),
+        }
+        for name, (groups, printhead_presets) in cases.items():
+            with self.subTest(name):
+                with self.assertRaises(InvalidProtocol):
+                    ProtocolModel(groups, printhead_presets)
+
+
+class SaveProtocolDataTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.addCleanup(os.chdir, cwd)
+
+    def payload(self, **changes):
+        path = os.path.join(self.tmp, 'part.gcode')
+        with open(path, 'w') as f:
+            f.write(make_gcode())
+        payload = {
+            'protocol_name': 'scaffold',
+            'layerGroups': [{'start': 0, 'end': 2, 'inkName': 'Collagen'}],
+            'gcode_file_path': path,
+            'printhead_presets': copy.deepcopy(PRESETS),
+            'slicing_settings': {'layerHeight': 0.3, 'buildPlate': {'selectedSurface': 'Well plate'},
+                                 'infillPercentage': 20},
+        }
+        payload.update(changes)
+        return payload
+
+    def test_invalid_protocol_is_not_written(self):
+        with self.assertRaises(InvalidProtocol):
+            protocol_app.save_protocol_data(self.payload(layerGroups=[{'start': 0, 'end': 2, 'inkName': 'Agarose'}]))
+        self.assertFalse(os.path.exists(os.path.join('saved_protocols', 'scaffold.json')))
+
+    def test_valid_protocol_is_written_with_its_model(self):
+        rewrite = protocol_app.save_protocol_data(self.payload())
+        self.assertTrue(os.path.exists(os.path.join('saved_protocols', 'scaffold.json')))
+        self.assertEqual(rewrite['protocol'].layer_groups, [{'start': 0, 'end': 2, 'inkName': 'Collagen'}])
+        self.assertEqual(rewrite['build_plate'], {'selectedSurface': 'Well plate'})
+
+    def test_route_answers_400_for_an_invalid_protocol(self):
+        client = protocol_app.app.test_client()
+        response = client.post('/save-protocol1', json=self.payload(
+            printhead_presets=presets(**{'Printhead 2': dict(PRESETS['Printhead 1'])})
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Alginate', response.get_json()['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
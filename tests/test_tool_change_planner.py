@@ -0,0 +1,87 @@
+"""ToolChangePlanner's precompiled blocks against the legacy build_* functions."""
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import protocol_app  # noqa: E402
+from gcode_samples import CALIBRATION, PRESETS  # noqa: E402
+
+legacy = protocol_app.load_fragment(protocol_app.LEGACY_PATH, 'legacy_app_modifications')
+
+POSITIONS = tuple(
+    {extruder: CALIBRATION[f'extruder_{extruder + 1}'][axis] for extruder in range(3)}
+    for axis in range(3)
+)
+Z_POSITIONS = (np.float64(0.3) * 4, 0.7, 2.1, 12.25)
+
+
+def legacy_block(from_extruder, to_extruder, z_position, selected_surface, petri_dish):
+    """The block insert_extruder_changes built before the planner, branch for branch"""
+    positions = POSITIONS
+    if from_extruder < to_extruder:
+        if to_extruder - from_extruder == 1:
+            commands = legacy.build_forward_command(
+                from_extruder, to_extruder, *positions, z_position, PRESETS, selected_surface
+            )
+        else:
+            commands = []
+            for step in range(from_extruder, to_extruder):
+                commands.extend(legacy.build_chain_move(step, step + 1, *positions, z_position, selected_surface))
+    elif to_extruder == 0:
+        commands = legacy.build_reverse_command(0, *positions, z_position, selected_surface)
+    elif to_extruder == 1:
+        commands = legacy.reverse_move_from_3_to_2_modified(
+            CALIBRATION['extruder_1'], positions[0][1], *positions, z_position, selected_surface
+        )
+    else:
+        commands = list(legacy.build_reverse_command(0, *positions, z_position, selected_surface))
+        for step in range(0, to_extruder):
+            commands.extend(legacy.build_forward_command(
+                step, step + 1, *positions, z_position, PRESETS, selected_surface
+            ))
+    if petri_dish:
+        commands.append(f'G1 Z{z_position:.2f} F600\n')
+    return ''.join(commands)
+
+
+class ToolChangePlannerTest(unittest.TestCase):
+    def test_every_block_matches_the_legacy_builders(self):
+        for selected_surface in ('Petri dish', 'Well plate', 'Glass slide'):
+            for petri_dish in (True, False):
+                planner = protocol_app.ToolChangePlanner(*POSITIONS, selected_surface, petri_dish)
+                self.assertEqual(set(planner.transitions), {(f, t) for f in range(3) for t in range(3)})
+                for (from_extruder, to_extruder) in planner.transitions:
+                    for z_position in Z_POSITIONS:
+                        with self.subTest(surface=selected_surface, petri_dish=petri_dish,
+                                          change=(from_extruder, to_extruder), z=z_position):
+                            self.assertEqual(
+                                planner.render(from_extruder, to_extruder, z_position),
+                                legacy_block(from_extruder, to_extruder, z_position, selected_surface, petri_dish)
+                            )
+
+    def test_petri_dish_lowers_the_nozzle_back_to_the_layer(self):
+        on_dish = protocol_app.ToolChangePlanner(*POSITIONS, 'Petri dish', True)
+        elsewhere = protocol_app.ToolChangePlanner(*POSITIONS, 'Petri dish', False)
+        block = on_dish.render(0, 1, 1.234)
+        self.assertTrue(block.endswith('G1 Z1.23 F600\n'))
+        self.assertEqual(block, elsewhere.render(0, 1, 1.234) + 'G1 Z1.23 F600\n')
+
+    def test_blocks_are_compiled_once(self):
+        planner = protocol_app.ToolChangePlanner(*POSITIONS, 'Well plate', False)
+        with mock.patch.object(protocol_app, 'forward_command_template') as forward, \
+                mock.patch.object(protocol_app, 'chain_move_template') as chain, \
+                mock.patch.object(protocol_app, 'reverse_command_template') as reverse:
+            for z_position in Z_POSITIONS:
+                planner.render(2, 1, z_position)
+                planner.render(0, 2, z_position)
+        for template in (forward, chain, reverse):
+            template.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()